@@ -1,12 +1,75 @@
+import importlib
+import os
+import threading
+import time
+
 from flask import Flask
 
 app = Flask(__name__)
 
+# Optional warm-up run before the task reports ready, as "module:function"
+# (preload caches, models, compile hot paths).
+WARMUP_HOOK = os.environ.get("WARMUP_HOOK", "")
+# Optional hook that drops a finished session's state before the task is
+# reused, as "module:function"
+RESET_HOOK = os.environ.get("RESET_HOOK", "")
+
+warm = threading.Event()
+warmup = {"seconds": None, "error": None}
+
+
+def load_hook(hook):
+    module_name, function_name = hook.split(":", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_warmup():
+    started = time.monotonic()
+    try:
+        if WARMUP_HOOK:
+            load_hook(WARMUP_HOOK)()
+    except Exception as error:
+        # A failed warm-up keeps the task unready; the pool replaces it
+        warmup["error"] = repr(error)
+        return
+    warmup["seconds"] = round(time.monotonic() - started, 3)
+    warm.set()
+
 
 @app.route("/")
 def hello():
     return {"message": "Hello from container!"}
 
 
+@app.route("/healthz")
+def healthz():
+    """Liveness: the server answers"""
+    return {"status": "ok"}
+
+
+@app.route("/ready")
+def ready():
+    """Readiness: warmed up and able to serve a user"""
+    if not warm.is_set():
+        return {"ready": False, "error": warmup["error"]}, 503
+    return {"ready": True, "warmup_seconds": warmup["seconds"]}
+
+
+@app.route("/reset", methods=["POST"])
+def reset():
+    """Called by the pool when a session is released, before the task is reused"""
+    if not warm.is_set():
+        return {"reset": False, "error": "Not ready"}, 503
+    started = time.monotonic()
+    try:
+        if RESET_HOOK:
+            load_hook(RESET_HOOK)()
+    except Exception as error:
+        # The pool retires a task it could not reset
+        return {"reset": False, "error": repr(error)}, 500
+    return {"reset": True, "seconds": round(time.monotonic() - started, 3)}
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=80)
+    threading.Thread(target=run_warmup, daemon=True).start()
+    app.run(host="0.0.0.0", port=80, threaded=True)
@@ -0,0 +1,230 @@
+"""Load test of the pool API: the Flask app against the asyncio server.
+
+Each server runs in a process of its own against the bench's in-memory
+DynamoDB, where every call takes its sampled latency in real time, and the
+same load is replayed against both: `--concurrency` clients sending
+`--requests` GET /monitor, then as many POST /grab-task for fresh users.
+Reported per server and route: requests/s, latency percentiles (ms), status
+codes, and the DynamoDB calls the server made to answer them.
+
+    python bench/api_load.py [--concurrency 64] [--requests 2000] [--latency-ms 5]
+                             [--only async] [--out results.json]
+
+Needs aiohttp (bench/requirements.txt).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import harness
+from harness import TABLE_NAME, percentiles
+
+SERVERS = ("flask", "async")
+ROUTES = ("monitor", "grab")
+READY_TIMEOUT_SECONDS = 30
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Server process
+
+
+def seed_pool(world, size):
+    """`size` RUNNING tasks and their counters, written without simulated latency"""
+    from fargate_pool import counters, keys
+
+    backend = world.tables[TABLE_NAME]
+    now = datetime.utcnow().isoformat()
+    for i in range(size):
+        backend.put(
+            keys.task_item(
+                uuid.UUID(int=world.rng.getrandbits(128)).hex,
+                "RUNNING",
+                PublicIp=f"203.0.{i // 250 % 250}.{i % 250 + 1}",
+                CapacityProvider="FARGATE",
+                CreatedAt=now,
+                UpdatedAt=now,
+            )
+        )
+    backend.put({**counters.COUNTER_KEY, "RUNNING": size})
+
+
+def serve(args):
+    """Run one API server on `args.port` until SIGTERM, then print the DynamoDB calls it made"""
+    import fakes
+
+    world = fakes.World(
+        random.Random(args.seed),
+        {
+            "api_latency_ms": {"default": {"dist": "lognormal", "median": args.latency_ms, "sigma": 0.3}},
+            "real_time_scale": 1.0,
+        },
+    )
+    world.create_table(TABLE_NAME, "PK", "SK", harness.TABLE_INDEXES)
+    seed_pool(world, args.pool)
+    os.environ.update(
+        {
+            "AWS_REGION": fakes.REGION,
+            "AWS_DEFAULT_REGION": fakes.REGION,
+            "DYNAMODB_TABLE_NAME": TABLE_NAME,
+            "CLUSTER_NAME": harness.CLUSTER_NAME,
+        }
+    )
+
+    with harness.stand_ins(world):
+        try:
+            if args.serve == "flask":
+                from werkzeug.serving import make_server
+
+                import app
+
+                # Like app.run(threaded=True), without the per-request access log
+                logging.getLogger("werkzeug").setLevel(logging.WARNING)
+                signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+                make_server("127.0.0.1", args.port, app.app, threaded=True).serve_forever()
+            else:
+                from aiohttp import web
+
+                import server
+
+                web.run_app(
+                    server.create_app(), host="127.0.0.1", port=args.port, access_log=None, print=None
+                )
+        finally:
+            print(json.dumps(dict(world.recorder.calls)), flush=True)
+
+
+# Load generator
+
+
+async def send(session, url, route, i):
+    if route == "monitor":
+        return await session.get(f"{url}/monitor")
+    return await session.post(f"{url}/grab-task", json={"user_id": f"load-user-{i}"})
+
+
+async def load(url, route, requests, concurrency):
+    import aiohttp
+
+    latencies, statuses = [], Counter()
+    next_request = iter(range(requests))
+
+    async def client(session):
+        for i in next_request:
+            started = time.perf_counter()
+            try:
+                async with await send(session, url, route, i) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def wait_ready(url, process):
+    import urllib.request
+
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/monitor", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server not ready within {READY_TIMEOUT_SECONDS} s")
+
+
+def run(server, route, args):
+    """Start `server`, send it the load of `route`, and stop it"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    pool = args.requests + 100 if route == "grab" else 100
+    command = [
+        sys.executable, os.path.abspath(__file__), "--serve", server, "--port", str(port),
+        "--pool", str(pool), "--latency-ms", str(args.latency_ms), "--seed", str(args.seed),
+    ]
+    with tempfile.TemporaryDirectory() as scratch:  # the servers write api.log to the working directory
+        process = subprocess.Popen(
+            command, cwd=scratch, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        try:
+            wait_ready(url, process)
+            result = asyncio.run(load(url, route, args.requests, args.concurrency))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            output, _ = process.communicate(timeout=30)
+
+    calls = json.loads(output.strip().splitlines()[-1]) if output.strip() else {}
+    # Includes the counter reads of the readiness check
+    result["dynamodb_calls"] = calls
+    return {"server": server, "route": route, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per route and server")
+    parser.add_argument("--latency-ms", type=float, default=5, help="Median DynamoDB call latency")
+    parser.add_argument("--only", choices=SERVERS, help="Load just one server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Also write the results to this JSON file")
+    parser.add_argument("--serve", choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--pool", type=int, default=100, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    results = []
+    for route in ROUTES:
+        for server in [args.only] if args.only else SERVERS:
+            result = run(server, route, args)
+            results.append(result)
+            latency = result["latency_ms"]
+            print(
+                f"{server:<6} {route:<8} {result['requests_per_second']:>8.1f} req/s  "
+                f"p50 {latency.get('p50', '-'):>7} ms  p99 {latency.get('p99', '-'):>7} ms  "
+                f"statuses {result['statuses']}  dynamodb {sum(result['dynamodb_calls'].values())} calls"
+            )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
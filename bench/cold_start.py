@@ -0,0 +1,155 @@
+"""Import time of every function, as a stand-in for its Lambda INIT duration.
+
+Each function module is imported in a fresh interpreter, the way the Lambda
+runtime does during INIT, and the import is timed. The clients the module
+holds are then forced into existence and timed separately, since clients
+created lazily move that cost into the first invocation that uses them.
+Nothing is sent to AWS.
+
+    python bench/cold_start.py [--runs 15] [--ref HEAD~1] [--only launch_task]
+
+With --ref, the functions and layer of that git revision are measured too,
+alternating with the work tree so machine noise hits both alike, and the
+change in import time is reported.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ENVIRONMENT = {
+    "AWS_REGION": "eu-west-1",
+    "AWS_DEFAULT_REGION": "eu-west-1",
+    "AWS_ACCESS_KEY_ID": "cold-start",
+    "AWS_SECRET_ACCESS_KEY": "cold-start",
+    "POWERTOOLS_SERVICE_NAME": "cold-start",
+    "POWERTOOLS_METRICS_NAMESPACE": "ColdStart",
+    "TABLE_NAME": "tasks",
+    "CLUSTER_NAME": "cluster",
+    "TASK_DEFINITION": "pool-task",
+    "EVENT_BUS_NAME": "bus",
+    "SUBNET_ID1": "subnet-00000001",
+    "SUBNET_ID2": "subnet-00000002",
+    "SECURITY_GROUP_ID": "sg-00000000",
+}
+
+# Runs in the fresh interpreter: argv is the function directory and the layer directory
+PROBE = """
+import importlib.util, json, sys, time
+function_dir, layer_dir = sys.argv[1:3]
+sys.path[:0] = [function_dir, layer_dir]
+
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("app", function_dir + "/app.py")
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+
+for value in list(vars(module).values()):
+    kind = type(value).__name__
+    if kind == "_LazyClient":
+        value.meta
+    elif kind == "Table" and hasattr(value, "client"):
+        value.client
+clients_ready = time.perf_counter()
+
+print(json.dumps({"import": imported - started, "clients": clients_ready - imported}))
+"""
+
+
+def functions(root):
+    functions_dir = os.path.join(root, "infra", "functions")
+    return sorted(
+        name
+        for name in os.listdir(functions_dir)
+        if os.path.exists(os.path.join(functions_dir, name, "app.py"))
+    )
+
+
+def sample(root, function):
+    """Import and client creation seconds of `function` in a fresh interpreter"""
+    command = [
+        sys.executable,
+        "-c",
+        PROBE,
+        os.path.join(root, "infra", "functions", function),
+        os.path.join(root, "infra", "layers", "common"),
+    ]
+    output = subprocess.run(
+        command,
+        env={**os.environ, **ENVIRONMENT, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median(samples):
+    return {
+        phase: statistics.median(sample[phase] for sample in samples)
+        for phase in ("import", "clients")
+    }
+
+
+def checkout(ref, directory):
+    """Extract the functions and layer of `ref` into `directory`"""
+    archive = subprocess.run(
+        ["git", "archive", ref, "infra/functions", "infra/layers"],
+        cwd=ROOT,
+        capture_output=True,
+        check=True,
+    ).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15, help="Interpreters per function")
+    parser.add_argument("--ref", help="Git revision to compare against")
+    parser.add_argument("--only", action="append", help="Function to measure (repeatable)")
+    args = parser.parse_args()
+
+    names = args.only or functions(ROOT)
+
+    baseline, current = {}, {}
+    with tempfile.TemporaryDirectory() as scratch:
+        if args.ref:
+            checkout(args.ref, scratch)
+        baseline_names = set(functions(scratch)) if args.ref else set()
+
+        for name in names:
+            samples = {"baseline": [], "current": []}
+            for _ in range(args.runs):
+                if name in baseline_names:
+                    samples["baseline"].append(sample(scratch, name))
+                samples["current"].append(sample(ROOT, name))
+            current[name] = median(samples["current"])
+            if samples["baseline"]:
+                baseline[name] = median(samples["baseline"])
+
+    header = f"{'function':<22}{'import ms':>11}{'clients ms':>12}"
+    if args.ref:
+        header += f"{args.ref + ' import':>20}{'clients':>10}{'import change':>15}"
+    print(header)
+    for name in names:
+        line = f"{name:<22}{current[name]['import'] * 1000:>11.1f}{current[name]['clients'] * 1000:>12.1f}"
+        if name in baseline:
+            change = current[name]["import"] / baseline[name]["import"] - 1
+            line += (
+                f"{baseline[name]['import'] * 1000:>20.1f}{baseline[name]['clients'] * 1000:>10.1f}"
+                f"{change:>+15.0%}"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
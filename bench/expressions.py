@@ -0,0 +1,292 @@
+"""A small evaluator for DynamoDB condition, key condition and update expressions.
+
+Covers the subset the pool code uses: comparisons, BETWEEN, IN,
+AND/OR/NOT, attribute_exists/attribute_not_exists/begins_with/contains/
+size, and SET (with +/-, if_not_exists, list_append), REMOVE, ADD and
+DELETE update clauses. Items are plain dicts of Python values.
+"""
+import re
+from decimal import Decimal
+
+TOKEN = re.compile(
+    r"\s*(?:(?P<op><>|<=|>=|=|<|>)|(?P<punct>[(),+\-\[\]])|(?P<name>#[A-Za-z0-9_]+)"
+    r"|(?P<value>:[A-Za-z0-9_]+)|(?P<word>[A-Za-z_][A-Za-z0-9_.]*))"
+)
+KEYWORDS = {"AND", "OR", "NOT", "BETWEEN", "IN", "SET", "REMOVE", "ADD", "DELETE"}
+MISSING = object()
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def tokenize(expression):
+    tokens, position = [], 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if not match or match.end() == position:
+            raise ExpressionError(f"Cannot parse expression at: {expression[position:]!r}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "word" and text.upper() in KEYWORDS:
+            kind, text = "keyword", text.upper()
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    def __init__(self, expression, names, values):
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, text=None):
+        token = self.peek()
+        if (kind and token[0] != kind) or (text and token[1] != text):
+            raise ExpressionError(f"Expected {text or kind}, got {token[1]!r}")
+        self.position += 1
+        return token
+
+    def accept(self, kind, text=None):
+        token = self.peek()
+        if token[0] == kind and (text is None or token[1] == text):
+            self.position += 1
+            return True
+        return False
+
+    def done(self):
+        return self.position >= len(self.tokens)
+
+    # Operands
+
+    def path(self):
+        kind, text = self.take()
+        if kind == "name":
+            if text not in self.names:
+                raise ExpressionError(f"Undefined attribute name {text}")
+            return self.names[text]
+        if kind == "word":
+            return text
+        raise ExpressionError(f"Expected an attribute, got {text!r}")
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == "value":
+            self.position += 1
+            if text not in self.values:
+                raise ExpressionError(f"Undefined attribute value {text}")
+            value = self.values[text]
+            return lambda item: value
+        if kind == "word" and text == "size" and self.peek(1) == ("punct", "("):
+            self.position += 2
+            attribute = self.path()
+            self.take("punct", ")")
+            return lambda item: _size(item.get(attribute, MISSING))
+        attribute = self.path()
+        return lambda item: item.get(attribute, MISSING)
+
+    # Conditions
+
+    def condition(self):
+        left = self.conjunction()
+        while self.accept("keyword", "OR"):
+            right = self.conjunction()
+            left = (lambda a, b: lambda item: a(item) or b(item))(left, right)
+        return left
+
+    def conjunction(self):
+        left = self.negation()
+        while self.accept("keyword", "AND"):
+            right = self.negation()
+            left = (lambda a, b: lambda item: a(item) and b(item))(left, right)
+        return left
+
+    def negation(self):
+        if self.accept("keyword", "NOT"):
+            inner = self.negation()
+            return lambda item: not inner(item)
+        return self.primary()
+
+    def primary(self):
+        if self.accept("punct", "("):
+            inner = self.condition()
+            self.take("punct", ")")
+            return inner
+
+        kind, text = self.peek()
+        if kind == "word" and self.peek(1) == ("punct", "(") and text != "size":
+            return self.function()
+
+        left = self.operand()
+        kind, text = self.peek()
+        if kind == "op":
+            self.position += 1
+            right = self.operand()
+            return lambda item: _compare(text, left(item), right(item))
+        if self.accept("keyword", "BETWEEN"):
+            low = self.operand()
+            self.take("keyword", "AND")
+            high = self.operand()
+            return lambda item: _compare(">=", left(item), low(item)) and _compare(
+                "<=", left(item), high(item)
+            )
+        if self.accept("keyword", "IN"):
+            self.take("punct", "(")
+            options = [self.operand()]
+            while self.accept("punct", ","):
+                options.append(self.operand())
+            self.take("punct", ")")
+            return lambda item: any(_compare("=", left(item), option(item)) for option in options)
+        raise ExpressionError(f"Unexpected token {text!r}")
+
+    def function(self):
+        _, function = self.take("word")
+        self.take("punct", "(")
+        if function in ("attribute_exists", "attribute_not_exists"):
+            attribute = self.path()
+            self.take("punct", ")")
+            exists = function == "attribute_exists"
+            return lambda item: (attribute in item) == exists
+        if function in ("begins_with", "contains"):
+            attribute = self.path()
+            self.take("punct", ",")
+            operand = self.operand()
+            self.take("punct", ")")
+            if function == "begins_with":
+                return lambda item: isinstance(item.get(attribute), str) and item[
+                    attribute
+                ].startswith(operand(item))
+            return lambda item: _contains(item.get(attribute, MISSING), operand(item))
+        raise ExpressionError(f"Unsupported function {function}")
+
+    # Updates
+
+    def update_value(self):
+        kind, text = self.peek()
+        if kind == "word" and text in ("if_not_exists", "list_append") and self.peek(1) == (
+            "punct",
+            "(",
+        ):
+            self.position += 2
+            if text == "if_not_exists":
+                attribute = self.path()
+                self.take("punct", ",")
+                default = self.update_value()
+                self.take("punct", ")")
+                value = lambda item: item[attribute] if attribute in item else default(item)
+            else:
+                first = self.update_value()
+                self.take("punct", ",")
+                second = self.update_value()
+                self.take("punct", ")")
+                value = lambda item: list(first(item)) + list(second(item))
+        else:
+            value = self.operand()
+
+        if self.accept("punct", "+"):
+            other = self.update_value()
+            return lambda item: _number(value(item)) + _number(other(item))
+        if self.accept("punct", "-"):
+            other = self.update_value()
+            return lambda item: _number(value(item)) - _number(other(item))
+        return value
+
+    def update(self):
+        actions = []
+        while not self.done():
+            _, clause = self.take("keyword")
+            while True:
+                attribute = self.path()
+                if clause == "SET":
+                    self.take("op", "=")
+                    actions.append(("SET", attribute, self.update_value()))
+                elif clause == "REMOVE":
+                    actions.append(("REMOVE", attribute, None))
+                elif clause in ("ADD", "DELETE"):
+                    actions.append((clause, attribute, self.operand()))
+                else:
+                    raise ExpressionError(f"Unsupported update clause {clause}")
+                if not self.accept("punct", ","):
+                    break
+        return actions
+
+
+def _number(value):
+    if value is MISSING:
+        raise ExpressionError("Arithmetic on a missing attribute")
+    return value
+
+
+def _size(value):
+    if value is MISSING:
+        return MISSING
+    return len(value)
+
+
+def _contains(container, value):
+    if container is MISSING:
+        return False
+    return value in container
+
+
+def _compare(operator, left, right):
+    if left is MISSING or right is MISSING:
+        return operator == "<>" and not (left is MISSING and right is MISSING)
+    if operator == "=":
+        return left == right
+    if operator == "<>":
+        return left != right
+    try:
+        if operator == "<":
+            return left < right
+        if operator == "<=":
+            return left <= right
+        if operator == ">":
+            return left > right
+        return left >= right
+    except TypeError:
+        return False
+
+
+def compile_condition(expression, names=None, values=None):
+    """Returns a predicate item -> bool"""
+    parser = Parser(expression, names, values)
+    predicate = parser.condition()
+    if not parser.done():
+        raise ExpressionError(f"Trailing tokens in condition: {expression!r}")
+    return predicate
+
+
+def apply_update(item, expression, names=None, values=None):
+    """Applies an update expression to a copy of `item` and returns it"""
+    actions = Parser(expression, names, values).update()
+    updated = dict(item)
+    # All values are computed against the item as it was before the update
+    resolved = [
+        (clause, attribute, operand(item) if operand else None)
+        for clause, attribute, operand in actions
+    ]
+    for clause, attribute, value in resolved:
+        if clause == "SET":
+            updated[attribute] = value
+        elif clause == "REMOVE":
+            updated.pop(attribute, None)
+        elif clause == "ADD":
+            if isinstance(value, (set, frozenset)):
+                updated[attribute] = set(updated.get(attribute, set())) | set(value)
+            else:
+                updated[attribute] = updated.get(attribute, Decimal(0)) + value
+        elif clause == "DELETE":
+            remaining = set(updated.get(attribute, set())) - set(value)
+            if remaining:
+                updated[attribute] = remaining
+            else:
+                updated.pop(attribute, None)
+    return updated
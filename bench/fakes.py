@@ -0,0 +1,1393 @@
+"""In-process stand-ins for the AWS services the pool uses.
+
+Everything runs on a virtual clock owned by a `World`: ECS tasks start after
+a sampled startup latency, state changes arrive as EventBridge events, and
+every API call is counted and charged a sampled latency to the calling
+thread, so a harness can report simulated request latency without sleeping.
+
+Only the calls and parameters the pool code makes are implemented. The
+DynamoDB table keeps Python values (numbers as Decimal, like boto3), enforces
+conditions, maintains global secondary indexes, records a
+NEW_AND_OLD_IMAGES stream and reports the capacity each call consumed.
+"""
+import copy
+import heapq
+import itertools
+import json
+import math
+import threading
+import time
+import urllib.error
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+import expressions
+
+ACCOUNT = "000000000000"
+REGION = "eu-west-1"
+SPOT_WARNING_SECONDS = 120
+
+# DynamoDB capacity unit sizes
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+
+def sample(spec, rng):
+    """Draw from a distribution spec.
+
+    A number is a constant; otherwise {"dist": "fixed", "value"},
+    {"dist": "uniform", "low", "high"}, {"dist": "normal", "mean", "stddev"}
+    or {"dist": "lognormal", "median", "sigma"}, with an optional "min".
+    """
+    if spec is None:
+        return 0.0
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    dist = spec.get("dist", "fixed")
+    if dist == "fixed":
+        value = spec["value"]
+    elif dist == "uniform":
+        value = rng.uniform(spec["low"], spec["high"])
+    elif dist == "normal":
+        value = rng.gauss(spec["mean"], spec["stddev"])
+    elif dist == "lognormal":
+        value = spec["median"] * math.exp(rng.gauss(0, spec["sigma"]))
+    else:
+        raise ValueError(f"Unknown distribution: {dist}")
+    return max(value, spec.get("min", 0.0))
+
+
+def client_error(code, message, operation):
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def _exception_class(code):
+    """A ClientError subclass named like the botocore modeled exception"""
+    return type(code, (ClientError,), {})
+
+
+class Recorder:
+    """Counts API calls and charges simulated latency to the calling thread.
+
+    Each call also sleeps for `real_time_scale` times its simulated latency,
+    so that concurrent callers interleave between their reads and writes the
+    way they would against the real service.
+    """
+
+    def __init__(self, rng, latency_ms, real_time_scale=0.0):
+        self.rng = rng
+        self.latency_ms = latency_ms or {}
+        self.real_time_scale = real_time_scale
+        self.calls = Counter()
+        self.conditional_failures = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def call(self, service, operation):
+        name = f"{service}.{operation}"
+        spec = self.latency_ms.get(name, self.latency_ms.get("default"))
+        with self._lock:
+            self.calls[name] += 1
+            latency = sample(spec, self.rng) / 1000.0
+        self._local.elapsed = getattr(self._local, "elapsed", 0.0) + latency
+        if self.real_time_scale:
+            time.sleep(latency * self.real_time_scale)
+
+    def conditional_failure(self, operation):
+        with self._lock:
+            self.conditional_failures[operation] += 1
+
+    @contextmanager
+    def measure(self):
+        """Simulated API time spent by this thread inside the block"""
+        span = SimpleNamespace(elapsed=0.0)
+        self._local.elapsed = 0.0
+        try:
+            yield span
+        finally:
+            span.elapsed = self._local.elapsed
+
+
+class World:
+    """Virtual clock, event scheduler and the shared fake services"""
+
+    def __init__(self, rng, config, start=1_700_000_000.0):
+        self.rng = rng
+        self.config = config
+        self.now = start
+        self._queue = []
+        self._sequence = itertools.count()
+        self.recorder = Recorder(
+            rng, config.get("api_latency_ms"), config.get("real_time_scale", 0.0)
+        )
+        self.events = FakeEventBridge(self, config.get("events", {}))
+        self.ecs = FakeECS(self, config.get("ecs", {}))
+        self.ec2 = FakeEC2(self)
+        self.sqs = FakeSQS(self)
+        self.containers = FakeContainers(self, config.get("containers", {}))
+        self.tables = {}
+        self.queues = {}
+
+    def datetime(self, epoch=None):
+        return datetime.fromtimestamp(self.now if epoch is None else epoch, timezone.utc)
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self._queue, (self.now + max(delay, 0.0), next(self._sequence), callback, args))
+
+    def run_until(self, until):
+        while self._queue and self._queue[0][0] <= until:
+            at, _, callback, args = heapq.heappop(self._queue)
+            self.now = max(self.now, at)
+            callback(*args)
+        self.now = max(self.now, until)
+
+    def create_table(self, name, hash_key, range_key, indexes):
+        self.tables[name] = TableBackend(self, name, hash_key, range_key, indexes)
+        return self.tables[name]
+
+    # boto3 entry points
+
+    def client(self, service_name, *args, **kwargs):
+        if service_name == "ecs":
+            return self.ecs
+        if service_name == "ec2":
+            return self.ec2
+        if service_name == "events":
+            return self.events
+        if service_name == "sqs":
+            return self.sqs
+        if service_name == "dynamodb":
+            return DynamoDBClient(self, typed=True)
+        raise ValueError(f"No stand-in for the {service_name} client")
+
+    def resource(self, service_name, *args, **kwargs):
+        if service_name == "dynamodb":
+            return DynamoDBResource(self)
+        raise ValueError(f"No stand-in for the {service_name} resource")
+
+
+# DynamoDB
+
+
+class ConditionFailed(Exception):
+    pass
+
+
+def _store_value(value):
+    """Normalise a value the way boto3 would round-trip it"""
+    if isinstance(value, bool) or value is None or isinstance(value, (str, bytes, Decimal)):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        return {k: _store_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_store_value(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {_store_value(v) for v in value}
+    raise TypeError(f"Unsupported type {type(value).__name__} for value {value!r}")
+
+
+def _typed(item):
+    return {k: serializer.serialize(v) for k, v in item.items()}
+
+
+def value_size(value):
+    """Bytes DynamoDB bills for a stored value"""
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, Decimal)):
+        return len(str(value).lstrip("-").replace(".", "")) // 2 + 1
+    if isinstance(value, dict):
+        return 3 + item_size(value)
+    return 3 + sum(value_size(member) for member in value)
+
+
+def item_size(item):
+    return sum(len(name.encode()) + value_size(value) for name, value in item.items())
+
+
+def read_units(size, consistent=False):
+    return max(math.ceil(size / READ_UNIT_BYTES), 1) * (1.0 if consistent else 0.5)
+
+
+def write_units(size):
+    return max(math.ceil(size / WRITE_UNIT_BYTES), 1)
+
+
+class TableBackend:
+    """Items, indexes and stream of one table"""
+
+    def __init__(self, world, name, hash_key, range_key, indexes):
+        self.world = world
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # {name: (hash key, range key[, projection])}, the projection being "ALL"
+        # (the default), "KEYS_ONLY" or the included non-key attributes
+        self.indexes = {name: tuple(spec[:2]) for name, spec in indexes.items()}
+        self.projections = {
+            name: spec[2] if len(spec) > 2 else "ALL" for name, spec in indexes.items()
+        }
+        self.items = {}
+        self.stream = []
+        self._sequence = itertools.count(1)
+        self.lock = threading.RLock()
+
+    def key_of(self, item):
+        return (item[self.hash_key], item[self.range_key])
+
+    def _check(self, existing, condition, names, values, operation):
+        if not condition:
+            return
+        predicate = expressions.compile_condition(condition, names, values)
+        if not predicate(existing or {}):
+            self.world.recorder.conditional_failure(operation)
+            raise ConditionFailed()
+
+    def _emit(self, old, new):
+        if old == new:
+            return
+        key_source = new if new is not None else old
+        record = {
+            "eventID": uuid.uuid4().hex,
+            "eventName": "INSERT" if old is None else "REMOVE" if new is None else "MODIFY",
+            "eventSource": "aws:dynamodb",
+            "dynamodb": {
+                "ApproximateCreationDateTime": self.world.now,
+                "Keys": _typed({k: key_source[k] for k in (self.hash_key, self.range_key)}),
+                "SequenceNumber": str(next(self._sequence)).zfill(21),
+                "StreamViewType": "NEW_AND_OLD_IMAGES",
+            },
+        }
+        if new is not None:
+            record["dynamodb"]["NewImage"] = _typed(new)
+        if old is not None:
+            record["dynamodb"]["OldImage"] = _typed(old)
+        self.stream.append(record)
+
+    def _write(self, key, new):
+        old = self.items.get(key)
+        if new is None:
+            self.items.pop(key, None)
+        else:
+            self.items[key] = new
+        self._emit(old, new)
+        return old
+
+    def put(self, item, condition=None, names=None, values=None):
+        item = _store_value(item)
+        key = self.key_of(item)
+        with self.lock:
+            existing = self.items.get(key)
+            self._check(existing, condition, names, values, "PutItem")
+            return copy.deepcopy(self._write(key, item))
+
+    def get(self, key):
+        key = _store_value(key)
+        with self.lock:
+            return copy.deepcopy(self.items.get(self.key_of(key)))
+
+    def update(self, key, update, condition=None, names=None, values=None):
+        """Returns (old item or None, new item)"""
+        key = _store_value(key)
+        values = _store_value(values or {})
+        with self.lock:
+            existing = self.items.get(self.key_of(key))
+            self._check(existing, condition, names, values, "UpdateItem")
+            new = expressions.apply_update(existing or dict(key), update, names, values)
+            self._write(self.key_of(key), new)
+            return copy.deepcopy(existing), copy.deepcopy(new)
+
+    def delete(self, key, condition=None, names=None, values=None):
+        key = _store_value(key)
+        values = _store_value(values or {})
+        with self.lock:
+            existing = self.items.get(self.key_of(key))
+            self._check(existing, condition, names, values, "DeleteItem")
+            if existing is None:
+                return None
+            return copy.deepcopy(self._write(self.key_of(key), None))
+
+    def transact(self, actions, changes=None):
+        """All-or-nothing writes; actions are (kind, params) with native values.
+
+        The (old, new) item of every write is appended to `changes`.
+        """
+        with self.lock:
+            reasons, failed = [], False
+            for kind, params in actions:
+                key = _store_value(params["Item"] if kind == "Put" else params["Key"])
+                existing = self.items.get(self.key_of(key))
+                condition = params.get("ConditionExpression")
+                predicate = condition and expressions.compile_condition(
+                    condition,
+                    params.get("ExpressionAttributeNames"),
+                    _store_value(params.get("ExpressionAttributeValues", {})),
+                )
+                if predicate and not predicate(existing or {}):
+                    reasons.append({"Code": "ConditionalCheckFailed", "Message": "The conditional request failed"})
+                    failed = True
+                else:
+                    reasons.append({"Code": "None"})
+            if failed:
+                self.world.recorder.conditional_failure("TransactWriteItems")
+                return reasons
+
+            for kind, params in actions:
+                names = params.get("ExpressionAttributeNames")
+                values = params.get("ExpressionAttributeValues")
+                if kind == "Put":
+                    change = (self.put(params["Item"]), _store_value(params["Item"]))
+                elif kind == "Update":
+                    change = self.update(
+                        params["Key"], params["UpdateExpression"], None, names, values
+                    )
+                elif kind == "Delete":
+                    change = (self.delete(params["Key"]), None)
+                else:
+                    # A condition check is billed like a write of the item
+                    checked = self.get(params["Key"])
+                    change = (checked, checked)
+                if changes is not None:
+                    changes.append(change)
+            return None
+
+    def _indexed(self, item, index):
+        """Indexes are sparse: only items with all of the index keys are in them"""
+        if not index:
+            return True
+        return all(key in item for key in self.indexes[index] if key)
+
+    def _projected_fields(self, index):
+        """Attributes stored in `index`, None for all of them"""
+        projection = self.projections[index] if index else "ALL"
+        if projection == "ALL":
+            return None
+        fields = {self.hash_key, self.range_key, *(k for k in self.indexes[index] if k)}
+        if projection != "KEYS_ONLY":
+            fields.update(projection)
+        return fields
+
+    def projected(self, item, index):
+        """The attributes of `item` stored in `index`"""
+        fields = self._projected_fields(index)
+        if fields is None:
+            return item
+        return {name: value for name, value in item.items() if name in fields}
+
+    # Consumed capacity, as DynamoDB reports it with ReturnConsumedCapacity=INDEXES
+
+    def write_capacity(self, old, new, multiplier=1):
+        """{index name, or None for the table: write units} of replacing `old` with `new`"""
+        size = max(item_size(old or {}), item_size(new or {}))
+        units = {None: write_units(size) * multiplier}
+        for index, index_keys in self.indexes.items():
+            before = old is not None and self._indexed(old, index)
+            after = new is not None and self._indexed(new, index)
+            if before and after:
+                before, after = self.projected(old, index), self.projected(new, index)
+                if before == after:
+                    # Nothing the index stores changed, so it isn't written
+                    continue
+                if all(old[k] == new[k] for k in index_keys if k):
+                    writes = [after]
+                else:
+                    # A changed index key deletes the old index entry and puts a new one
+                    writes = [before, after]
+            else:
+                writes = [
+                    self.projected(item, index)
+                    for item, kept in ((old, before), (new, after))
+                    if kept
+                ]
+            if writes:
+                units[index] = sum(write_units(item_size(item)) for item in writes) * multiplier
+        return units
+
+    def _sort_key(self, item, index):
+        range_key = self.indexes[index][1] if index else self.range_key
+        return (item.get(range_key, ""), item[self.hash_key], item[self.range_key])
+
+    def _after(self, items, start_key, index, forward=True):
+        if not start_key:
+            return items
+        start = self._sort_key(_store_value(start_key), index)
+        if forward:
+            return [item for item in items if self._sort_key(item, index) > start]
+        return [item for item in items if self._sort_key(item, index) < start]
+
+    def _last_key(self, item, index):
+        fields = {self.hash_key, self.range_key}
+        if index:
+            fields.update(k for k in self.indexes[index] if k)
+        return {k: item[k] for k in fields if k in item}
+
+    def query(self, key_condition, names, values, index=None, filter_expression=None,
+              limit=None, start_key=None, forward=True, select=None, projection=None):
+        values = _store_value(values or {})
+        match = expressions.compile_condition(key_condition, names, values)
+        keep = filter_expression and expressions.compile_condition(filter_expression, names, values)
+        with self.lock:
+            candidates = [
+                item for item in self.items.values() if self._indexed(item, index) and match(item)
+            ]
+            candidates.sort(key=lambda item: self._sort_key(item, index), reverse=not forward)
+            candidates = self._after(candidates, start_key, index, forward)
+            return self._page(candidates, index, keep, limit, select, projection, names)
+
+    def scan(self, names=None, values=None, index=None, filter_expression=None, limit=None,
+             start_key=None, segment=None, total_segments=None, select=None, projection=None):
+        values = _store_value(values or {})
+        keep = filter_expression and expressions.compile_condition(filter_expression, names, values)
+        hash_key = self.indexes[index][0] if index else self.hash_key
+
+        with self.lock:
+            candidates = [item for item in self.items.values() if self._indexed(item, index)]
+            if total_segments:
+                candidates = [
+                    item
+                    for item in candidates
+                    if zlib.crc32(str(item[hash_key]).encode()) % total_segments == segment
+                ]
+            candidates.sort(key=lambda item: self._sort_key(item, index))
+            candidates = self._after(candidates, start_key, index)
+            return self._page(candidates, index, keep, limit, select, projection, names)
+
+    def _page(self, candidates, index, keep, limit, select, projection, names):
+        page = candidates[:limit] if limit else candidates
+        # An index only returns, and filters on, what it projects
+        matched = [self.projected(item, index) for item in page]
+        matched = [item for item in matched if not keep or keep(item)]
+        response = {"Count": len(matched), "ScannedCount": len(page)}
+        # Reads are billed for every item read, before filtering and projection
+        response["ScannedBytes"] = sum(item_size(self.projected(item, index)) for item in page)
+        if select != "COUNT":
+            if projection:
+                fields = [(names or {}).get(f.strip(), f.strip()) for f in projection.split(",")]
+                stored = self._projected_fields(index)
+                if stored is not None and not stored.issuperset(fields):
+                    raise client_error(
+                        "ValidationException",
+                        f"Index {index} does not project {sorted(set(fields) - stored)}",
+                        "Query",
+                    )
+                matched = [{f: item[f] for f in fields if f in item} for item in matched]
+            response["Items"] = copy.deepcopy(matched)
+        if limit and len(candidates) > limit:
+            response["LastEvaluatedKey"] = copy.deepcopy(self._last_key(page[-1], index))
+        return response
+
+    def count(self, attribute):
+        with self.lock:
+            return Counter(item.get(attribute) for item in self.items.values())
+
+
+def _dynamodb_exceptions():
+    return SimpleNamespace(
+        ConditionalCheckFailedException=_CONDITIONAL_CHECK_FAILED,
+        TransactionCanceledException=_TRANSACTION_CANCELED,
+        ResourceNotFoundException=_exception_class("ResourceNotFoundException"),
+        ProvisionedThroughputExceededException=_exception_class(
+            "ProvisionedThroughputExceededException"
+        ),
+        ClientError=ClientError,
+    )
+
+
+_CONDITIONAL_CHECK_FAILED = _exception_class("ConditionalCheckFailedException")
+_TRANSACTION_CANCELED = _exception_class("TransactionCanceledException")
+
+
+def _conditional_check_failed(operation):
+    return _CONDITIONAL_CHECK_FAILED(
+        {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+        operation,
+    )
+
+
+def _expression(condition, names, values, is_key_condition=False):
+    """Accept both expression strings and boto3 condition objects"""
+    if condition is None or isinstance(condition, str):
+        return condition, names, values
+    if not isinstance(condition, ConditionBase):
+        raise TypeError(f"Unsupported condition {condition!r}")
+    built = ConditionExpressionBuilder().build_expression(condition, is_key_condition=is_key_condition)
+    return (
+        built.condition_expression,
+        {**(names or {}), **built.attribute_name_placeholders},
+        {**(values or {}), **built.attribute_value_placeholders},
+    )
+
+
+class DynamoDBClient:
+    """The low-level client. With `typed` the wire format ({"S": ...}) is used,
+    otherwise native values, like the client behind a boto3 resource.
+
+    Config (the scenario's "dynamodb"): unprocessed_rate, the share of
+    BatchWriteItem entries left unprocessed as if throttled."""
+
+    def __init__(self, world, typed):
+        self.world = world
+        self.typed = typed
+        self.exceptions = _dynamodb_exceptions()
+        self.meta = SimpleNamespace(region_name=REGION)
+
+    def _table(self, name):
+        if name not in self.world.tables:
+            raise self.exceptions.ResourceNotFoundException(
+                {"Error": {"Code": "ResourceNotFoundException", "Message": f"Table {name} not found"}},
+                "DescribeTable",
+            )
+        return self.world.tables[name]
+
+    def _in(self, value):
+        if value is None:
+            return None
+        if self.typed:
+            return {k: deserializer.deserialize(v) for k, v in value.items()}
+        return value
+
+    def _out(self, item):
+        if item is None:
+            return None
+        return _typed(item) if self.typed else item
+
+    def _call(self, operation):
+        self.world.recorder.call("dynamodb", operation)
+
+    def _consumed(self, table, kwargs, read=None, write=None):
+        """The ConsumedCapacity of a response, if the caller asked for it.
+
+        `read` and `write` map an index name, or None for the table, to capacity units.
+        """
+        mode = kwargs.get("ReturnConsumedCapacity", "NONE")
+        if mode == "NONE":
+            return None
+
+        def capacity(read_units, write_units):
+            units = {"CapacityUnits": read_units + write_units}
+            if read is not None:
+                units["ReadCapacityUnits"] = read_units
+            if write is not None:
+                units["WriteCapacityUnits"] = write_units
+            return units
+
+        targets = set(read or {}) | set(write or {})
+        per_target = {
+            target: capacity((read or {}).get(target, 0.0), (write or {}).get(target, 0.0))
+            for target in targets
+        }
+        consumed = {
+            "TableName": table.name,
+            **capacity(sum((read or {}).values()), sum((write or {}).values())),
+        }
+        if mode == "INDEXES":
+            consumed["Table"] = per_target.pop(None, capacity(0.0, 0.0))
+            if per_target:
+                consumed["GlobalSecondaryIndexes"] = per_target
+        return consumed
+
+    def _with_consumed(self, response, consumed):
+        if consumed is not None:
+            response["ConsumedCapacity"] = consumed
+        return response
+
+    def get_item(self, TableName, Key, ConsistentRead=False, **kwargs):
+        self._call("GetItem")
+        table = self._table(TableName)
+        item = table.get(self._in(Key))
+        response = {"Item": self._out(item)} if item is not None else {}
+        units = read_units(item_size(item or {}), ConsistentRead)
+        return self._with_consumed(response, self._consumed(table, kwargs, read={None: units}))
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, ReturnValues="NONE", **kwargs):
+        self._call("PutItem")
+        table = self._table(TableName)
+        try:
+            old = table.put(
+                self._in(Item), ConditionExpression, ExpressionAttributeNames,
+                self._in(ExpressionAttributeValues),
+            )
+        except ConditionFailed:
+            raise _conditional_check_failed("PutItem") from None
+        consumed = self._consumed(
+            table, kwargs, write=table.write_capacity(old, _store_value(self._in(Item)))
+        )
+        if ReturnValues == "ALL_OLD" and old is not None:
+            return self._with_consumed({"Attributes": self._out(old)}, consumed)
+        return self._with_consumed({}, consumed)
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ReturnValues="NONE", **kwargs):
+        self._call("UpdateItem")
+        table = self._table(TableName)
+        try:
+            old, new = table.update(
+                self._in(Key), UpdateExpression, ConditionExpression, ExpressionAttributeNames,
+                self._in(ExpressionAttributeValues),
+            )
+        except ConditionFailed:
+            raise _conditional_check_failed("UpdateItem") from None
+        consumed = self._consumed(table, kwargs, write=table.write_capacity(old, new))
+        if ReturnValues in ("ALL_NEW", "UPDATED_NEW"):
+            return self._with_consumed({"Attributes": self._out(new)}, consumed)
+        if ReturnValues in ("ALL_OLD", "UPDATED_OLD") and old is not None:
+            return self._with_consumed({"Attributes": self._out(old)}, consumed)
+        return self._with_consumed({}, consumed)
+
+    def delete_item(self, TableName, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues="NONE", **kwargs):
+        self._call("DeleteItem")
+        table = self._table(TableName)
+        try:
+            old = table.delete(
+                self._in(Key), ConditionExpression, ExpressionAttributeNames,
+                self._in(ExpressionAttributeValues),
+            )
+        except ConditionFailed:
+            raise _conditional_check_failed("DeleteItem") from None
+        consumed = self._consumed(table, kwargs, write=table.write_capacity(old, None))
+        if ReturnValues == "ALL_OLD" and old is not None:
+            return self._with_consumed({"Attributes": self._out(old)}, consumed)
+        return self._with_consumed({}, consumed)
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeNames=None,
+              ExpressionAttributeValues=None, IndexName=None, FilterExpression=None, Limit=None,
+              ExclusiveStartKey=None, ScanIndexForward=True, Select=None,
+              ProjectionExpression=None, ConsistentRead=False, **kwargs):
+        self._call("Query")
+        table = self._table(TableName)
+        response = table.query(
+            KeyConditionExpression, ExpressionAttributeNames, self._in(ExpressionAttributeValues),
+            index=IndexName, filter_expression=FilterExpression, limit=Limit,
+            start_key=self._in(ExclusiveStartKey), forward=ScanIndexForward, select=Select,
+            projection=ProjectionExpression,
+        )
+        return self._response(table, response, IndexName, ConsistentRead, kwargs)
+
+    def scan(self, TableName, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+             IndexName=None, FilterExpression=None, Limit=None, ExclusiveStartKey=None,
+             Segment=None, TotalSegments=None, Select=None, ProjectionExpression=None,
+             ConsistentRead=False, **kwargs):
+        self._call("Scan")
+        table = self._table(TableName)
+        response = table.scan(
+            ExpressionAttributeNames, self._in(ExpressionAttributeValues), index=IndexName,
+            filter_expression=FilterExpression, limit=Limit,
+            start_key=self._in(ExclusiveStartKey), segment=Segment, total_segments=TotalSegments,
+            select=Select, projection=ProjectionExpression,
+        )
+        return self._response(table, response, IndexName, ConsistentRead, kwargs)
+
+    def _response(self, table, response, index, consistent, kwargs):
+        units = read_units(response.pop("ScannedBytes"), consistent)
+        self._with_consumed(response, self._consumed(table, kwargs, read={index: units}))
+        if "Items" in response:
+            response["Items"] = [self._out(item) for item in response["Items"]]
+        if "LastEvaluatedKey" in response:
+            response["LastEvaluatedKey"] = self._out(response["LastEvaluatedKey"])
+        return response
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        self._call("TransactWriteItems")
+        actions, table_name = [], None
+        for entry in TransactItems:
+            (kind, params), = entry.items()
+            params = dict(params)
+            table_name = params.pop("TableName")
+            for field in ("Item", "Key", "ExpressionAttributeValues"):
+                if field in params:
+                    params[field] = self._in(params[field])
+            actions.append((kind, params))
+        table, changes = self._table(table_name), []
+        reasons = table.transact(actions, changes)
+        if reasons:
+            raise self.exceptions.TransactionCanceledException(
+                {
+                    "Error": {
+                        "Code": "TransactionCanceledException",
+                        "Message": "Transaction cancelled, please refer cancellation reasons for specific reasons",
+                    },
+                    "CancellationReasons": reasons,
+                },
+                "TransactWriteItems",
+            )
+        # Transactional writes cost twice the units of plain ones
+        write = Counter()
+        for old, new in changes:
+            write.update(table.write_capacity(old, new, multiplier=2))
+        consumed = self._consumed(table, kwargs, write=dict(write))
+        return {"ConsumedCapacity": [consumed]} if consumed else {}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self._call("BatchWriteItem")
+        unprocessed_rate = self.world.config.get("dynamodb", {}).get("unprocessed_rate", 0.0)
+        response = {"UnprocessedItems": {}}
+        consumed = []
+        for table_name, requests in RequestItems.items():
+            table = self._table(table_name)
+            write = Counter()
+            unprocessed = []
+            for request in requests:
+                if unprocessed_rate and self.world.rng.random() < unprocessed_rate:
+                    # Throttled: returned as it was sent, for the caller to resend
+                    unprocessed.append(request)
+                    continue
+                if "PutRequest" in request:
+                    item = self._in(request["PutRequest"]["Item"])
+                    write.update(table.write_capacity(table.put(item), _store_value(item)))
+                else:
+                    old = table.delete(self._in(request["DeleteRequest"]["Key"]))
+                    write.update(table.write_capacity(old, None))
+            consumed.append(self._consumed(table, kwargs, write=dict(write)))
+            if unprocessed:
+                response["UnprocessedItems"][table_name] = unprocessed
+        if any(consumed):
+            response["ConsumedCapacity"] = consumed
+        return response
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self._call("BatchGetItem")
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self._table(table_name)
+            items = [table.get(self._in(key)) for key in request["Keys"]]
+            responses[table_name] = [self._out(item) for item in items if item is not None]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+
+class BatchWriter:
+    """boto3's Table.batch_writer(): buffers writes and flushes 25 at a time"""
+
+    def __init__(self, table, overwrite_by_pkeys=None):
+        self._table = table
+        self._overwrite_by_pkeys = overwrite_by_pkeys
+        self._pending = []
+
+    def put_item(self, Item):
+        self._add({"PutRequest": {"Item": Item}})
+
+    def delete_item(self, Key):
+        self._add({"DeleteRequest": {"Key": Key}})
+
+    def _add(self, request):
+        if self._overwrite_by_pkeys:
+            body = request.get("PutRequest", {}).get("Item") or request["DeleteRequest"]["Key"]
+            key = tuple(body[k] for k in self._overwrite_by_pkeys)
+            self._pending = [
+                pending
+                for pending in self._pending
+                if tuple(
+                    (pending.get("PutRequest", {}).get("Item") or pending["DeleteRequest"]["Key"])[k]
+                    for k in self._overwrite_by_pkeys
+                )
+                != key
+            ]
+        self._pending.append(request)
+        if len(self._pending) >= 25:
+            self._flush()
+
+    def _flush(self):
+        while self._pending:
+            batch, self._pending = self._pending[:25], self._pending[25:]
+            self._table.meta.client.batch_write_item(RequestItems={self._table.name: batch})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._flush()
+
+
+class Table:
+    """boto3's dynamodb.Table resource"""
+
+    def __init__(self, client, name):
+        self.meta = SimpleNamespace(client=client)
+        self.name = name
+        self.table_name = name
+
+    def _conditions(self, kwargs, field, is_key_condition=False):
+        expression, names, values = _expression(
+            kwargs.get(field),
+            kwargs.get("ExpressionAttributeNames"),
+            kwargs.get("ExpressionAttributeValues"),
+            is_key_condition,
+        )
+        if expression is not None:
+            kwargs[field] = expression
+        if names:
+            kwargs["ExpressionAttributeNames"] = names
+        if values:
+            kwargs["ExpressionAttributeValues"] = values
+        return kwargs
+
+    def get_item(self, **kwargs):
+        return self.meta.client.get_item(TableName=self.name, **kwargs)
+
+    def put_item(self, **kwargs):
+        kwargs = self._conditions(dict(kwargs), "ConditionExpression")
+        return self.meta.client.put_item(TableName=self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        kwargs = self._conditions(dict(kwargs), "ConditionExpression")
+        return self.meta.client.update_item(TableName=self.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        kwargs = self._conditions(dict(kwargs), "ConditionExpression")
+        return self.meta.client.delete_item(TableName=self.name, **kwargs)
+
+    def query(self, **kwargs):
+        kwargs = self._conditions(dict(kwargs), "KeyConditionExpression", is_key_condition=True)
+        kwargs = self._conditions(kwargs, "FilterExpression")
+        return self.meta.client.query(TableName=self.name, **kwargs)
+
+    def scan(self, **kwargs):
+        kwargs = self._conditions(dict(kwargs), "FilterExpression")
+        return self.meta.client.scan(TableName=self.name, **kwargs)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return BatchWriter(self, overwrite_by_pkeys)
+
+
+class DynamoDBResource:
+    def __init__(self, world):
+        self.meta = SimpleNamespace(client=DynamoDBClient(world, typed=False))
+
+    def Table(self, name):
+        return Table(self.meta.client, name)
+
+
+# ECS and EC2
+
+
+def _event_time(value):
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _event_detail(task):
+    """An ECS task as it appears in a Task State Change event"""
+    return {
+        key: _event_time(value) if isinstance(value, datetime) else value
+        for key, value in copy.deepcopy(task).items()
+    }
+
+
+class FakeECS:
+    """Fargate tasks that start after a sampled latency, or fail to.
+
+    Config: startup_seconds (distribution), ready_seconds (RUNNING to
+    HEALTHY), startup_failure_rate, capacity_failure_rate (per RunTask slot),
+    stop_seconds, run_task_rate and run_task_burst (token bucket of RunTask
+    calls, throttles when empty) and spot_interruptions_per_hour. Task
+    definitions are registered for DescribeTaskDefinition only; tasks run
+    the same whatever their definition.
+    """
+
+    CLUSTER_ARN = f"arn:aws:ecs:{REGION}:{ACCOUNT}:cluster/pool"
+    ZONES = (f"{REGION}a", f"{REGION}b")
+
+    def __init__(self, world, config):
+        self.world = world
+        self.config = config
+        self.tasks = {}
+        self.task_definitions = {}
+        self.public_ips = {}
+        self.task_by_ip = {}
+        self.launched = 0
+        self.capacity_failures = 0
+        self.startup_failures = 0
+        self.throttled = 0
+        self._tokens = float(config.get("run_task_burst", 100))
+        self._refilled_at = world.now
+        self._lock = threading.Lock()
+        self.exceptions = SimpleNamespace(
+            ClientError=ClientError,
+            ThrottlingException=_exception_class("ThrottlingException"),
+            InvalidParameterException=_exception_class("InvalidParameterException"),
+        )
+
+    def _admit_run_task(self):
+        rate = self.config.get("run_task_rate")
+        if not rate:
+            return True
+        burst = float(self.config.get("run_task_burst", 100))
+        self._tokens = min(burst, self._tokens + (self.world.now - self._refilled_at) * rate)
+        self._refilled_at = self.world.now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def run_task(self, cluster, taskDefinition, count=1, startedBy=None, launchType=None,
+                 capacityProviderStrategy=None, networkConfiguration=None, group=None,
+                 overrides=None, **kwargs):
+        self.world.recorder.call("ecs", "RunTask")
+        with self._lock:
+            if not self._admit_run_task():
+                self.throttled += 1
+                raise self.exceptions.ThrottlingException(
+                    {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "RunTask"
+                )
+
+            tasks, failures = [], []
+            for _ in range(count):
+                if self.world.rng.random() < self.config.get("capacity_failure_rate", 0.0):
+                    self.capacity_failures += 1
+                    failures.append(
+                        {
+                            "arn": f"arn:aws:ecs:{REGION}:{ACCOUNT}:container-instance/pool",
+                            "reason": "Capacity is unavailable at this time. Please try again later or in a different availability zone",
+                        }
+                    )
+                    continue
+                tasks.append(
+                    self._start(taskDefinition, startedBy, launchType, capacityProviderStrategy, group, overrides)
+                )
+            return {"tasks": copy.deepcopy(tasks), "failures": failures}
+
+    def _start(self, task_definition, started_by, launch_type, capacity_provider_strategy,
+               group=None, overrides=None):
+        task_id = uuid.UUID(int=self.world.rng.getrandbits(128)).hex
+        eni_id = f"eni-{task_id[:17]}"
+        self.public_ips[eni_id] = f"203.0.{self.launched // 250 % 250}.{self.launched % 250 + 1}"
+        self.launched += 1
+        created = self.world.datetime()
+        capacity_provider = (
+            capacity_provider_strategy[0]["capacityProvider"] if capacity_provider_strategy else None
+        )
+        task = {
+            "taskArn": f"arn:aws:ecs:{REGION}:{ACCOUNT}:task/pool/{task_id}",
+            "clusterArn": self.CLUSTER_ARN,
+            "taskDefinitionArn": f"arn:aws:ecs:{REGION}:{ACCOUNT}:task-definition/{task_definition}:1",
+            "availabilityZone": self.world.rng.choice(self.ZONES),
+            "lastStatus": "PROVISIONING",
+            "desiredStatus": "RUNNING",
+            "launchType": launch_type or "FARGATE",
+            "startedBy": started_by,
+            "group": group or f"family:{task_definition}",
+            "overrides": overrides or {},
+            "createdAt": created,
+            "attachments": [
+                {
+                    "id": uuid.uuid4().hex,
+                    "type": "ElasticNetworkInterface",
+                    "status": "ATTACHED",
+                    "details": [
+                        {"name": "subnetId", "value": "subnet-00000000"},
+                        {"name": "networkInterfaceId", "value": eni_id},
+                    ],
+                }
+            ],
+            "containers": [{"name": "app", "lastStatus": "PENDING", "healthStatus": "UNKNOWN"}],
+            "healthStatus": "UNKNOWN",
+        }
+        if capacity_provider:
+            task["capacityProviderName"] = capacity_provider
+        self.tasks[task["taskArn"]] = task
+        self.task_by_ip[self.public_ips[eni_id]] = task["taskArn"]
+
+        startup = sample(self.config.get("startup_seconds", 60.0), self.world.rng)
+        if self.world.rng.random() < self.config.get("startup_failure_rate", 0.0):
+            self.startup_failures += 1
+            self.world.schedule(
+                startup * 0.5, self._stop, task["taskArn"], "TaskFailedToStart",
+                "CannotPullContainerError: pull image manifest has been retried 5 time(s)",
+            )
+        else:
+            self.world.schedule(startup, self._running, task["taskArn"], startup)
+            if capacity_provider == "FARGATE_SPOT":
+                # Reclaims arrive at random; the rate is per spot task hour
+                rate = self.config.get("spot_interruptions_per_hour", 0.0)
+                if rate > 0:
+                    lifetime = self.world.rng.expovariate(rate / 3600)
+                    self.world.schedule(startup + lifetime, self.interrupt, task["taskArn"])
+        return task
+
+    def _running(self, task_arn, startup):
+        task = self.tasks.get(task_arn)
+        if task is None or task["lastStatus"] != "PROVISIONING" or task["desiredStatus"] != "RUNNING":
+            return
+        created = task["createdAt"].timestamp()
+        # Provisioning, image pull and container start take fixed shares of the startup
+        task["pullStartedAt"] = self.world.datetime(created + startup * 0.3)
+        task["pullStoppedAt"] = self.world.datetime(created + startup * 0.8)
+        task["startedAt"] = self.world.datetime()
+        task["lastStatus"] = "RUNNING"
+        task["containers"][0]["lastStatus"] = "RUNNING"
+        # The container health check passes once the app has warmed up
+        ready = sample(self.config.get("ready_seconds", 0.0), self.world.rng)
+        if ready <= 0:
+            self._healthy(task_arn)
+            return
+        self._changed(task)
+        self.world.schedule(ready, self._healthy, task_arn)
+
+    def _healthy(self, task_arn):
+        task = self.tasks.get(task_arn)
+        if task is None or task["lastStatus"] != "RUNNING":
+            return
+        task["containers"][0]["healthStatus"] = "HEALTHY"
+        task["healthStatus"] = "HEALTHY"
+        self._changed(task)
+
+    def _stop(self, task_arn, stop_code, reason):
+        task = self.tasks.get(task_arn)
+        if task is None or task["lastStatus"] == "STOPPED":
+            return
+        task.update(
+            lastStatus="STOPPED",
+            desiredStatus="STOPPED",
+            stopCode=stop_code,
+            stoppedReason=reason,
+            stoppedAt=self.world.datetime(),
+        )
+        task["containers"][0]["lastStatus"] = "STOPPED"
+        self._changed(task)
+
+    def _changed(self, task):
+        self.world.events.emit("default", "aws.ecs", "ECS Task State Change", _event_detail(task))
+
+    def interrupt(self, task_arn, stop_code="SpotInterruption", reason="Your Spot Task was interrupted."):
+        """Stop a task from the outside, e.g. a Spot reclaim.
+
+        Like Fargate, a reclaim is announced while the task still runs and
+        the task is stopped two minutes later.
+        """
+        task = self.tasks.get(task_arn)
+        if task is None or task["lastStatus"] == "STOPPED":
+            return
+        task.update(desiredStatus="STOPPED", stopCode=stop_code, stoppedReason=reason)
+        self._changed(task)
+        self.world.schedule(SPOT_WARNING_SECONDS, self._stop, task_arn, stop_code, reason)
+
+    def describe_tasks(self, cluster, tasks, **kwargs):
+        self.world.recorder.call("ecs", "DescribeTasks")
+        found, failures = [], []
+        for reference in tasks:
+            arn = next((a for a in self.tasks if a == reference or a.endswith("/" + reference)), None)
+            if arn is None:
+                failures.append({"arn": reference, "reason": "MISSING"})
+            else:
+                found.append(copy.deepcopy(self.tasks[arn]))
+        return {"tasks": found, "failures": failures}
+
+    def stop_task(self, cluster, task, reason=None, **kwargs):
+        self.world.recorder.call("ecs", "StopTask")
+        arn = next((a for a in self.tasks if a == task or a.endswith("/" + task)), None)
+        if arn is None:
+            raise self.exceptions.InvalidParameterException(
+                {"Error": {"Code": "InvalidParameterException", "Message": "The referenced task was not found."}},
+                "StopTask",
+            )
+        stopping = self.tasks[arn]
+        if stopping["desiredStatus"] != "STOPPED":
+            stopping["desiredStatus"] = "STOPPED"
+            delay = sample(self.config.get("stop_seconds", 30.0), self.world.rng)
+            self.world.schedule(delay, self._stop, arn, "UserInitiated", reason or "Task stopped by user")
+        return {"task": copy.deepcopy(stopping)}
+
+    def register_task_definition(self, family, containerDefinitions, **kwargs):
+        self.world.recorder.call("ecs", "RegisterTaskDefinition")
+        revision = sum(name.split(":")[0] == family for name in self.task_definitions) + 1
+        definition = {
+            "taskDefinitionArn": f"arn:aws:ecs:{REGION}:{ACCOUNT}:task-definition/{family}:{revision}",
+            "family": family,
+            "revision": revision,
+            "containerDefinitions": copy.deepcopy(containerDefinitions),
+            **copy.deepcopy(kwargs),
+        }
+        self.task_definitions[f"{family}:{revision}"] = definition
+        return {"taskDefinition": copy.deepcopy(definition)}
+
+    def describe_task_definition(self, taskDefinition, **kwargs):
+        self.world.recorder.call("ecs", "DescribeTaskDefinition")
+        reference = taskDefinition.split("/")[-1]
+        if ":" not in reference:
+            revisions = [name for name in self.task_definitions if name.split(":")[0] == reference]
+            reference = max(revisions, key=lambda name: int(name.split(":")[1]), default=reference)
+        if reference not in self.task_definitions:
+            raise client_error(
+                "ClientException", "Unable to describe task definition.", "DescribeTaskDefinition"
+            )
+        return {"taskDefinition": copy.deepcopy(self.task_definitions[reference])}
+
+    def list_tasks(self, cluster, startedBy=None, desiredStatus="RUNNING", maxResults=100,
+                   nextToken=None, **kwargs):
+        self.world.recorder.call("ecs", "ListTasks")
+        arns = [
+            arn
+            for arn, task in self.tasks.items()
+            if task["desiredStatus"] == desiredStatus
+            and (startedBy is None or task.get("startedBy") == startedBy)
+        ]
+        start = int(nextToken or 0)
+        response = {"taskArns": arns[start : start + maxResults]}
+        if start + maxResults < len(arns):
+            response["nextToken"] = str(start + maxResults)
+        return response
+
+    def get_paginator(self, operation):
+        if operation != "list_tasks":
+            raise ValueError(f"No paginator for {operation}")
+        ecs = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                token = None
+                while True:
+                    page = ecs.list_tasks(**kwargs, nextToken=token)
+                    yield page
+                    token = page.get("nextToken")
+                    if token is None:
+                        return
+
+        return Paginator()
+
+    def count(self, status):
+        return sum(1 for task in self.tasks.values() if task["lastStatus"] == status)
+
+
+class FakeEC2:
+    def __init__(self, world):
+        self.world = world
+
+    def describe_network_interfaces(self, NetworkInterfaceIds, **kwargs):
+        self.world.recorder.call("ec2", "DescribeNetworkInterfaces")
+        return {
+            "NetworkInterfaces": [
+                {
+                    "NetworkInterfaceId": eni_id,
+                    "Association": {"PublicIp": self.world.ecs.public_ips[eni_id]},
+                }
+                for eni_id in NetworkInterfaceIds
+            ]
+        }
+
+
+class _Response:
+    def __init__(self, status):
+        self.status = status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeContainers:
+    """The app in each task, reached over HTTP on its public IP.
+
+    Stands in for urllib.request.urlopen. GET /ready answers 200 once the
+    task is HEALTHY; POST /reset answers 200 on a running task, failing at
+    reset_failure_rate.
+    """
+
+    def __init__(self, world, config):
+        self.world = world
+        self.config = config
+        self.resets = 0
+        self.reset_failures = 0
+
+    def _task(self, public_ip):
+        return self.world.ecs.tasks.get(self.world.ecs.task_by_ip.get(public_ip))
+
+    def urlopen(self, url, data=None, timeout=None):
+        target = url.full_url if hasattr(url, "full_url") else url
+        host, _, path = target.split("://", 1)[1].partition("/")
+        self.world.recorder.call("container", "/" + path)
+        task = self._task(host.split(":")[0])
+        if task is None or task["lastStatus"] != "RUNNING":
+            raise urllib.error.URLError("Connection refused")
+
+        status = 200
+        if path == "ready" and task.get("healthStatus") != "HEALTHY":
+            status = 503
+        elif path == "reset":
+            self.resets += 1
+            if self.world.rng.random() < self.config.get("reset_failure_rate", 0.0):
+                self.reset_failures += 1
+                status = 500
+        if status != 200:
+            raise urllib.error.HTTPError(target, status, "Unavailable", {}, None)
+        return _Response(status)
+
+
+# EventBridge and SQS
+
+
+class FakeEventBridge:
+    """PutEvents with optional failures; matching events go to registered targets.
+
+    Config: failure_rate (per entry), delivery_seconds.
+    """
+
+    def __init__(self, world, config):
+        self.world = world
+        self.config = config
+        self.rules = []
+        self.failed_entries = 0
+
+    def add_rule(self, bus, matches, target):
+        """`matches(event)` selects events on `bus`, `target(event)` receives them"""
+        self.rules.append((bus, matches, target))
+
+    def put_events(self, Entries, **kwargs):
+        self.world.recorder.call("events", "PutEvents")
+        if len(Entries) > 10:
+            raise client_error("ValidationException", "Entries exceeds 10", "PutEvents")
+        results, failed = [], 0
+        for entry in Entries:
+            if self.world.rng.random() < self.config.get("failure_rate", 0.0):
+                failed += 1
+                results.append({"ErrorCode": "InternalFailure", "ErrorMessage": "Internal failure"})
+                continue
+            results.append({"EventId": str(uuid.uuid4())})
+            self.emit(
+                entry.get("EventBusName", "default"),
+                entry["Source"],
+                entry["DetailType"],
+                json.loads(entry.get("Detail", "{}")),
+            )
+        self.failed_entries += failed
+        return {"FailedEntryCount": failed, "Entries": results}
+
+    def emit(self, bus, source, detail_type, detail):
+        event = {
+            "version": "0",
+            "id": str(uuid.uuid4()),
+            "detail-type": detail_type,
+            "source": source,
+            "account": ACCOUNT,
+            "time": _event_time(self.world.datetime()),
+            "region": REGION,
+            "resources": [],
+            "detail": detail,
+        }
+        delay = sample(self.config.get("delivery_seconds", 0.5), self.world.rng)
+        for rule_bus, matches, target in self.rules:
+            if rule_bus == bus and matches(event):
+                self.world.schedule(delay, target, copy.deepcopy(event))
+
+
+class FakeQueue:
+    """SQS with visibility timeouts and a redrive policy"""
+
+    def __init__(self, world, visibility_timeout=180, max_receive_count=5, url=None):
+        self.world = world
+        self.url = url or f"https://sqs.{REGION}.amazonaws.com/{ACCOUNT}/queue-{len(world.queues)}"
+        world.queues[self.url] = self
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count
+        self.messages = {}
+        self.dead_letters = []
+
+    def send(self, body):
+        message_id = str(uuid.uuid4())
+        self.messages[message_id] = {
+            "messageId": message_id,
+            "body": body,
+            "sentAt": self.world.now,
+            "visibleAt": self.world.now,
+            "receiveCount": 0,
+        }
+
+    def receive(self, max_messages):
+        batch = []
+        for message in sorted(self.messages.values(), key=lambda m: m["sentAt"]):
+            if len(batch) >= max_messages:
+                break
+            if message["visibleAt"] > self.world.now:
+                continue
+            if message["receiveCount"] >= self.max_receive_count:
+                self.dead_letters.append(self.messages.pop(message["messageId"]))
+                continue
+            message["receiveCount"] += 1
+            message["visibleAt"] = self.world.now + self.visibility_timeout
+            batch.append(message)
+        return [
+            {
+                "messageId": m["messageId"],
+                "receiptHandle": m["messageId"],
+                "body": m["body"],
+                "attributes": {
+                    "ApproximateReceiveCount": str(m["receiveCount"]),
+                    "SentTimestamp": str(int(m["sentAt"] * 1000)),
+                },
+                "eventSource": "aws:sqs",
+            }
+            for m in batch
+        ]
+
+    def delete(self, message_id):
+        self.messages.pop(message_id, None)
+
+    def change_visibility(self, receipt_handle, seconds):
+        message = self.messages.get(receipt_handle)
+        if message is None:
+            return False
+        message["visibleAt"] = self.world.now + seconds
+        return True
+
+    def attributes(self):
+        visible = sum(1 for m in self.messages.values() if m["visibleAt"] <= self.world.now)
+        return {
+            "ApproximateNumberOfMessages": str(visible),
+            "ApproximateNumberOfMessagesNotVisible": str(len(self.messages) - visible),
+        }
+
+    @property
+    def depth(self):
+        return len(self.messages)
+
+
+class FakeSQS:
+    """The SQS client calls the handlers make on queues of the world"""
+
+    def __init__(self, world):
+        self.world = world
+
+    def _queue(self, url):
+        if url not in self.world.queues:
+            raise client_error("AWS.SimpleQueueService.NonExistentQueue", f"No queue {url}", "GetQueueAttributes")
+        return self.world.queues[url]
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=("All",), **kwargs):
+        self.world.recorder.call("sqs", "GetQueueAttributes")
+        attributes = self._queue(QueueUrl).attributes()
+        if "All" not in AttributeNames:
+            attributes = {name: value for name, value in attributes.items() if name in AttributeNames}
+        return {"Attributes": attributes}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries, **kwargs):
+        self.world.recorder.call("sqs", "ChangeMessageVisibilityBatch")
+        queue = self._queue(QueueUrl)
+        successful, failed = [], []
+        for entry in Entries:
+            if queue.change_visibility(entry["ReceiptHandle"], entry["VisibilityTimeout"]):
+                successful.append({"Id": entry["Id"]})
+            else:
+                failed.append({"Id": entry["Id"], "Code": "ReceiptHandleIsInvalid", "SenderFault": True})
+        return {"Successful": successful, "Failed": failed}
@@ -0,0 +1,603 @@
+"""Offline pool simulator.
+
+Runs the real Lambda handlers (launcher, state change handler, stream
+processor, grab and kill simulators) and the local API against the
+in-process AWS stand-ins in bench/fakes.py, drives them with the traffic of
+a scenario file on a virtual clock, and prints a JSON report: grab success
+rate and latency, conditional check failures, time to refill, pool
+occupancy over time, API call counts and the DynamoDB capacity consumed per
+operation and index.
+
+    pip install -r bench/requirements.txt
+    python bench/harness.py bench/scenarios/steady.json [--out report.json] [--capacity]
+
+Grab latencies are simulated API time (per-call latencies from the
+scenario) plus the real time spent in the handler code. Handlers see
+wall-clock timestamps; everything the report measures uses the virtual clock.
+"""
+import argparse
+import copy
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+import warnings
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "infra", "layers", "common"))
+sys.path.append(os.path.join(ROOT, "frontend", "api"))
+
+import boto3  # noqa: E402
+
+import fakes  # noqa: E402
+from fargate_pool import capacity, clients, keys, launches  # noqa: E402
+
+TABLE_NAME = "bench-tasks"
+EVENT_BUS_NAME = "bench-task-events"
+CLUSTER_NAME = "pool"
+QUEUE_URL = f"https://sqs.{fakes.REGION}.amazonaws.com/{fakes.ACCOUNT}/bench-launch-queue"
+
+# Mirrors TasksTable in infra/template.yaml at the last IndexRollout stage
+TABLE_INDEXES = {
+    "StatusShardLeanIndex": (
+        "StatusShard",
+        "SK",
+        ("TaskId", "EcsTaskArn", "AssignedTo", "UpdatedAt", "CapacityProvider"),
+    ),
+    "AvailableIndex": ("AvailableShard", "SK", ("PublicIp", "CapacityProvider")),
+    "LeaseIndex": ("StatusShard", "LeaseExpiresAt", ("TaskId", "EcsTaskArn", "AssignedTo", "Profile")),
+}
+
+# Mirrors the event source mapping of ProcessTaskGrabbedFunction
+STREAM_KEY_PREFIX = "TASK#POOL"
+STREAM_MAX_RETRY_ATTEMPTS = 2
+
+HANDLERS = {
+    "launch_task": "infra/functions/launch_task/app.py",
+    "process_task_grabbed": "infra/functions/process_task_grabbed/app.py",
+    "sim_task_grabber": "infra/functions/sim_task_grabber/app.py",
+    "sim_task_killer": "infra/functions/sim_task_killer/app.py",
+    "api": "frontend/api/app.py",
+}
+
+DEFAULTS = {
+    "name": "unnamed",
+    "seed": 0,
+    "shards": 8,
+    "claim_strategy": "random",
+    "initial_pool": 20,
+    "warmup_seconds": 180,
+    "drain_seconds": 180,
+    "traffic": [],
+    "killer_interval_seconds": 60,
+    "monitor_interval_seconds": 5,
+    "sample_interval_seconds": 10,
+    "stream": {"poll_seconds": 1, "batch_size": 100},
+    "queue": {
+        "batching_window_seconds": 5,
+        "batch_size": 100,
+        "max_concurrency": 15,
+        "visibility_timeout_seconds": 180,
+        "max_receive_count": 20,
+    },
+    # The launcher's shared token bucket, in tasks per second
+    "launch_rate": {"rate": 20, "burst": 100},
+    # Share of the warm pool the launcher keeps on FARGATE_SPOT
+    "spot_percentage": 0,
+    # Share of the sessions the killer ends with a release instead of a kill
+    "recycle_percentage": 0,
+    "ecs": {
+        "startup_seconds": {"dist": "lognormal", "median": 45, "sigma": 0.25},
+        # ECS RUNNING -> container health check HEALTHY
+        "ready_seconds": {"dist": "lognormal", "median": 8, "sigma": 0.4},
+        "startup_failure_rate": 0.0,
+        "capacity_failure_rate": 0.0,
+        "stop_seconds": 30,
+    },
+    "events": {"failure_rate": 0.0, "delivery_seconds": 0.5},
+    "dynamodb": {"unprocessed_rate": 0.0},
+    "api_latency_ms": {"default": {"dist": "lognormal", "median": 5, "sigma": 0.3}},
+    "real_time_scale": 0.1,
+}
+
+GRAB_OUTCOMES = {200: "assigned", 404: "miss", 503: "timeout"}
+
+
+def merge(defaults, overrides):
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def percentiles(values, digits=1):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], digits)
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], digits),
+    }
+
+
+class LambdaContext:
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.function_version = "$LATEST"
+        self.memory_limit_in_mb = 128
+        self.invoked_function_arn = (
+            f"arn:aws:lambda:{fakes.REGION}:{fakes.ACCOUNT}:function:{function_name}"
+        )
+        self.aws_request_id = str(uuid.uuid4())
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+@contextmanager
+def stand_ins(world):
+    """Point boto3, and the clients the handlers create on first use, at `world`"""
+    original = boto3.client, boto3.resource, urllib.request.urlopen
+    boto3.client, boto3.resource = world.client, world.resource
+    # Readiness probes and session resets reach the fake containers
+    urllib.request.urlopen = world.containers.urlopen
+    clients.reset()
+    try:
+        yield
+    finally:
+        boto3.client, boto3.resource, urllib.request.urlopen = original
+        clients.reset()
+
+
+def load_handlers(world, scenario):
+    """Import every handler with boto3 pointing at the stand-ins"""
+    os.environ.update(
+        {
+            "AWS_REGION": fakes.REGION,
+            "AWS_DEFAULT_REGION": fakes.REGION,
+            "POWERTOOLS_SERVICE_NAME": "fargate-pool-bench",
+            "POWERTOOLS_METRICS_NAMESPACE": "FargatePoolBench",
+            "TABLE_NAME": TABLE_NAME,
+            "DYNAMODB_TABLE_NAME": TABLE_NAME,
+            "EVENT_BUS_NAME": EVENT_BUS_NAME,
+            "CLUSTER_NAME": CLUSTER_NAME,
+            "TASK_DEFINITION": "pool-task",
+            "TASK_DEFINITION_CPU": "1024",
+            "TASK_DEFINITION_MEMORY": "2048",
+            "SUBNET_ID1": "subnet-00000001",
+            "SUBNET_ID2": "subnet-00000002",
+            "SECURITY_GROUP_ID": "sg-00000000",
+            "CLAIM_STRATEGY": scenario["claim_strategy"],
+            "POOL_SHARDS": str(scenario["shards"]),
+            "LAUNCH_QUEUE_URL": QUEUE_URL,
+            "RUN_TASK_RATE": str(scenario["launch_rate"]["rate"]),
+            "RUN_TASK_BURST": str(scenario["launch_rate"]["burst"]),
+            # Waiting would stall the virtual clock; unadmitted launches are deferred instead
+            "ADMISSION_WAIT_SECONDS": "0",
+            "SPOT_PERCENTAGE": str(scenario["spot_percentage"]),
+            "RECYCLE_PERCENTAGE": str(scenario["recycle_percentage"]),
+        }
+    )
+    keys.POOL_SHARDS = scenario["shards"]
+
+    cwd = os.getcwd()
+    try:
+        with stand_ins(world), tempfile.TemporaryDirectory() as scratch:
+            os.chdir(scratch)  # the API writes api.log to the working directory
+            modules = {}
+            for name, path in HANDLERS.items():
+                spec = importlib.util.spec_from_file_location(f"bench_{name}", os.path.join(ROOT, path))
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                modules[name] = module
+            return SimpleNamespace(**modules)
+    finally:
+        os.chdir(cwd)
+
+
+def is_pool_state_change(event):
+    """The TaskStateChangeEvent rule of TaskStateChangeFunction"""
+    detail = event["detail"]
+    return (
+        event["source"] == "aws.ecs"
+        and event["detail-type"] == "ECS Task State Change"
+        and detail.get("clusterArn") == fakes.FakeECS.CLUSTER_ARN
+        and detail.get("startedBy") == "fargate-pool"
+        and detail.get("lastStatus") in ("RUNNING", "STOPPED")
+    )
+
+
+class Simulation:
+    def __init__(self, scenario, indexes=TABLE_INDEXES):
+        self.scenario = merge(DEFAULTS, scenario)
+        seed = self.scenario["seed"]
+        random.seed(seed)  # handlers use the module level random functions
+        self.rng = random.Random(seed)
+        self.world = fakes.World(self.rng, self.scenario)
+        self.table = self.world.create_table(TABLE_NAME, "PK", "SK", indexes)
+        queue = self.scenario["queue"]
+        self.queue = fakes.FakeQueue(
+            self.world, queue["visibility_timeout_seconds"], queue["max_receive_count"], QUEUE_URL
+        )
+        self.handlers = load_handlers(self.world, self.scenario)
+        # The launch token bucket refills on the virtual clock, like ECS's own limit
+        self.handlers.launch_task.run_task_bucket.clock = lambda: self.world.now
+        self.start = self.world.now
+
+        self.invocations = Counter()
+        self.handler_errors = Counter()
+        self.grabs = []
+        self._grabs_lock = threading.Lock()
+        self.awaiting_refill = deque()
+        self.refill_seconds = []
+        self.occupancy = []
+        self.dry_seconds = 0.0
+        self.counter_drift = []
+        self.stream_position = 0
+        self.observed_position = 0
+        self.stream_retries = Counter()
+        self.stream_discarded = 0
+        self.partial_stream_batches = 0
+        self.traffic_start = self.start + self.scenario["warmup_seconds"]
+        self.traffic_end = self.traffic_start + sum(
+            phase["seconds"] for phase in self.scenario["traffic"]
+        )
+
+        self.world.events.add_rule(
+            EVENT_BUS_NAME,
+            lambda event: event["source"] == "com.fargate-pool"
+            and event["detail-type"] in ("TaskGrabbed", "LaunchRequested"),
+            lambda event: self.queue.send(json.dumps(event)),
+        )
+        self.world.events.add_rule("default", is_pool_state_change, self.deliver_state_change)
+
+    def elapsed(self):
+        return round(self.world.now - self.start, 3)
+
+    def invoke(self, name, handler, event):
+        self.invocations[name] += 1
+        try:
+            return handler(event, LambdaContext(name))
+        except Exception:
+            logging.getLogger(__name__).exception(f"{name} failed")
+            self.handler_errors[name] += 1
+            return None
+
+    # Event sources
+
+    def deliver_state_change(self, event, attempt=0):
+        if self.invoke("task_state_change", self.handlers.launch_task.state_change_handler, event) is None:
+            # Asynchronous invocations are retried twice
+            if attempt < 2:
+                self.world.schedule(60, self.deliver_state_change, event, attempt + 1)
+
+    def poll_queue(self):
+        settings = self.scenario["queue"]
+        for _ in range(settings["max_concurrency"]):
+            records = self.queue.receive(settings["batch_size"])
+            if not records:
+                return
+            response = self.invoke(
+                "launch_task", self.handlers.launch_task.lambda_handler, {"Records": records}
+            )
+            if response is None:
+                continue  # the whole batch becomes visible again after the timeout
+            failed = {failure["itemIdentifier"] for failure in response.get("batchItemFailures", [])}
+            for record in records:
+                if record["messageId"] not in failed:
+                    self.queue.delete(record["messageId"])
+
+    def poll_stream(self):
+        self.observe_stream()
+        stream = self.table.stream
+        batch, position = [], self.stream_position
+        while position < len(stream) and len(batch) < self.scenario["stream"]["batch_size"]:
+            record = stream[position]
+            position += 1
+            if record["dynamodb"]["Keys"]["PK"]["S"].startswith(STREAM_KEY_PREFIX):
+                batch.append((position - 1, record))
+        if not batch:
+            self.stream_position = position
+            return
+
+        response = self.invoke(
+            "process_task_grabbed",
+            self.handlers.process_task_grabbed.lambda_handler,
+            {"Records": [record for _, record in batch]},
+        )
+        if response is None:
+            failed_sequence = batch[0][1]["dynamodb"]["SequenceNumber"]
+        else:
+            failures = response.get("batchItemFailures", [])
+            failed_sequence = failures[0]["itemIdentifier"] if failures else None
+
+        if failed_sequence is None:
+            self.stream_position = position
+            return
+
+        self.partial_stream_batches += 1
+        self.stream_retries[failed_sequence] += 1
+        index = next(i for i, record in batch if record["dynamodb"]["SequenceNumber"] == failed_sequence)
+        if self.stream_retries[failed_sequence] > STREAM_MAX_RETRY_ATTEMPTS:
+            # Retries exhausted: the rest of the batch is discarded
+            self.stream_discarded += sum(1 for i, _ in batch if i >= index)
+            self.stream_position = position
+        else:
+            self.stream_position = index
+
+    def observe_stream(self):
+        """Pair every task joining the pool, launched or recycled, with the oldest unrefilled grab"""
+        stream = self.table.stream
+        while self.observed_position < len(stream):
+            record = stream[self.observed_position]["dynamodb"]
+            self.observed_position += 1
+            old = record.get("OldImage", {}).get("Status", {}).get("S")
+            new = record.get("NewImage", {}).get("Status", {}).get("S")
+            if old in ("LAUNCHING", "ASSIGNED") and new == "RUNNING" and self.awaiting_refill:
+                self.refill_seconds.append(
+                    record["ApproximateCreationDateTime"] - self.awaiting_refill.popleft()
+                )
+
+    # Traffic
+
+    def grab_via_api(self, user_id):
+        response = self.handlers.api.app.test_client().post("/grab-task", json={"user_id": user_id})
+        return [GRAB_OUTCOMES.get(response.status_code, "error")]
+
+    def grab_via_simulator(self, user_id):
+        return ["assigned" if self.handlers.sim_task_grabber.grab_single_task(user_id) else "miss"]
+
+    def grab_bulk(self, user_ids):
+        response = self.handlers.api.app.test_client().post("/grab-tasks", json={"user_ids": user_ids})
+        if response.status_code not in (200, 404):
+            return ["error"] * len(user_ids)
+        body = response.get_json()
+        return ["assigned" if "task_id" in result else "miss" for result in body["results"]]
+
+    def grab(self, phase, user_ids):
+        via = phase.get("via", "api")
+        started = time.perf_counter()
+        with self.world.recorder.measure() as span:
+            if via == "bulk":
+                outcomes = self.grab_bulk(user_ids)
+            elif via == "simulator":
+                outcomes = self.grab_via_simulator(user_ids[0])
+            else:
+                outcomes = self.grab_via_api(user_ids[0])
+        wall_ms = (time.perf_counter() - started) * 1000
+        with self._grabs_lock:
+            for outcome in outcomes:
+                self.grabs.append(
+                    {
+                        "phase": phase["index"],
+                        "outcome": outcome,
+                        "latency_ms": span.elapsed * 1000 + wall_ms,
+                        "api_ms": span.elapsed * 1000,
+                    }
+                )
+                if outcome == "assigned":
+                    self.awaiting_refill.append(self.world.now)
+
+    def grab_wave(self, phase, count):
+        """All grabs arriving within one second, run concurrently"""
+        if phase.get("via") == "bulk":
+            size = phase.get("users_per_request", 10)
+            requests = [
+                [f"user_{uuid.uuid4().hex[:8]}" for _ in range(min(size, count - i))]
+                for i in range(0, count, size)
+            ]
+        else:
+            requests = [[f"user_{uuid.uuid4().hex[:8]}"] for _ in range(count)]
+
+        with ThreadPoolExecutor(max_workers=phase.get("concurrency", 1)) as executor:
+            list(executor.map(lambda user_ids: self.grab(phase, user_ids), requests))
+
+    def schedule_traffic(self):
+        at = self.traffic_start
+        for index, phase in enumerate(self.scenario["traffic"]):
+            phase = {**phase, "index": index}
+            arrivals = Counter()
+            t = at
+            while phase["rate"] > 0:
+                t += self.rng.expovariate(phase["rate"])
+                if t >= at + phase["seconds"]:
+                    break
+                arrivals[int(t)] += 1
+            for second, count in sorted(arrivals.items()):
+                self.world.schedule(second - self.world.now, self.grab_wave, phase, count)
+            at += phase["seconds"]
+
+    def kill(self):
+        self.invoke("sim_task_killer", self.handlers.sim_task_killer.lambda_handler, {})
+
+    # Measurements
+
+    def sample(self):
+        counts = self.table.count("Status")
+        self.occupancy.append(
+            {
+                "t": self.elapsed(),
+                **{status: counts.get(status, 0) for status in ("LAUNCHING", "RUNNING", "ASSIGNED", "ERROR")},
+                "queued": self.queue.depth,
+            }
+        )
+        if self.traffic_start <= self.world.now < self.traffic_end and not counts.get("RUNNING"):
+            self.dry_seconds += self.scenario["sample_interval_seconds"]
+
+    def monitor(self):
+        """Call /monitor and compare the stream-maintained counters with the table"""
+        response = self.handlers.api.app.test_client().get("/monitor")
+        if response.status_code != 200:
+            self.handler_errors["api_monitor"] += 1
+            return
+        reported = response.get_json()
+        counts = self.table.count("Status")
+        self.counter_drift.append(
+            abs(reported["launching"] - counts.get("LAUNCHING", 0))
+            + abs(reported["available"] - counts.get("RUNNING", 0))
+            + abs(reported["occupied"] - counts.get("ASSIGNED", 0))
+        )
+
+    def every(self, interval, callback, start, until):
+        def tick():
+            callback()
+            if self.world.now + interval <= until:
+                self.world.schedule(interval, tick)
+
+        self.world.schedule(start - self.world.now, tick)
+
+    # Run
+
+    def run(self):
+        scenario = self.scenario
+        end = self.traffic_end + scenario["drain_seconds"]
+        started = time.perf_counter()
+
+        launches.request_launches(
+            self.world.events, EVENT_BUS_NAME, scenario["initial_pool"], "Initial pool"
+        )
+        self.schedule_traffic()
+        self.every(scenario["stream"]["poll_seconds"], self.poll_stream, self.start, end)
+        self.every(scenario["queue"]["batching_window_seconds"], self.poll_queue, self.start, end)
+        self.every(scenario["sample_interval_seconds"], self.sample, self.start, end)
+        self.every(scenario["monitor_interval_seconds"], self.monitor, self.start, end)
+        if scenario["killer_interval_seconds"]:
+            self.every(scenario["killer_interval_seconds"], self.kill, self.traffic_start, self.traffic_end)
+
+        capacity.LEDGER.reset()
+        with stand_ins(self.world):
+            self.world.run_until(end)
+        self.observe_stream()
+        return self.report(time.perf_counter() - started)
+
+    def grab_summary(self, grabs):
+        outcomes = Counter(grab["outcome"] for grab in grabs)
+        return {
+            "attempted": len(grabs),
+            **{outcome: outcomes.get(outcome, 0) for outcome in ("assigned", "miss", "timeout", "error")},
+            "success_rate": round(outcomes["assigned"] / len(grabs), 4) if grabs else None,
+            "latency_ms": percentiles([grab["latency_ms"] for grab in grabs]),
+            "api_latency_ms": percentiles([grab["api_ms"] for grab in grabs]),
+        }
+
+    def report(self, wall_seconds):
+        recorder = self.world.recorder
+        ecs = self.world.ecs
+        return {
+            "scenario": self.scenario["name"],
+            "seed": self.scenario["seed"],
+            "simulated_seconds": self.elapsed(),
+            "wall_seconds": round(wall_seconds, 2),
+            "grabs": {
+                **self.grab_summary(self.grabs),
+                "phases": [
+                    {
+                        "via": phase.get("via", "api"),
+                        "rate": phase["rate"],
+                        **self.grab_summary([g for g in self.grabs if g["phase"] == index]),
+                    }
+                    for index, phase in enumerate(self.scenario["traffic"])
+                ],
+            },
+            "conditional_check_failures": {
+                "total": sum(recorder.conditional_failures.values()),
+                **dict(sorted(recorder.conditional_failures.items())),
+            },
+            "refill_seconds": {
+                **percentiles(self.refill_seconds),
+                "unrefilled": len(self.awaiting_refill),
+            },
+            "dry_seconds": self.dry_seconds,
+            "counter_drift": {
+                "max": max(self.counter_drift, default=0),
+                "mean": round(sum(self.counter_drift) / len(self.counter_drift), 2)
+                if self.counter_drift
+                else 0,
+            },
+            "launches": {
+                "tasks_started": ecs.launched,
+                "capacity_failures": ecs.capacity_failures,
+                "startup_failures": ecs.startup_failures,
+                "run_task_throttled": ecs.throttled,
+                "dead_letters": len(self.queue.dead_letters),
+                "still_queued": self.queue.depth,
+            },
+            "recycle": {
+                "resets": self.world.containers.resets,
+                "reset_failures": self.world.containers.reset_failures,
+            },
+            "stream": {
+                "partial_batches": self.partial_stream_batches,
+                "discarded_records": self.stream_discarded,
+                "failed_put_events_entries": self.world.events.failed_entries,
+            },
+            "invocations": dict(sorted(self.invocations.items())),
+            "handler_errors": dict(sorted(self.handler_errors.items())),
+            "api_calls": dict(sorted(recorder.calls.items())),
+            "consumed_capacity": capacity.report(),
+            "occupancy": self.occupancy,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="+", help="Scenario JSON files")
+    parser.add_argument("--seed", type=int, help="Override the scenario seed")
+    parser.add_argument("--out", help="Write the report to this file instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show handler logs")
+    parser.add_argument(
+        "--capacity",
+        action="store_true",
+        help="Print the DynamoDB capacity consumed per operation and index instead of the report",
+    )
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+        warnings.simplefilter("ignore")
+
+    reports = []
+    for path in args.scenarios:
+        with open(path, "r") as f:
+            scenario = json.load(f)
+        if args.seed is not None:
+            scenario["seed"] = args.seed
+        # Handlers print logs and metrics (EMF) to stdout, keep it for the report
+        with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+            reports.append(Simulation(scenario).run())
+
+    if args.capacity:
+        for report in reports:
+            print(f"{report['scenario']}\n{capacity.format_report(report['consumed_capacity'])}\n")
+
+    output = json.dumps(reports, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    elif not args.capacity:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""DynamoDB capacity of the table's index layout: lean projections against ALL.
+
+Replays harness scenarios twice in the bench's in-memory DynamoDB: with the
+indexes of the template, and with the layout they replaced, where every index
+projects all attributes and the unsharded StatusIndex still copies every row.
+Reported per scenario and operation: read and write units of both layouts and
+the change. `--pool` starts the scenarios with a larger warm pool, so that
+claims read full pages of the available index.
+
+    python bench/index_capacity.py bench/scenarios/steady.json [...] [--pool 400]
+                                   [--out results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import warnings
+from contextlib import redirect_stdout
+
+import harness
+
+LAYOUTS = {
+    "all": {
+        "StatusIndex": ("Status", "SK"),
+        **{name: spec[:2] for name, spec in harness.TABLE_INDEXES.items()},
+    },
+    "lean": harness.TABLE_INDEXES,
+}
+
+
+def consumed(scenario, indexes):
+    """{operation: {"read", "write"}} consumed by one run of `scenario`"""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        report = harness.Simulation(scenario, indexes).run()
+    return {
+        operation: {"read": entry["read"], "write": entry["write"]}
+        for operation, entry in report["consumed_capacity"].items()
+    }
+
+
+def change(before, after):
+    return f"{after / before - 1:+.0%}" if before else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="+", help="Scenario JSON files")
+    parser.add_argument("--pool", type=int, help="Override the scenario initial_pool")
+    parser.add_argument("--out", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    warnings.simplefilter("ignore")
+
+    results = {}
+    for path in args.scenarios:
+        with open(path, "r") as f:
+            scenario = json.load(f)
+        if args.pool is not None:
+            scenario["initial_pool"] = args.pool
+        name = scenario.get("name", os.path.basename(path))
+        results[name] = {layout: consumed(scenario, indexes) for layout, indexes in LAYOUTS.items()}
+
+    for name, layouts in results.items():
+        print(name)
+        print(
+            f"{'operation':<12}{'RCU all':>10}{'RCU lean':>10}{'change':>8}"
+            f"{'WCU all':>10}{'WCU lean':>10}{'change':>8}"
+        )
+        operations = sorted(set(layouts["all"]) | set(layouts["lean"]))
+        for operation in operations:
+            before = layouts["all"].get(operation, {"read": 0.0, "write": 0.0})
+            after = layouts["lean"].get(operation, {"read": 0.0, "write": 0.0})
+            print(
+                f"{operation:<12}{before['read']:>10.1f}{after['read']:>10.1f}"
+                f"{change(before['read'], after['read']):>8}"
+                f"{before['write']:>10.1f}{after['write']:>10.1f}"
+                f"{change(before['write'], after['write']):>8}"
+            )
+        print()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-import boto3
-from boto3.dynamodb.conditions import Key
+import json
 import os
-from datetime import datetime
 import logging
+import queue
+from feed import PoolFeed
+from pool_api import PoolApi
 
 app = Flask(__name__)
 CORS(app)  # This will enable CORS for all routes
@@ -21,99 +22,88 @@ file_formatter = logging.Formatter(
 )
 file_handler.setFormatter(file_formatter)
 logger.addHandler(file_handler)
+logging.getLogger("pool_api").addHandler(file_handler)
 
-dynamodb = boto3.resource("dynamodb", region_name=os.environ.get("AWS_REGION"))
-table_name = os.environ.get("DYNAMODB_TABLE_NAME")
-table = dynamodb.Table(table_name)
+api = PoolApi()
+FEED_INTERVAL_SECONDS = float(os.environ.get("FEED_INTERVAL_SECONDS", "1"))
+FEED_KEEPALIVE_SECONDS = 15
 
 logger.info(
-    f"Initialized with table: {table_name} in region: {os.environ.get('AWS_REGION')}"
+    f"Initialized with table: {api.table_name} in region: {os.environ.get('AWS_REGION')}"
 )
 
 
 @app.route("/grab-task", methods=["POST"])
 def grab_task():
-    user_id = request.json.get("user_id")
-    logger.info(f"Received grab-task request for user: {user_id}")
+    body, status = api.grab_task(request.json)
+    return jsonify(body), status
 
-    if not user_id:
-        logger.warning("Grab-task request received without user ID")
-        return jsonify({"error": "User ID is required"}), 400
 
-    try:
-        response = table.query(
-            IndexName="StatusIndex",
-            KeyConditionExpression=Key("Status").eq("RUNNING"),
-            Limit=1,
-        )
-
-        if not response["Items"]:
-            logger.info("No available tasks found")
-            return jsonify({"error": "No available tasks"}), 404
-
-        task = response["Items"][0]
-        logger.info(f"Found available task: {task['TaskId']}")
-
-        table.update_item(
-            Key={"PK": task["PK"], "SK": task["SK"]},
-            UpdateExpression="SET #status = :new_status, AssignedTo = :user, UpdatedAt = :now",
-            ConditionExpression="#status = :old_status",
-            ExpressionAttributeNames={"#status": "Status"},
-            ExpressionAttributeValues={
-                ":new_status": "ASSIGNED",
-                ":old_status": "RUNNING",
-                ":user": user_id,
-                ":now": datetime.utcnow().isoformat(),
-            },
-        )
-        logger.info(f"Task {task['TaskId']} assigned to user {user_id}")
-
-        return (
-            jsonify(
-                {
-                    "message": "Task grabbed successfully",
-                    "task_id": task["TaskId"],
-                    "public_ip": task.get("PublicIp"),
-                }
-            ),
-            200,
-        )
+@app.route("/grab-tasks", methods=["POST"])
+def grab_tasks():
+    body, status = api.grab_tasks(request.json)
+    return jsonify(body), status
 
-    except Exception as e:
-        logger.error(f"Error in grab_task: {str(e)}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+
+@app.route("/release-task", methods=["POST"])
+def release_task():
+    body, status = api.release_task(request.json)
+    return jsonify(body), status
+
+
+@app.route("/heartbeat", methods=["POST"])
+def heartbeat():
+    body, status = api.heartbeat(request.json)
+    return jsonify(body), status
+
+
+# One upstream reader shared by every connected dashboard
+feed = PoolFeed(api.pool_counts, interval=FEED_INTERVAL_SECONDS)
 
 
 @app.route("/monitor", methods=["GET"])
 def monitor_tasks():
     logger.info("Received monitor request")
     try:
-        statuses = ["LAUNCHING", "RUNNING", "ASSIGNED"]
-        counts = {}
-
-        for status in statuses:
-            response = table.query(
-                IndexName="StatusIndex", KeyConditionExpression=Key("Status").eq(status)
-            )
-            counts[status.lower()] = response["Count"]
-
+        counts = api.pool_counts()
         logger.info(f"Current task counts: {counts}")
-        return (
-            jsonify(
-                {
-                    "launching": counts["launching"],
-                    "available": counts["running"],
-                    "occupied": counts["assigned"],
-                }
-            ),
-            200,
-        )
+        return jsonify(counts), 200
 
     except Exception as e:
         logger.error(f"Error in monitor_tasks: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/capacity", methods=["GET"])
+def consumed_capacity():
+    return jsonify(api.consumed_capacity()), 200
+
+
+@app.route("/monitor/stream", methods=["GET"])
+def monitor_stream():
+    """Server-Sent Events: a `snapshot` of the pool counts, then `delta` events"""
+    logger.info("Received monitor stream request")
+
+    def events():
+        subscriber = feed.subscribe()
+        try:
+            while not subscriber.lagging:
+                try:
+                    event, data = subscriber.get(timeout=FEED_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            feed.unsubscribe(subscriber)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     logger.info("Starting the Flask application")
-    app.run(host="0.0.0.0", port=5000)
+    app.run(host="0.0.0.0", port=5000, threaded=True)  # One thread per stream client
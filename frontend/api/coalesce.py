@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+
+class Coalescer:
+    """Single-flight reads with a short-lived cache.
+
+    Concurrent callers of `get` share one in-flight call of `fetch`, and its
+    result is served from memory for `ttl` seconds afterwards, so a burst of
+    identical reads costs one upstream call. Errors are passed to every
+    waiting caller and are not cached.
+    """
+
+    def __init__(self, fetch, ttl):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._value = None
+        self._fetched_at = None
+        self._inflight = None
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def fresh(self):
+        return self._fetched_at is not None and time.monotonic() - self._fetched_at < self._ttl
+
+    async def get(self):
+        if self.fresh():
+            self.cache_hits += 1
+            return self._value
+
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        else:
+            self.coalesced += 1
+        # A caller that gives up must not cancel the read the others wait for
+        return await asyncio.shield(self._inflight)
+
+    async def _refresh(self):
+        self.upstream_calls += 1
+        try:
+            value = await self._fetch()
+            self._value, self._fetched_at = value, time.monotonic()
+            return value
+        finally:
+            self._inflight = None
@@ -0,0 +1,97 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """One connected client. Messages are (event, data) tuples."""
+
+    def __init__(self, max_pending):
+        self.messages = queue.Queue(maxsize=max_pending)
+        self.lagging = False
+
+    def get(self, timeout):
+        return self.messages.get(timeout=timeout)
+
+
+class PoolFeed:
+    """Fans pool state out to any number of subscribers.
+
+    A single background thread reads the pool counts once per `interval`
+    and sends every subscriber the fields that changed since the previous
+    tick, so a burst of state changes becomes one delta per tick and the
+    upstream read cost does not depend on the number of viewers. New
+    subscribers first receive the latest snapshot. The thread only polls
+    while someone is subscribed.
+    """
+
+    def __init__(self, read_counts, interval=1.0, max_pending=100):
+        self._read_counts = read_counts
+        self._interval = interval
+        self._max_pending = max_pending
+        self._subscribers = set()
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    def subscribe(self):
+        subscriber = Subscriber(self._max_pending)
+        with self._lock:
+            if self._snapshot is not None:
+                subscriber.messages.put(("snapshot", self._snapshot))
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        logger.info(f"Feed subscriber added, {len(self._subscribers)} connected")
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        logger.info(f"Feed subscriber removed, {len(self._subscribers)} connected")
+
+    def _broadcast(self, event, data):
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.messages.put_nowait((event, data))
+            except queue.Full:
+                # A client that stopped reading is dropped; it resyncs from a
+                # fresh snapshot when it reconnects
+                subscriber.lagging = True
+                self._subscribers.discard(subscriber)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._subscribers:
+                    # Nobody is watching; forget the snapshot so the next viewer gets a fresh one
+                    self._snapshot = None
+                    self._wakeup.wait()
+
+            try:
+                counts = self._read_counts()
+            except Exception as e:
+                logger.error(f"Error reading pool state for feed: {str(e)}", exc_info=True)
+                time.sleep(self._interval)
+                continue
+
+            with self._lock:
+                if self._snapshot is None:
+                    self._broadcast("snapshot", counts)
+                else:
+                    delta = {
+                        field: value
+                        for field, value in counts.items()
+                        if self._snapshot.get(field) != value
+                    }
+                    if delta:
+                        self._broadcast("delta", delta)
+                self._snapshot = counts
+
+            time.sleep(self._interval)
@@ -0,0 +1,268 @@
+"""Pool operations behind the API routes.
+
+Shared by the Flask app (app.py) and the asyncio server (server.py). Every
+operation takes the JSON body of the request and returns the response body
+and status code, so the servers only differ in how they run them.
+"""
+import logging
+import os
+import time
+
+from fargate_pool import capacity, claim, clients, counters, keys, leases, profiles, recycle
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_GRAB = 500
+
+
+def profile_counts(pool, profile):
+    counts = counters.profile_counts(pool, profile)
+    return {
+        "launching": counts["LAUNCHING"],
+        "available": counts["RUNNING"],
+        "occupied": counts["ASSIGNED"],
+    }
+
+
+class PoolApi:
+    def __init__(self):
+        self.table_name = os.environ.get("DYNAMODB_TABLE_NAME")
+        # Operations other than grabs record their consumed capacity under their own name
+        self.table = clients.table(self.table_name, operation=capacity.GRAB)
+        self.ecs = clients.client("ecs")
+        self.registry = profiles.Registry(self.table)
+        self.cluster_name = os.environ.get("CLUSTER_NAME")
+        self.claim_strategy = os.environ.get("CLAIM_STRATEGY", "random")
+        # Sessions up to this long are handed spot tasks first
+        self.short_session_minutes = float(os.environ.get("SHORT_SESSION_MINUTES", "30"))
+        # Released tasks are retired instead of reused past these limits
+        self.max_reuse = int(os.environ.get("MAX_REUSE", str(recycle.MAX_REUSE)))
+        self.max_age_seconds = int(
+            os.environ.get("MAX_AGE_SECONDS", str(recycle.MAX_AGE_SECONDS))
+        )
+        # Counting expired leases takes a query per shard; the sweeper only runs every minute
+        self.expired_leases_ttl = float(os.environ.get("EXPIRED_LEASES_CACHE_SECONDS", "15"))
+        self._expired_leases = (0, float("-inf"))
+
+    def spot_preference(self, body):
+        """True for short sessions, False for long ones, None without a `session_minutes` hint"""
+        minutes = body.get("session_minutes")
+        if minutes is None:
+            return None
+        if isinstance(minutes, bool) or not isinstance(minutes, (int, float)):
+            raise ValueError("session_minutes must be a number")
+        return minutes <= self.short_session_minutes
+
+    def requested_profile(self, body):
+        """The pool profile to claim from and the profiles to fall back to"""
+        name = body.get("profile", keys.DEFAULT_PROFILE)
+        known = self.registry.all()
+        if name not in known:
+            raise ValueError(f"Unknown profile: {name}")
+        fallback = body.get("fallback", False)
+        if not isinstance(fallback, bool):
+            raise ValueError("fallback must be a boolean")
+        return name, profiles.larger_profiles(known, name) if fallback else []
+
+    def grab_task(self, body):
+        user_id = body.get("user_id")
+        logger.info(f"Received grab-task request for user: {user_id}")
+
+        if not user_id:
+            logger.warning("Grab-task request received without user ID")
+            return {"error": "User ID is required"}, 400
+
+        try:
+            prefer_spot = self.spot_preference(body)
+            profile, fallbacks = self.requested_profile(body)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        try:
+            result = claim.claim_task(
+                self.table,
+                user_id,
+                strategy=self.claim_strategy,
+                prefer_spot=prefer_spot,
+                profile=profile,
+                fallbacks=fallbacks,
+            )
+
+            if result.task is None:
+                logger.info(
+                    f"No task claimed after {result.attempts} attempts "
+                    f"({result.conflicts} conflicts, timed out: {result.timed_out})"
+                )
+                if result.timed_out:
+                    return {"error": "Timed out claiming a task", "attempts": result.attempts}, 503
+                return {"error": "No available tasks", "attempts": result.attempts}, 404
+
+            task = result.task
+            logger.info(
+                f"Task {task['TaskId']} assigned to user {user_id} after {result.attempts} attempts "
+                f"in {result.elapsed * 1000:.1f} ms"
+            )
+
+            return (
+                {
+                    "message": "Task grabbed successfully",
+                    "task_id": task["TaskId"],
+                    "public_ip": task.get("PublicIp"),
+                    "capacity_provider": task.get("CapacityProvider", "FARGATE"),
+                    "profile": keys.profile_of(task),
+                    "lease_expires_at": int(task["LeaseExpiresAt"]),
+                    "attempts": result.attempts,
+                },
+                200,
+            )
+
+        except Exception as e:
+            logger.error(f"Error in grab_task: {str(e)}", exc_info=True)
+            return {"error": str(e)}, 500
+
+    def grab_tasks(self, body):
+        user_ids = body.get("user_ids")
+
+        if not user_ids or not isinstance(user_ids, list):
+            logger.warning("Grab-tasks request received without user IDs")
+            return {"error": "A list of user IDs is required"}, 400
+
+        if not all(isinstance(user_id, str) and user_id for user_id in user_ids):
+            return {"error": "User IDs must be non-empty strings"}, 400
+
+        logger.info(f"Received grab-tasks request for {len(user_ids)} users")
+
+        if len(user_ids) > MAX_BULK_GRAB:
+            return {"error": f"At most {MAX_BULK_GRAB} users per request"}, 400
+
+        try:
+            prefer_spot = self.spot_preference(body)
+            profile, fallbacks = self.requested_profile(body)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        try:
+            result = claim.claim_tasks(
+                self.table, user_ids, prefer_spot=prefer_spot, profile=profile, fallbacks=fallbacks
+            )
+            logger.info(
+                f"Assigned {len(result.assigned)}/{len(user_ids)} tasks in {result.transactions} "
+                f"transactions ({result.conflicts} conflicts, {result.elapsed * 1000:.1f} ms)"
+            )
+
+            results = []
+            for user_id in dict.fromkeys(user_ids):
+                task = result.assigned.get(user_id)
+                if task is None:
+                    results.append({"user_id": user_id, "error": "No available tasks"})
+                else:
+                    results.append(
+                        {
+                            "user_id": user_id,
+                            "task_id": task["TaskId"],
+                            "public_ip": task.get("PublicIp"),
+                            "capacity_provider": task.get("CapacityProvider", "FARGATE"),
+                            "profile": keys.profile_of(task),
+                            "lease_expires_at": int(task["LeaseExpiresAt"]),
+                        }
+                    )
+
+            return (
+                {
+                    "results": results,
+                    "assigned": len(result.assigned),
+                    "short": len(result.short),
+                },
+                200 if result.assigned else 404,
+            )
+
+        except Exception as e:
+            logger.error(f"Error in grab_tasks: {str(e)}", exc_info=True)
+            return {"error": str(e)}, 500
+
+    def release_task(self, body):
+        task_id = body.get("task_id")
+        user_id = body.get("user_id")
+        logger.info(f"Received release-task request for task {task_id} from user {user_id}")
+
+        if not task_id or not user_id:
+            return {"error": "Task ID and user ID are required"}, 400
+
+        try:
+            result = recycle.release_task(
+                self.table.for_operation(capacity.RELEASE),
+                self.ecs,
+                self.cluster_name,
+                task_id,
+                user_id,
+                max_reuse=self.max_reuse,
+                max_age_seconds=self.max_age_seconds,
+            )
+        except recycle.ReleaseError as e:
+            return {"error": str(e)}, 409
+        except Exception as e:
+            logger.error(f"Error in release_task: {str(e)}", exc_info=True)
+            return {"error": str(e)}, 500
+
+        if result.outcome == recycle.NOT_ASSIGNED:
+            return {"error": result.reason}, 409
+
+        logger.info(f"Task {task_id} {result.outcome} {result.reason}".rstrip())
+        return (
+            {
+                "task_id": task_id,
+                "outcome": result.outcome,
+                "reason": result.reason,
+                "reuse_count": int(result.task.get("ReuseCount", 0)),
+            },
+            200,
+        )
+
+    def heartbeat(self, body):
+        task_id = body.get("task_id")
+        user_id = body.get("user_id")
+
+        if not task_id or not user_id:
+            return {"error": "Task ID and user ID are required"}, 400
+
+        try:
+            expiry = leases.heartbeat(
+                self.table.for_operation(capacity.HEARTBEAT), task_id, user_id
+            )
+        except leases.LeaseError as e:
+            return {"error": str(e)}, 409
+        except Exception as e:
+            logger.error(f"Error in heartbeat: {str(e)}", exc_info=True)
+            return {"error": str(e)}, 500
+        return {"task_id": task_id, "lease_expires_at": expiry}, 200
+
+    def expired_leases(self, table):
+        """Occupied tasks whose user stopped heartbeating, recounted every `expired_leases_ttl` s"""
+        count, counted_at = self._expired_leases
+        now = time.time()
+        if now - counted_at >= self.expired_leases_ttl:
+            count = leases.count_expired(table, self.registry.all(), now)
+            self._expired_leases = (count, now)
+        return count
+
+    def pool_counts(self):
+        table = self.table.for_operation(capacity.MONITOR)
+        pool = counters.read_counts(table)
+        # Until the sweeper reclaims them
+        expired = self.expired_leases(table)
+        return {
+            "launching": pool.get("LAUNCHING", 0),
+            "available": pool.get("RUNNING", 0),
+            "occupied": pool.get("ASSIGNED", 0),
+            "occupied_live": max(pool.get("ASSIGNED", 0) - expired, 0),
+            "occupied_expired": expired,
+            "draining": pool.get("DRAINING", 0),
+            "launching_spot": pool.get(counters.provider_field("LAUNCHING", claim.SPOT), 0),
+            "available_spot": pool.get(counters.provider_field("RUNNING", claim.SPOT), 0),
+            "occupied_spot": pool.get(counters.provider_field("ASSIGNED", claim.SPOT), 0),
+            "profiles": {name: profile_counts(pool, name) for name in self.registry.all()},
+        }
+
+    def consumed_capacity(self):
+        """DynamoDB capacity this API process has consumed, per operation and index"""
+        return capacity.report()
@@ -0,0 +1,189 @@
+"""The pool API on asyncio (aiohttp), for serving many concurrent users.
+
+Same routes and responses as app.py. Requests are handled on one event
+loop, and the blocking DynamoDB calls of the pool operations run on a
+thread pool sized to the clients' connection pool, so a slow table round
+trip holds a connection rather than a server worker.
+
+- `/monitor` reads go through a single-flight cache: concurrent requests
+  share one counter read, and its result is reused for
+  MONITOR_CACHE_SECONDS. `/monitor/stream` clients read from the same cache.
+- Claims (`/grab-task`, `/grab-tasks`) are admitted MAX_CONCURRENT_CLAIMS at
+  a time. A claim that waits longer than CLAIM_QUEUE_SECONDS for its turn
+  gets a 503 instead of piling onto the table.
+
+    API_SERVER=async make run-api
+"""
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from coalesce import Coalescer
+from fargate_pool import clients
+from pool_api import PoolApi
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+file_handler = logging.FileHandler("api.log")
+file_handler.setLevel(logging.INFO)
+file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+logger.addHandler(file_handler)
+logging.getLogger("pool_api").addHandler(file_handler)
+
+MAX_CONCURRENT_CLAIMS = int(os.environ.get("MAX_CONCURRENT_CLAIMS", "16"))
+CLAIM_QUEUE_SECONDS = float(os.environ.get("CLAIM_QUEUE_SECONDS", "2"))
+MONITOR_CACHE_SECONDS = float(os.environ.get("MONITOR_CACHE_SECONDS", "1"))
+FEED_INTERVAL_SECONDS = float(os.environ.get("FEED_INTERVAL_SECONDS", "1"))
+FEED_KEEPALIVE_SECONDS = 15
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+
+class PoolServer:
+    def __init__(self, api, workers=clients.MAX_POOL_CONNECTIONS):
+        self.api = api
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pool-api")
+        self.claims = asyncio.Semaphore(MAX_CONCURRENT_CLAIMS)
+        self.monitor = Coalescer(lambda: self.run(self.api.pool_counts), MONITOR_CACHE_SECONDS)
+
+    async def run(self, operation, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, operation, *args)
+
+    async def body(self, request):
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise web.HTTPBadRequest(
+                text=json.dumps({"error": "Invalid JSON body"}), content_type="application/json"
+            )
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(
+                text=json.dumps({"error": "Expected a JSON object"}), content_type="application/json"
+            )
+        return body
+
+    async def claim(self, operation, request):
+        body = await self.body(request)
+        try:
+            await asyncio.wait_for(self.claims.acquire(), CLAIM_QUEUE_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"Claim not admitted within {CLAIM_QUEUE_SECONDS} s")
+            return web.json_response({"error": "Too many concurrent claims"}, status=503)
+        try:
+            payload, status = await self.run(operation, body)
+        finally:
+            self.claims.release()
+        return web.json_response(payload, status=status)
+
+    async def grab_task(self, request):
+        return await self.claim(self.api.grab_task, request)
+
+    async def grab_tasks(self, request):
+        return await self.claim(self.api.grab_tasks, request)
+
+    async def release_task(self, request):
+        payload, status = await self.run(self.api.release_task, await self.body(request))
+        return web.json_response(payload, status=status)
+
+    async def heartbeat(self, request):
+        payload, status = await self.run(self.api.heartbeat, await self.body(request))
+        return web.json_response(payload, status=status)
+
+    async def monitor_tasks(self, request):
+        logger.info("Received monitor request")
+        try:
+            counts = await self.monitor.get()
+        except Exception as e:
+            logger.error(f"Error in monitor_tasks: {str(e)}", exc_info=True)
+            return web.json_response({"error": str(e)}, status=500)
+        return web.json_response(counts)
+
+    async def consumed_capacity(self, request):
+        return web.json_response(self.api.consumed_capacity())
+
+    async def monitor_stream(self, request):
+        """Server-Sent Events: a `snapshot` of the pool counts, then `delta` events"""
+        logger.info("Received monitor stream request")
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            }
+        )
+        await response.prepare(request)
+
+        loop = asyncio.get_running_loop()
+        snapshot, last_sent = None, loop.time()
+        try:
+            while True:
+                try:
+                    counts = await self.monitor.get()
+                except Exception as e:
+                    logger.error(f"Error reading pool state for feed: {str(e)}", exc_info=True)
+                    counts = None
+
+                message = None
+                if counts is not None and snapshot is None:
+                    message = f"event: snapshot\ndata: {json.dumps(counts)}\n\n"
+                elif counts is not None:
+                    delta = {
+                        field: value for field, value in counts.items() if snapshot.get(field) != value
+                    }
+                    if delta:
+                        message = f"event: delta\ndata: {json.dumps(delta)}\n\n"
+                if counts is not None:
+                    snapshot = counts
+
+                if message is None and loop.time() - last_sent >= FEED_KEEPALIVE_SECONDS:
+                    message = ": keep-alive\n\n"
+                if message is not None:
+                    await response.write(message.encode())
+                    last_sent = loop.time()
+
+                await asyncio.sleep(FEED_INTERVAL_SECONDS)
+        except ConnectionResetError:
+            logger.info("Monitor stream client disconnected")
+        return response
+
+
+async def preflight(request):
+    return web.Response()
+
+
+async def add_cors_headers(request, response):
+    response.headers.update(CORS_HEADERS)
+
+
+def create_app(api=None):
+    server = PoolServer(api or PoolApi())
+    app = web.Application()
+    app.on_response_prepare.append(add_cors_headers)
+    app.add_routes(
+        [
+            web.post("/grab-task", server.grab_task),
+            web.post("/grab-tasks", server.grab_tasks),
+            web.post("/release-task", server.release_task),
+            web.post("/heartbeat", server.heartbeat),
+            web.get("/monitor", server.monitor_tasks),
+            web.get("/monitor/stream", server.monitor_stream),
+            web.get("/capacity", server.consumed_capacity),
+            web.options("/{path:.*}", preflight),
+        ]
+    )
+    app.on_cleanup.append(lambda app: asyncio.to_thread(server.executor.shutdown))
+    return app
+
+
+if __name__ == "__main__":
+    logger.info("Starting the asyncio application")
+    web.run_app(create_app(), host="0.0.0.0", port=5000, access_log=None)
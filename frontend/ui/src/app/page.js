@@ -12,19 +12,22 @@ export default function Home() {
   const [isLoading, setIsLoading] = useState(false);
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await axios.get("http://localhost:5001/monitor");
-        setTaskCounts(response.data);
-      } catch (error) {
-        console.error("Error fetching task counts:", error);
-      }
-    };
+    // The API pushes a snapshot on connect and then only the counts that changed
+    const source = new EventSource("http://localhost:5001/monitor/stream");
 
-    fetchData(); // Fetch immediately on mount
-    const interval = setInterval(fetchData, 1000); // Then fetch every second
+    source.addEventListener("snapshot", (event) => {
+      setTaskCounts(JSON.parse(event.data));
+    });
+    source.addEventListener("delta", (event) => {
+      const delta = JSON.parse(event.data);
+      setTaskCounts((counts) => ({ ...counts, ...delta }));
+    });
+    source.onerror = (error) => {
+      // EventSource reconnects by itself and receives a fresh snapshot
+      console.error("Task count stream interrupted:", error);
+    };
 
-    return () => clearInterval(interval); // Clean up on unmount
+    return () => source.close(); // Clean up on unmount
   }, []);
 
   const grabTask = async () => {
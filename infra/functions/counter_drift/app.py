@@ -0,0 +1,57 @@
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from fargate_pool import capacity, clients, counters, profiles
+import os
+
+logger = Logger()
+metrics = Metrics()
+
+table = clients.table(os.environ["TABLE_NAME"], operation=capacity.DRIFT)
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
+def lambda_handler(event: dict, context: LambdaContext):
+    previous = counters.read_drift(table)
+    recorded = counters.read_counts(table)
+    actual = counters.count_statuses(table, profiles=list(profiles.load_profiles(table)))
+
+    # Statuses we no longer count, e.g. shards removed by a resharding
+    fields = set(actual) | {
+        field for field in recorded if field.split("#")[0] in counters.STATUSES
+    }
+    drift = {field: actual[field] - recorded.get(field, 0) for field in fields}
+    drift = {field: delta for field, delta in drift.items() if delta}
+
+    total_drift = sum(abs(delta) for field, delta in drift.items() if "#" not in field)
+    metrics.add_metric(name="CounterDrift", unit=MetricUnit.Count, value=total_drift)
+
+    # The counters and the index are read apart, so a transition indexed before
+    # the stream applied it looks like drift that the stream is about to correct.
+    # Only drift two checks in a row saw unchanged is corrected.
+    confirmed = {field: delta for field, delta in drift.items() if previous.get(field) == delta}
+    pending = {field: delta for field, delta in drift.items() if field not in confirmed}
+
+    if confirmed:
+        logger.warning(f"Pool counters drifted, correcting: {confirmed}")
+        # ADD the difference rather than SET the recount, so stream updates
+        # landing in the meantime are not overwritten
+        counters.apply_deltas(table, confirmed)
+    if pending:
+        logger.info(f"Pool counters differ from the index, correcting if seen again: {pending}")
+    if not drift:
+        logger.info(f"Pool counters are accurate: {dict(actual)}")
+    metrics.add_metric(
+        name="CounterDriftCorrected",
+        unit=MetricUnit.Count,
+        value=sum(abs(delta) for field, delta in confirmed.items() if "#" not in field),
+    )
+
+    if pending or previous:
+        counters.write_drift(table, pending)
+
+    return {
+        "statusCode": 200,
+    }
@@ -1,18 +1,33 @@
-import boto3
 import os
 import json
 import time
+from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime
 from aws_lambda_powertools import Logger, Metrics
-from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.metrics import MetricUnit, single_metric
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from fargate_pool import (
+    capacity,
+    clients,
+    counters,
+    history,
+    keys,
+    launch_phases,
+    launches,
+    profiles,
+    ratelimit,
+    readiness,
+    retire,
+)
 
 logger = Logger()
 metrics = Metrics()
 
-ecs = boto3.client("ecs")
-ec2 = boto3.client("ec2")
-dynamodb = boto3.resource("dynamodb")
+ecs = clients.client("ecs")
+ec2 = clients.client("ec2")
+events_client = clients.client("events")
+sqs = clients.client("sqs")
 
 CLUSTER_NAME = os.environ["CLUSTER_NAME"]
 TASK_DEFINITION = os.environ["TASK_DEFINITION"]
@@ -20,8 +35,40 @@ TABLE_NAME = os.environ["TABLE_NAME"]
 SUBNET_ID1 = os.environ["SUBNET_ID1"]
 SUBNET_ID2 = os.environ["SUBNET_ID2"]
 SECURITY_GROUP_ID = os.environ["SECURITY_GROUP_ID"]
-
-table = dynamodb.Table(TABLE_NAME)
+EVENT_BUS_NAME = os.environ["EVENT_BUS_NAME"]
+MAX_LAUNCH_ATTEMPTS = int(os.environ.get("MAX_LAUNCH_ATTEMPTS", "3"))
+# Unset for stacks deployed before the launch queue URL was passed in
+LAUNCH_QUEUE_URL = os.environ.get("LAUNCH_QUEUE_URL")
+# Sustained and burst Fargate task launch rate, shared by all launchers
+RUN_TASK_RATE = float(os.environ.get("RUN_TASK_RATE", "20"))
+RUN_TASK_BURST = int(os.environ.get("RUN_TASK_BURST", "100"))
+# How long a launcher waits for launch tokens before deferring its slots
+ADMISSION_WAIT_SECONDS = float(os.environ.get("ADMISSION_WAIT_SECONDS", "10"))
+# Share of the warm pool (LAUNCHING + RUNNING) to keep on Fargate Spot
+SPOT_PERCENTAGE = float(os.environ.get("SPOT_PERCENTAGE", "0"))
+# When a started task may join the pool, see fargate_pool.readiness
+READINESS_GATE = os.environ.get("READINESS_GATE", "health")
+READINESS_PATH = os.environ.get("READINESS_PATH", "/ready")
+READINESS_PORT = int(os.environ.get("READINESS_PORT", "80"))
+READINESS_TIMEOUT_SECONDS = float(os.environ.get("READINESS_TIMEOUT_SECONDS", "20"))
+
+# ECS accepts at most 10 tasks per RunTask call
+RUN_TASK_MAX_COUNT = 10
+# Marks pool tasks so the state change rule only matches them
+STARTED_BY = "fargate-pool"
+# SQS changes the visibility of at most 10 messages per call
+VISIBILITY_BATCH_MAX = 10
+
+# Launch slot outcomes; dropped slots belong to a profile that no longer exists
+STARTED, DEFERRED, FAILED, DROPPED = "started", "deferred", "failed", "dropped"
+
+ON_DEMAND, SPOT = "FARGATE", "FARGATE_SPOT"
+WARM_STATUSES = ("LAUNCHING", "RUNNING")
+
+table = clients.table(TABLE_NAME, operation=capacity.LAUNCH)
+# One token is one task: Fargate limits the task launch rate, not just RunTask calls
+run_task_bucket = ratelimit.SharedTokenBucket(table, "RunTask", RUN_TASK_RATE, RUN_TASK_BURST)
+registry = profiles.Registry(table)
 
 
 def get_task_failure_reason(task_details):
@@ -44,154 +91,619 @@ def get_task_failure_reason(task_details):
     return "Unknown failure reason"
 
 
-def launch_task():
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+@dataclass
+class RunTasksResult:
+    tasks: list = field(default_factory=list)
+    # How long the RunTask call of each started task took
+    call_seconds: list = field(default_factory=list)
+    failures: list = field(default_factory=list)
+    # Slots to retry later: ECS throttled, or had no capacity for them
+    throttled: int = 0
+    no_capacity: int = 0
+
+
+def run_task_options(profile):
+    """RunTask parameters that give a task the shape and placement of `profile`"""
+    options = {
+        "taskDefinition": profile.task_definition,
+        "group": profile.group,
+        "networkConfiguration": {
+            "awsvpcConfiguration": {
+                "subnets": profile.subnets or [SUBNET_ID1, SUBNET_ID2],
+                "securityGroups": [SECURITY_GROUP_ID],
+                "assignPublicIp": "ENABLED",
+            }
+        },
+    }
+    if profile.overrides():
+        options["overrides"] = profile.overrides()
+    return options
+
+
+def run_tasks(count, capacity_provider, profile):
+    """Start up to `count` tasks of `profile` on `capacity_provider` with as few RunTask calls as possible"""
+    result = RunTasksResult()
+    options = run_task_options(profile)
+
+    batches = list(chunks(range(count), RUN_TASK_MAX_COUNT))
+    for i, batch in enumerate(batches):
+        call_started = time.monotonic()
+        try:
+            response = ecs.run_task(
+                cluster=CLUSTER_NAME,
+                capacityProviderStrategy=[{"capacityProvider": capacity_provider, "weight": 1}],
+                count=len(batch),
+                startedBy=STARTED_BY,
+                **options,
+            )
+        except Exception as e:
+            if clients.is_throttling(e):
+                # Still throttled after the client's retries: make every launcher
+                # back off and retry this and the remaining slots later
+                logger.warning(f"RunTask throttled, deferring {count - i * RUN_TASK_MAX_COUNT} tasks")
+                metrics.add_metric(name="RunTaskThrottled", unit=MetricUnit.Count, value=1)
+                run_task_bucket.drain()
+                result.throttled += sum(len(rest) for rest in batches[i:])
+                break
+            logger.exception(f"RunTask failed for {len(batch)} tasks")
+            result.failures.extend([str(e)] * len(batch))
+            continue
+
+        result.tasks.extend(response["tasks"])
+        result.call_seconds.extend([time.monotonic() - call_started] * len(response["tasks"]))
+        reasons = [failure.get("reason", "Unknown reason") for failure in response["failures"]]
+        no_capacity_reasons = [
+            reason for reason in reasons if ratelimit.is_capacity_failure(reason)
+        ]
+        if no_capacity_reasons:
+            logger.warning(
+                f"No {capacity_provider} capacity for {len(no_capacity_reasons)} tasks: "
+                f"{no_capacity_reasons[0]}"
+            )
+            result.no_capacity += len(no_capacity_reasons)
+        result.failures.extend(
+            reason for reason in reasons if not ratelimit.is_capacity_failure(reason)
+        )
+        # ECS may report fewer failures than missing tasks, keep the slot count exact
+        missing = len(batch) - len(response["tasks"]) - len(reasons)
+        result.failures.extend(["Task not started"] * max(missing, 0))
+
+    return result
+
+
+def spot_slots(count):
+    """How many of `count` new tasks to put on spot to keep the warm pool at SPOT_PERCENTAGE"""
+    if SPOT_PERCENTAGE <= 0:
+        return 0
+    if SPOT_PERCENTAGE >= 100:
+        return count
+    pool = counters.read_counts(table)
+    warm = sum(pool.get(status, 0) for status in WARM_STATUSES)
+    warm_spot = sum(pool.get(counters.provider_field(status, SPOT), 0) for status in WARM_STATUSES)
+    target = round((warm + count) * SPOT_PERCENTAGE / 100)
+    return max(0, min(count, target - warm_spot))
+
+
+def start_tasks(count, profile):
+    """Start `count` tasks of `profile` in the configured spot/on-demand mix.
+
+    Spot slots without spot capacity are launched on on-demand Fargate
+    instead. Returns the combined RunTasksResult.
+    """
+    spot = spot_slots(count)
+    result = RunTasksResult()
+    on_demand = count - spot
+
+    if spot:
+        result = run_tasks(spot, SPOT, profile)
+        if result.no_capacity:
+            logger.info(f"Falling back to on-demand for {result.no_capacity} spot tasks")
+            metrics.add_metric(
+                name="SpotFallbacks", unit=MetricUnit.Count, value=result.no_capacity
+            )
+            on_demand += result.no_capacity
+            result.no_capacity = 0
+
+    if on_demand and result.throttled:
+        result.throttled += on_demand
+    elif on_demand:
+        fallback = run_tasks(on_demand, ON_DEMAND, profile)
+        result.tasks += fallback.tasks
+        result.call_seconds += fallback.call_seconds
+        result.failures += fallback.failures
+        result.throttled += fallback.throttled
+        result.no_capacity += fallback.no_capacity
+
+    return result
+
+
+def requested_at(event):
+    """Epoch seconds at which a grab or launch request event was published"""
+    if "time" not in event:
+        return None
+    return launch_phases.parse_time(event["time"]).timestamp()
+
+
+def launch_tasks(attempts, requested=None, profile=None, generations=None):
+    """Start one task of `profile` (the default one if None) per launch slot and register it as LAUNCHING.
+
+    `attempts` holds the launch attempt number of each slot, `requested`
+    when each slot was requested (epoch seconds, or None) and `generations`
+    its round of reconciler restarts (1 if None). Returns one
+    outcome per slot: STARTED if ECS accepted the task, DEFERRED if it
+    should be retried after a backoff, FAILED otherwise.
+    Completion is handled by `state_change_handler`.
+    """
+    invoked = time.time()
+    requested = requested or [None] * len(attempts)
+    generations = generations or [1] * len(attempts)
+    profile = profile or registry.get(keys.DEFAULT_PROFILE)
+    started = start_tasks(len(attempts), profile)
+    ecs_tasks, run_failures, call_seconds = started.tasks, started.failures, started.call_seconds
+    deferred = started.throttled + started.no_capacity
+    for reason in run_failures:
+        logger.error(f"ECS could not start task: {reason}")
+
     timestamp = datetime.utcnow().isoformat()
-    task_id = f"task_{timestamp}"
-    start_time = time.time()
-
-    # Create initial entry in DynamoDB
-    table.put_item(
-        Item={
-            "PK": "TASK#POOL",
-            "SK": f"TASK#{task_id}",
-            "TaskId": task_id,
-            "Status": "LAUNCHING",
-            "CreatedAt": timestamp,
-            "UpdatedAt": timestamp,
-        }
-    )
-    logger.info(f"Created initial task entry for {task_id}")
+    write_started = time.monotonic()
+    with table.batch_writer() as batch:
+        for ecs_task, attempt, generation, requested_time, run_task_seconds in zip(
+            ecs_tasks, attempts, generations, requested, call_seconds
+        ):
+            # Launcher side phases travel on the row to the state change handler
+            phases = {"RunTaskApi": run_task_seconds}
+            if requested_time is not None:
+                phases["Queue"] = max(invoked - requested_time, 0.0)
+
+            # Rows are keyed by the ECS task id, so state change events map straight to a row
+            batch.put_item(
+                Item=keys.task_item(
+                    keys.task_id_from_arn(ecs_task["taskArn"]),
+                    "LAUNCHING",
+                    EcsTaskArn=ecs_task["taskArn"],
+                    LaunchAttempt=attempt,
+                    LaunchGeneration=generation,
+                    Profile=profile.name,
+                    CapacityProvider=ecs_task.get("capacityProviderName", ON_DEMAND),
+                    LaunchPhases=launch_phases.to_item(phases),
+                    CreatedAt=timestamp,
+                    UpdatedAt=timestamp,
+                )
+            )
+    logger.info(f"Created {len(ecs_tasks)} LAUNCHING {profile.name} task entries")
 
-    try:
-        # Launch the ECS task
-        response = ecs.run_task(
-            cluster=CLUSTER_NAME,
-            taskDefinition=TASK_DEFINITION,
-            launchType="FARGATE",
-            networkConfiguration={
-                "awsvpcConfiguration": {
-                    "subnets": [SUBNET_ID1, SUBNET_ID2],
-                    "securityGroups": [SECURITY_GROUP_ID],
-                    "assignPublicIp": "ENABLED",
-                }
-            },
+    if ecs_tasks:
+        metrics.add_metric(
+            name="LaunchWriteDuration",
+            unit=MetricUnit.Seconds,
+            value=time.monotonic() - write_started,
+        )
+        metrics.add_metric(name="TasksStarted", unit=MetricUnit.Count, value=len(ecs_tasks))
+    if run_failures:
+        metrics.add_metric(
+            name="TaskLaunchErrors", unit=MetricUnit.Count, value=len(run_failures)
         )
 
-        ecs_task = response["tasks"][0]
-        ecs_task_arn = ecs_task["taskArn"]
+    return [STARTED] * len(ecs_tasks) + [DEFERRED] * deferred + [FAILED] * len(run_failures)
+
+
+def report_queue_depth():
+    """Launch requests waiting in, and being worked off, the launch queue"""
+    if LAUNCH_QUEUE_URL is None:
+        return
+    attributes = sqs.get_queue_attributes(
+        QueueUrl=LAUNCH_QUEUE_URL,
+        AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+    )["Attributes"]
+    metrics.add_metric(
+        name="LaunchQueueDepth",
+        unit=MetricUnit.Count,
+        value=int(attributes["ApproximateNumberOfMessages"]),
+    )
+    metrics.add_metric(
+        name="LaunchQueueInFlight",
+        unit=MetricUnit.Count,
+        value=int(attributes["ApproximateNumberOfMessagesNotVisible"]),
+    )
 
-        # Update DDB with ECS task info
-        table.update_item(
-            Key={"PK": "TASK#POOL", "SK": f"TASK#{task_id}"},
-            UpdateExpression="SET EcsTaskArn = :arn, UpdatedAt = :now",
-            ExpressionAttributeValues={
-                ":arn": ecs_task_arn,
-                ":now": datetime.utcnow().isoformat(),
-            },
-        )
 
+def defer(records):
+    """Return records to the launch queue after a jittered backoff.
+
+    The delay grows with the number of times a record was received. Records
+    whose visibility can't be changed come back after the visibility timeout;
+    they are counted as DeferralFailures.
+    """
+    if LAUNCH_QUEUE_URL is None:
+        return
+    failures = 0
+    for batch in chunks(records, VISIBILITY_BATCH_MAX):
+        entries = [
+            {
+                "Id": str(i),
+                "ReceiptHandle": record["receiptHandle"],
+                "VisibilityTimeout": int(
+                    ratelimit.backoff_delay(
+                        int(record.get("attributes", {}).get("ApproximateReceiveCount", 1))
+                    )
+                ),
+            }
+            for i, record in enumerate(batch)
+        ]
         try:
-            # Wait for task to be running and get IP
-            waiter = ecs.get_waiter("tasks_running")
+            response = sqs.change_message_visibility_batch(QueueUrl=LAUNCH_QUEUE_URL, Entries=entries)
+        except Exception as e:
+            logger.error(f"Could not shorten the visibility of {len(batch)} deferred launches: {str(e)}")
+            failures += len(batch)
+            continue
+        failed = response.get("Failed", [])
+        if failed:
+            logger.error(
+                f"Could not shorten the visibility of {len(failed)}/{len(batch)} deferred launches: "
+                f"{failed[0].get('Code')}"
+            )
+            failures += len(failed)
+    metrics.add_metric(name="DeferralFailures", unit=MetricUnit.Count, value=failures)
 
-            time.sleep(
-                0.25
-            )  # To avoid a race condition with the waiter. boto3 should do this....
 
-            waiter.wait(cluster=CLUSTER_NAME, tasks=[ecs_task_arn])
+def get_public_ip(task):
+    """Resolve the public IP of a task's ENI"""
+    eni_id = next(
+        detail["value"]
+        for detail in task["attachments"][0]["details"]
+        if detail["name"] == "networkInterfaceId"
+    )
+    ec2_response = ec2.describe_network_interfaces(NetworkInterfaceIds=[eni_id])
+    return ec2_response["NetworkInterfaces"][0]["Association"]["PublicIp"]
+
+
+def emit_phases(phases, task):
+    """One metric per phase, by availability zone and task definition revision"""
+    dimensions = {
+        "AvailabilityZone": task.get("availabilityZone", "unknown"),
+        "TaskDefinitionRevision": launch_phases.task_definition_revision(task),
+    }
+    for phase, seconds in phases.items():
+        with single_metric(
+            name=f"{phase}Duration",
+            unit=MetricUnit.Seconds,
+            value=seconds,
+            default_dimensions=dimensions,
+        ):
+            pass
+
+
+def mark_running(task):
+    task_id = keys.task_id_from_arn(task["taskArn"])
+    row = table.get_item(
+        Key=keys.task_key(task_id),
+        ProjectionExpression="#status, PublicIp, StartupPhases, Profile",
+        ExpressionAttributeNames={"#status": "Status"},
+    ).get("Item")
+    if row is None or row["Status"] != "LAUNCHING":
+        logger.warning(f"Task {task_id} is not LAUNCHING, ignoring RUNNING event")
+        return
+
+    if "StartupPhases" in row:
+        # Started earlier and waited for its health check; the startup phases are known
+        public_ip = row["PublicIp"]
+        phases = {phase: float(seconds) for phase, seconds in row["StartupPhases"].items()}
+    else:
+        lookup_started = time.monotonic()
+        public_ip = get_public_ip(task)
+        phases = launch_phases.ecs_phases(task)
+        phases["EniLookup"] = time.monotonic() - lookup_started
+
+    # Profiles without a container health check join on RUNNING under the health gate
+    profile = registry.get(keys.profile_of(row))
+    gate = profile.gate(READINESS_GATE) if profile else READINESS_GATE
+
+    readiness_started = time.monotonic()
+    if gate == "health" and not readiness.is_healthy(task):
+        if readiness.mark_started(table, task_id, public_ip, phases):
+            logger.info(f"Task {task_id} is running with IP {public_ip}, waiting for its health check")
+        return
+    if gate == "probe" and not readiness.probe(
+        public_ip, READINESS_PATH, READINESS_PORT, READINESS_TIMEOUT_SECONDS
+    ):
+        logger.warning(f"Task {task_id} did not become ready within {READINESS_TIMEOUT_SECONDS} s")
+        metrics.add_metric(name="ReadinessTimeouts", unit=MetricUnit.Count, value=1)
+        stop_unready(task, "Readiness probe timed out")
+        return
+
+    write_started = time.monotonic()
+    old = readiness.mark_ready(table, task_id, public_ip, phases, keys.profile_of(row))
+    if old is None:
+        logger.warning(f"Task {task_id} is not LAUNCHING, ignoring RUNNING event")
+        return
+    phases["ReadyWrite"] = time.monotonic() - write_started
+
+    now = datetime.utcnow()
+    created_at = datetime.fromisoformat(old["CreatedAt"])
+    running_at = datetime.fromisoformat(old["RunningAt"]) if "RunningAt" in old else None
+    if running_at:
+        phases["Readiness"] = (now - running_at).total_seconds()
+    elif gate == "probe":
+        phases["Readiness"] = write_started - readiness_started
+
+    startup_duration = (now - created_at).total_seconds()
+    running_duration = startup_duration - phases.get("Readiness", 0.0)
+    logger.info(
+        f"Task {task_id} is now ready with IP {public_ip}. Startup took {startup_duration:.2f} seconds, {running_duration:.2f} to running"
+    )
 
-            # Get task details after waiter
-            task_details = ecs.describe_tasks(
-                cluster=CLUSTER_NAME, tasks=[ecs_task_arn]
-            )
+    # Time until the task joined the pool, and until ECS reported it running
+    metrics.add_metric(
+        name="TaskStartupDuration", unit=MetricUnit.Seconds, value=startup_duration
+    )
+    metrics.add_metric(
+        name="TaskRunningDuration", unit=MetricUnit.Seconds, value=running_duration
+    )
+    metrics.add_metric(name="TasksLaunched", unit=MetricUnit.Count, value=1)
 
-            # Check if task is actually running
-            task_status = task_details["tasks"][0]["lastStatus"]
-            if task_status != "RUNNING":
-                failure_reason = get_task_failure_reason(task_details)
-                raise Exception(
-                    f"Task failed to reach RUNNING state. Status: {task_status}. Reason: {failure_reason}"
-                )
+    # Observed startup latency sizes the warm pool, see fargate_pool.forecast
+    history.record(table, time.time(), Startups=1, StartupSeconds=startup_duration)
 
-            eni_id = task_details["tasks"][0]["attachments"][0]["details"][1]["value"]
-            ec2_response = ec2.describe_network_interfaces(NetworkInterfaceIds=[eni_id])
-            public_ip = ec2_response["NetworkInterfaces"][0]["Association"]["PublicIp"]
+    phases.update(
+        {phase: float(seconds) for phase, seconds in old.get("LaunchPhases", {}).items()}
+    )
+    emit_phases(phases, task)
+    launch_phases.record_launch(
+        table,
+        task_id,
+        phases,
+        startup_duration,
+        task.get("availabilityZone", "unknown"),
+        launch_phases.task_definition_revision(task),
+    )
 
-        except Exception as waiter_error:
-            # Get the final task status to understand what went wrong
-            try:
-                task_details = ecs.describe_tasks(
-                    cluster=CLUSTER_NAME, tasks=[ecs_task_arn]
-                )
-                failure_reason = get_task_failure_reason(task_details)
-                logger.error(f"Task startup failed. Details: {failure_reason}")
 
-            except Exception as e:
-                logger.error(f"Failed to get task failure details: {str(e)}")
-                failure_reason = str(waiter_error)
+def stop_unready(task, reason):
+    """Stop a task that will not become ready; its STOPPED event relaunches it"""
+    ecs.stop_task(cluster=CLUSTER_NAME, task=task["taskArn"], reason=reason)
 
-            raise Exception(f"Task failed to start: {failure_reason}")
 
-        # Calculate and record startup duration
-        startup_duration = time.time() - start_time
-        logger.info(
-            f"Task {task_id} is now running with IP {public_ip}. Startup took {startup_duration:.2f} seconds"
-        )
+def mark_unhealthy(task):
+    """A launch whose health check fails is replaced. Tasks already in the pool are left alone."""
+    task_id = keys.task_id_from_arn(task["taskArn"])
+    row = table.get_item(
+        Key=keys.task_key(task_id),
+        ProjectionExpression="#status",
+        ExpressionAttributeNames={"#status": "Status"},
+    ).get("Item")
+    if row is None or row["Status"] != "LAUNCHING" or task.get("desiredStatus") == "STOPPED":
+        logger.info(f"Task {task_id} reported UNHEALTHY, not a pending launch")
+        return
+    logger.warning(f"Task {task_id} failed its health check before joining the pool")
+    metrics.add_metric(name="UnhealthyLaunches", unit=MetricUnit.Count, value=1)
+    stop_unready(task, "Health check failed before the task was ready")
 
-        # Add metrics for startup time and success
-        metrics.add_metric(
-            name="TaskStartupDuration", unit=MetricUnit.Seconds, value=startup_duration
-        )
-        metrics.add_metric(name="TasksLaunched", unit=MetricUnit.Count, value=1)
 
-        # Update task as running
-        table.update_item(
-            Key={"PK": "TASK#POOL", "SK": f"TASK#{task_id}"},
-            UpdateExpression="SET #status = :status, PublicIp = :ip, UpdatedAt = :now",
+def mark_failed(task):
+    task_id = keys.task_id_from_arn(task["taskArn"])
+    profile = profiles.profile_of_task(task)
+    failure_reason = get_task_failure_reason({"tasks": [task]})
+
+    try:
+        response = table.update_item(
+            Key=keys.task_key(task_id),
+            UpdateExpression="SET #status = :status, StatusShard = :status_shard, ErrorMessage = :error, UpdatedAt = :now",
+            ConditionExpression="#status = :launching",
             ExpressionAttributeNames={"#status": "Status"},
             ExpressionAttributeValues={
-                ":status": "RUNNING",
-                ":ip": public_ip,
+                ":status": "ERROR",
+                ":status_shard": keys.status_key("ERROR", keys.shard_for(task_id), profile),
+                ":launching": "LAUNCHING",
+                ":error": f"Task failed to start: {failure_reason}",
                 ":now": datetime.utcnow().isoformat(),
             },
+            ReturnValues="ALL_OLD",
         )
+    except table.exceptions.ConditionalCheckFailedException:
+        logger.info(f"Task {task_id} stopped after leaving LAUNCHING")
+        return
+
+    failure_duration = (
+        datetime.utcnow() - datetime.fromisoformat(response["Attributes"]["CreatedAt"])
+    ).total_seconds()
+    logger.error(
+        f"Task {task_id} failed to start after {failure_duration:.2f} seconds: {failure_reason}"
+    )
+
+    metrics.add_metric(name="TaskLaunchErrors", unit=MetricUnit.Count, value=1)
+    metrics.add_metric(
+        name="TaskStartupFailureDuration",
+        unit=MetricUnit.Seconds,
+        value=failure_duration,
+    )
 
-    except Exception as e:
-        # Calculate and record failure duration
-        failure_duration = time.time() - start_time
-        logger.exception(
-            f"Error launching task {task_id} after {failure_duration:.2f} seconds"
+    attempt = int(response["Attributes"].get("LaunchAttempt", 1))
+    generation = int(response["Attributes"].get("LaunchGeneration", 1))
+    if attempt < MAX_LAUNCH_ATTEMPTS:
+        accepted = launches.request_launches(
+            events_client,
+            EVENT_BUS_NAME,
+            1,
+            reason="relaunch",
+            profile=profile,
+            attempt=attempt + 1,
+            generation=generation,
         )
+        if accepted:
+            logger.info(f"Requested replacement for task {task_id}, attempt {attempt + 1}")
+        else:
+            logger.error(f"Could not request a replacement for task {task_id}")
+    else:
+        metrics.add_metric(name="FailedTaskLaunches", unit=MetricUnit.Count, value=1)
 
-        metrics.add_metric(name="TaskLaunchErrors", unit=MetricUnit.Count, value=1)
-        metrics.add_metric(
-            name="TaskStartupFailureDuration",
-            unit=MetricUnit.Seconds,
-            value=failure_duration,
+
+def row_status(task):
+    """Status of the task's row, None once it is gone"""
+    item = table.get_item(
+        Key=keys.task_key(keys.task_id_from_arn(task["taskArn"])),
+        ProjectionExpression="#status",
+        ExpressionAttributeNames={"#status": "Status"},
+        ConsistentRead=True,
+    ).get("Item")
+    return item["Status"] if item else None
+
+
+def handle_stopped(task):
+    """Only launches that failed and retired tasks have a row left to update"""
+    status = row_status(task)
+    if status == retire.DRAINING:
+        remove_drained(task)
+    elif status == "LAUNCHING":
+        mark_failed(task)
+    else:
+        # Killed (row already deleted), or a row the reconciler will look at
+        logger.info(f"Task {task['taskArn']} stopped, its row is {status or 'gone'}")
+
+
+def remove_drained(task):
+    """Delete the row of a retired task once it has stopped. False if the row isn't DRAINING."""
+    task_id = keys.task_id_from_arn(task["taskArn"])
+    try:
+        table.delete_item(
+            Key=keys.task_key(task_id),
+            ConditionExpression="#status = :draining",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={":draining": retire.DRAINING},
         )
+    except table.exceptions.ConditionalCheckFailedException:
+        return False
+    logger.info(f"Retired task {task_id} stopped, row removed")
+    return True
+
 
-        table.update_item(
-            Key={"PK": "TASK#POOL", "SK": f"TASK#{task_id}"},
-            UpdateExpression="SET #status = :status, ErrorMessage = :error, UpdatedAt = :now",
+def handle_interruption(task):
+    """Spot reclaims the task in two minutes: take it out of the pool and replace it now"""
+    task_id = keys.task_id_from_arn(task["taskArn"])
+    try:
+        response = table.delete_item(
+            Key=keys.task_key(task_id),
+            ConditionExpression="#status IN (:launching, :running)",
             ExpressionAttributeNames={"#status": "Status"},
-            ExpressionAttributeValues={
-                ":status": "ERROR",
-                ":error": str(e),
-                ":now": datetime.utcnow().isoformat(),
-            },
+            ExpressionAttributeValues={":launching": "LAUNCHING", ":running": "RUNNING"},
+            ReturnValues="ALL_OLD",
         )
-        raise
+    except table.exceptions.ConditionalCheckFailedException:
+        # Assigned tasks stay with their user; the row of a stopped one is cleaned up later
+        logger.info(f"Interrupted spot task {task_id} is not warm, leaving its row")
+        return
+
+    status = response["Attributes"]["Status"]
+    logger.warning(f"Spot task {task_id} interrupted while {status}, replacing it")
+    metrics.add_metric(name="SpotInterruptions", unit=MetricUnit.Count, value=1)
+    launches.request_launches(
+        events_client,
+        EVENT_BUS_NAME,
+        1,
+        reason="spot-interruption",
+        profile=keys.profile_of(response["Attributes"]),
+    )
 
 
 @logger.inject_lambda_context
 @metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
 def lambda_handler(event: dict, context: LambdaContext):
-    logger.info("Received TaskGrabbed event, launching new task")
-    try:
-        launch_task()
-    except Exception as e:
-        logger.error(f"Failed to launch new task: {str(e)}")
-        metrics.add_metric(name="FailedTaskLaunches", unit=MetricUnit.Count, value=1)
-        raise
+    # Grab events are buffered in SQS, so one invocation refills a whole burst.
+    # A bare EventBridge event (no Records) still launches a single task.
+    if "Records" in event:
+        records = event["Records"]
+        grab_events = [json.loads(record["body"]) for record in records]
+    else:
+        records, grab_events = [event], [event]
+
+    logger.info(f"Received {len(records)} TaskGrabbed events, launching new tasks")
+    metrics.add_metric(name="LaunchBatchSize", unit=MetricUnit.Count, value=len(records))
+
+    report_queue_depth()
+
+    # Launches are admitted at the rate ECS sustains; the rest wait in the queue
+    admitted, waited = ratelimit.acquire(run_task_bucket, len(records), ADMISSION_WAIT_SECONDS)
+    metrics.add_metric(name="AdmissionLatency", unit=MetricUnit.Seconds, value=waited)
+    metrics.add_metric(name="LaunchesAdmitted", unit=MetricUnit.Count, value=admitted)
+    logger.info(f"Admitted {admitted}/{len(records)} launches after {waited:.2f} s")
+
+    attempts = [int(grab.get("detail", {}).get("attempt", 1)) for grab in grab_events]
+    generations = [int(grab.get("detail", {}).get("generation", 1)) for grab in grab_events]
+    requested = [requested_at(grab) for grab in grab_events]
+
+    # Each slot refills the profile its grab drained
+    slots = defaultdict(list)
+    for index, grab in enumerate(grab_events[:admitted]):
+        slots[grab.get("detail", {}).get("profile", keys.DEFAULT_PROFILE)].append(index)
+
+    results = [DEFERRED] * len(records)
+    for name, indexes in slots.items():
+        profile = registry.get(name)
+        if profile is None:
+            logger.error(f"Dropping {len(indexes)} launches of unknown profile {name}")
+            metrics.add_metric(
+                name="UnknownProfileLaunches", unit=MetricUnit.Count, value=len(indexes)
+            )
+            outcomes = [DROPPED] * len(indexes)
+        else:
+            outcomes = launch_tasks(
+                [attempts[i] for i in indexes],
+                [requested[i] for i in indexes],
+                profile,
+                [generations[i] for i in indexes],
+            )
+        for index, outcome in zip(indexes, outcomes):
+            results[index] = outcome
+
+    # Each record owns one launch slot. Unfilled slots go back to the queue
+    # so the pool is not left short: deferred ones after a short backoff,
+    # failed ones after the visibility timeout.
+    deferred_records = [record for record, result in zip(records, results) if result == DEFERRED]
+    failed_records = [record for record, result in zip(records, results) if result == FAILED]
+    if deferred_records:
+        metrics.add_metric(
+            name="LaunchesDeferred", unit=MetricUnit.Count, value=len(deferred_records)
+        )
+    if failed_records:
+        metrics.add_metric(
+            name="FailedTaskLaunches", unit=MetricUnit.Count, value=len(failed_records)
+        )
+
+    if "Records" not in event:
+        if failed_records or deferred_records:
+            raise Exception("Failed to launch new task")
+        return {"statusCode": 200, "body": json.dumps("Task launch started")}
 
-    return {"statusCode": 200, "body": json.dumps("Task launch completed")}
+    defer(deferred_records)
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": record["messageId"]}
+            for record in deferred_records + failed_records
+        ]
+    }
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
+def state_change_handler(event: dict, context: LambdaContext):
+    """Completes launches from ECS Task State Change events"""
+    task = event["detail"]
+    logger.info(f"Task {task['taskArn']} reported status {task['lastStatus']}")
+
+    if task.get("stopCode") == "SpotInterruption":
+        # Sent with lastStatus RUNNING when the two minute warning starts
+        handle_interruption(task)
+    elif task["lastStatus"] == "RUNNING" and readiness.is_unhealthy(task):
+        mark_unhealthy(task)
+    elif task["lastStatus"] == "RUNNING":
+        mark_running(task)
+    elif task["lastStatus"] == "STOPPED":
+        handle_stopped(task)
+
+    return {"statusCode": 200, "body": json.dumps("Task state change processed")}
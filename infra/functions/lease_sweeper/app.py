@@ -0,0 +1,68 @@
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fargate_pool import capacity, clients, counters, leases, profiles, recycle
+import os
+import time
+
+logger = Logger()
+metrics = Metrics()
+
+ecs = clients.client("ecs")
+table = clients.table(os.environ["TABLE_NAME"], operation=capacity.RECLAIM)
+CLUSTER_NAME = os.environ["CLUSTER_NAME"]
+# recycle returns abandoned tasks to the pool, stop retires them
+EXPIRED_LEASE_ACTION = os.environ.get("EXPIRED_LEASE_ACTION", leases.RECYCLE)
+# Expired leases reclaimed per run; the rest wait for the next one
+RECLAIM_BUDGET = int(os.environ.get("RECLAIM_BUDGET", "200"))
+MAX_REUSE = int(os.environ.get("MAX_REUSE", str(recycle.MAX_REUSE)))
+MAX_AGE_SECONDS = int(os.environ.get("MAX_AGE_SECONDS", str(recycle.MAX_AGE_SECONDS)))
+RECLAIM_WORKERS = 8
+
+
+def reclaim(task, now):
+    return leases.reclaim(
+        table,
+        ecs,
+        CLUSTER_NAME,
+        task,
+        EXPIRED_LEASE_ACTION,
+        now,
+        max_reuse=MAX_REUSE,
+        max_age_seconds=MAX_AGE_SECONDS,
+    )
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
+def lambda_handler(event: dict, context: LambdaContext):
+    now = time.time()
+    names = list(profiles.load_profiles(table))
+    expired = leases.expired_leases(table, names, now, limit=RECLAIM_BUDGET)
+
+    outcomes = Counter()
+    if expired:
+        with ThreadPoolExecutor(max_workers=RECLAIM_WORKERS) as executor:
+            for result in executor.map(lambda task: reclaim(task, now), expired):
+                outcomes[result.outcome] += 1
+        logger.info(f"Reclaimed {len(expired)} tasks with expired leases: {dict(outcomes)}")
+
+    assigned = counters.read_counts(table).get("ASSIGNED", 0)
+    # Heartbeated in the meantime, or released by their user
+    kept = outcomes[recycle.NOT_ASSIGNED]
+    metrics.add_metric(name="ExpiredLeases", unit=MetricUnit.Count, value=len(expired) - kept)
+    metrics.add_metric(name="LeasesRecycled", unit=MetricUnit.Count, value=outcomes[recycle.RECYCLED])
+    metrics.add_metric(name="LeasesRetired", unit=MetricUnit.Count, value=outcomes[recycle.RETIRED])
+    # The counters are updated from the table stream, so reclaimed tasks may still count
+    metrics.add_metric(
+        name="LiveLeases",
+        unit=MetricUnit.Count,
+        value=max(assigned - len(expired) + kept, 0),
+    )
+
+    return {
+        "statusCode": 200,
+    }
@@ -0,0 +1,255 @@
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fargate_pool import (
+    capacity,
+    clients,
+    keys,
+    launches,
+    ratelimit,
+    readiness,
+    retire,
+    rows,
+    teardown,
+)
+import os
+import time
+
+logger = Logger()
+metrics = Metrics()
+
+ecs = clients.client("ecs")
+events_client = clients.client("events")
+table = clients.table(os.environ["TABLE_NAME"], operation=capacity.RECONCILE)
+CLUSTER_NAME = os.environ["CLUSTER_NAME"]
+EVENT_BUS_NAME = os.environ["EVENT_BUS_NAME"]
+MAX_LAUNCH_ATTEMPTS = int(os.environ.get("MAX_LAUNCH_ATTEMPTS", "3"))
+# Rounds of MAX_LAUNCH_ATTEMPTS a failing launch gets before it is abandoned
+MAX_LAUNCH_GENERATIONS = int(os.environ.get("MAX_LAUNCH_GENERATIONS", "2"))
+# Abandoned ERROR rows are kept this long for inspection, then expire
+ABANDONED_TTL = timedelta(days=int(os.environ.get("ABANDONED_TTL_DAYS", "7")))
+# Replacement launches the reconciler may request per run
+RELAUNCH_BUDGET = int(os.environ.get("RELAUNCH_BUDGET", "20"))
+# Rows and tasks younger than this may still be mid-launch and are left alone
+GRACE_PERIOD = timedelta(seconds=int(os.environ.get("GRACE_PERIOD_SECONDS", "120")))
+# Started tasks that are still not ready after this are stopped and replaced
+READINESS_DEADLINE = timedelta(seconds=int(os.environ.get("READINESS_DEADLINE_SECONDS", "600")))
+
+# ECS describes at most 100 tasks per DescribeTasks call
+DESCRIBE_TASKS_MAX = 100
+WORKERS = 8
+DESCRIBE_TASKS_RATE = float(os.environ.get("DESCRIBE_TASKS_RATE", "20"))
+DESCRIBE_TASKS_BURST = int(os.environ.get("DESCRIBE_TASKS_BURST", "50"))
+DESCRIBE_WAIT_SECONDS = 20
+
+describe_bucket = ratelimit.SharedTokenBucket(
+    table, "DescribeTasks", DESCRIBE_TASKS_RATE, DESCRIBE_TASKS_BURST
+)
+
+
+def describe_tasks(arns):
+    """Describe `arns` in parallel batches of 100. Returns {arn: task}; unknown tasks are absent."""
+    batches = [arns[i : i + DESCRIBE_TASKS_MAX] for i in range(0, len(arns), DESCRIBE_TASKS_MAX)]
+
+    def describe(batch):
+        # A large pool is described in one burst; keep it within the API limit
+        ratelimit.acquire(describe_bucket, 1, DESCRIBE_WAIT_SECONDS)
+        return ecs.describe_tasks(cluster=CLUSTER_NAME, tasks=batch)["tasks"]
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        return {task["taskArn"]: task for tasks in executor.map(describe, batches) for task in tasks}
+
+
+def age(timestamp, now):
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return now - timestamp
+
+
+def delete_row(task):
+    """Remove a row unless its status changed since we read it"""
+    try:
+        table.delete_item(
+            Key={"PK": task["PK"], "SK": task["SK"]},
+            ConditionExpression="#status = :status",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={":status": task["Status"]},
+        )
+        return True
+    except table.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def abandon(task, now):
+    """Stop relaunching a launch that failed every round: keep its ERROR row until it expires"""
+    try:
+        table.update_item(
+            Key={"PK": task["PK"], "SK": task["SK"]},
+            UpdateExpression="SET AbandonedAt = :now, ExpiresAt = :expires",
+            ConditionExpression="#status = :error AND attribute_not_exists(AbandonedAt)",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={
+                ":error": "ERROR",
+                ":now": now.replace(tzinfo=None).isoformat(),
+                ":expires": int((now + ABANDONED_TTL).timestamp()),
+            },
+        )
+        return True
+    except table.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def reconcile():
+    now = datetime.now(timezone.utc)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pool_rows = executor.submit(rows.all_task_rows, table)
+        listed_arns = executor.submit(teardown.list_pool_task_arns, ecs, CLUSTER_NAME)
+        pool_rows, listed_arns = pool_rows.result(), listed_arns.result()
+
+    # Rows whose task is no longer listed are described too, to see why it stopped
+    row_arns = {task["EcsTaskArn"] for task in pool_rows if "EcsTaskArn" in task}
+    ecs_tasks = describe_tasks(sorted(set(listed_arns) | row_arns))
+
+    dead, errored, ready, unready, undrained, unavailable = [], [], [], [], [], []
+    for task in pool_rows:
+        if age(task["UpdatedAt"], now) < GRACE_PERIOD:
+            continue
+        if task["Status"] == "ERROR":
+            if "AbandonedAt" not in task:
+                errored.append(task)
+            continue
+        ecs_task = ecs_tasks.get(task.get("EcsTaskArn"))
+        if ecs_task is None or ecs_task["lastStatus"] == "STOPPED":
+            reason = ecs_task.get("stoppedReason", "Stopped") if ecs_task else "Task not found in ECS"
+            logger.warning(f"Task {task['TaskId']} is {task['Status']} but its ECS task is gone: {reason}")
+            dead.append(task)
+        elif task["Status"] == retire.DRAINING and ecs_task["desiredStatus"] != "STOPPED":
+            # Retired, but its StopTask call was lost
+            undrained.append(ecs_task["taskArn"])
+        elif task["Status"] == "RUNNING" and "AvailableShard" not in task:
+            # Warm, but not claimable: written before the available index existed
+            unavailable.append(task)
+        elif task["Status"] == "LAUNCHING" and "RunningAt" in task:
+            # Started and waiting for its health check
+            if readiness.is_healthy(ecs_task):
+                ready.append(task)
+            elif age(task["RunningAt"], now) >= READINESS_DEADLINE:
+                unready.append(ecs_task["taskArn"])
+
+    # The HEALTHY state change was missed; the row already has its public IP
+    promoted = sum(
+        readiness.mark_ready(
+            table, task["TaskId"], task["PublicIp"], profile=keys.profile_of(task)
+        )
+        is not None
+        for task in ready
+    )
+
+    indexed = sum(readiness.make_available(table, task) for task in unavailable)
+
+    orphans = [
+        arn
+        for arn, ecs_task in ecs_tasks.items()
+        if arn not in row_arns
+        and ecs_task["desiredStatus"] != "STOPPED"
+        and age(ecs_task["createdAt"], now) >= GRACE_PERIOD
+    ]
+
+    # Warm capacity lost to dead tasks, or to launches the launcher gave up on, is replaced
+    def needs_relaunch(task):
+        if task["Status"] == "ERROR":
+            return int(task.get("LaunchAttempt", MAX_LAUNCH_ATTEMPTS)) >= MAX_LAUNCH_ATTEMPTS
+        return task["Status"] in ("LAUNCHING", "RUNNING")
+
+    budget = RELAUNCH_BUDGET
+    # Keyed by (profile, generation); dead tasks start a new launch history
+    relaunches = Counter()
+    removed = abandoned = 0
+    for task in dead + errored:
+        relaunch = needs_relaunch(task)
+        generation = int(task.get("LaunchGeneration", 1))
+        if relaunch and task["Status"] == "ERROR" and generation >= MAX_LAUNCH_GENERATIONS:
+            # Every round failed: the task definition, network or quota needs fixing
+            logger.error(
+                f"Giving up on launch {task['TaskId']} after {generation} rounds of "
+                f"{MAX_LAUNCH_ATTEMPTS} attempts: {task.get('ErrorMessage')}"
+            )
+            abandoned += abandon(task, now)
+            continue
+        if relaunch and budget == 0:
+            # Keep the row so the next run replaces it
+            continue
+        if delete_row(task):
+            removed += 1
+            if relaunch:
+                budget -= 1
+                next_generation = generation + 1 if task["Status"] == "ERROR" else None
+                relaunches[(keys.profile_of(task), next_generation)] += 1
+
+    # Lost capacity is replaced in the profile it was lost from
+    requested = sum(
+        launches.request_launches(
+            events_client,
+            EVENT_BUS_NAME,
+            count,
+            reason="reconciler",
+            profile=profile,
+            generation=generation,
+        )
+        for (profile, generation), count in relaunches.items()
+    )
+
+    stopped = teardown.TeardownResult()
+    teardown.stop_tasks(
+        ecs, CLUSTER_NAME, orphans, "Orphaned task stopped by pool reconciler", stopped, WORKERS
+    )
+    # Their STOPPED events mark the rows ERROR and relaunch them
+    unready_stopped = teardown.TeardownResult()
+    teardown.stop_tasks(
+        ecs, CLUSTER_NAME, unready, "Task did not become ready", unready_stopped, WORKERS
+    )
+    # Their STOPPED events remove the DRAINING rows
+    drained = teardown.TeardownResult()
+    teardown.stop_tasks(
+        ecs, CLUSTER_NAME, undrained, "Retired surplus warm task", drained, WORKERS
+    )
+
+    return {
+        "PoolRows": len(pool_rows),
+        "EcsTasks": len(listed_arns),
+        "DeadTasks": len(dead),
+        "ErrorRows": len(errored),
+        "RowsRemoved": removed,
+        "OrphanTasks": len(orphans),
+        "OrphansStopped": stopped.tasks_stopped,
+        "ReadyPromoted": promoted,
+        "AvailableIndexed": indexed,
+        "UnreadyStopped": unready_stopped.tasks_stopped,
+        "DrainingStopped": drained.tasks_stopped,
+        "Relaunches": requested,
+        "LaunchesAbandoned": abandoned,
+    }
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
+def lambda_handler(event: dict, context: LambdaContext):
+    start_time = time.time()
+    drift = reconcile()
+    duration = time.time() - start_time
+
+    logger.info(f"Reconciled pool in {duration:.2f} seconds: {drift}")
+    for name, value in drift.items():
+        metrics.add_metric(name=name, unit=MetricUnit.Count, value=value)
+    metrics.add_metric(name="ReconcileDuration", unit=MetricUnit.Seconds, value=duration)
+
+    return {
+        "statusCode": 200,
+    }
@@ -0,0 +1,198 @@
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from dataclasses import replace
+from decimal import Decimal
+from fargate_pool import (
+    capacity,
+    clients,
+    counters,
+    forecast,
+    history,
+    keys,
+    launches,
+    profiles,
+    retire,
+)
+import os
+import time
+
+logger = Logger()
+metrics = Metrics()
+
+ecs = clients.client("ecs")
+events_client = clients.client("events")
+sqs = clients.client("sqs")
+table = clients.table(os.environ["TABLE_NAME"], operation=capacity.SIZE)
+CLUSTER_NAME = os.environ["CLUSTER_NAME"]
+EVENT_BUS_NAME = os.environ["EVENT_BUS_NAME"]
+LAUNCH_QUEUE_URL = os.environ.get("LAUNCH_QUEUE_URL")
+
+STATE_KEY = {"PK": "POOL#SIZER", "SK": "STATE"}
+# History older than this is ignored when catching up on missed minutes
+MAX_BACKFILL_MINUTES = 60
+WARM_STATUSES = ("LAUNCHING", "RUNNING")
+
+config = forecast.SizerConfig.from_env()
+
+
+def to_decimal(value):
+    return None if value is None else Decimal(str(round(value, 6)))
+
+
+def to_float(value):
+    return None if value is None else float(value)
+
+
+def load_state():
+    item = table.get_item(Key=STATE_KEY).get("Item")
+    if not item:
+        return forecast.new_state(config)
+
+    return {
+        "Rate": float(item["Rate"]),
+        "Profile": [to_float(value) for value in item["Profile"]],
+        "Startup": float(item["Startup"]),
+        "LastMinute": int(item["LastMinute"]) if item.get("LastMinute") else None,
+        "LastScaleUp": float(item["LastScaleUp"]),
+        "LastScaleDown": float(item["LastScaleDown"]),
+        # Cool-downs of the pool profiles kept at a fixed size
+        "Profiles": {
+            name: {key: float(value) for key, value in times.items()}
+            for name, times in item.get("Profiles", {}).items()
+        },
+    }
+
+
+def save_state(state):
+    table.put_item(
+        Item={
+            **STATE_KEY,
+            "Rate": to_decimal(state["Rate"]),
+            "Profile": [to_decimal(value) for value in state["Profile"]],
+            "Startup": to_decimal(state["Startup"]),
+            "LastMinute": state["LastMinute"],
+            "LastScaleUp": to_decimal(state["LastScaleUp"]),
+            "LastScaleDown": to_decimal(state["LastScaleDown"]),
+            "Profiles": {
+                name: {key: to_decimal(value) for key, value in times.items()}
+                for name, times in state.get("Profiles", {}).items()
+            },
+        }
+    )
+
+
+def observe_history(state, now):
+    """Fold every completed minute since the last run into the forecast"""
+    current_minute = history.minute_of(now)
+    start = current_minute - MAX_BACKFILL_MINUTES * 60
+    if state["LastMinute"] is not None:
+        start = max(start, state["LastMinute"] + 60)
+
+    minutes = history.read_minutes(table, start, current_minute)
+    for minute in range(start, current_minute, 60):
+        item = minutes.get(minute, {})
+        startups = int(item.get("Startups", 0))
+        forecast.observe(
+            state,
+            minute,
+            grabs=int(item.get("Grabs", 0)),
+            startups=[float(item["StartupSeconds"]) / startups] if startups else [],
+            config=config,
+        )
+
+
+def scale(change, reason, profile=keys.DEFAULT_PROFILE):
+    """Launch (change > 0) or retire (change < 0) tasks of `profile`"""
+    if change > 0:
+        requested = launches.request_launches(
+            events_client, EVENT_BUS_NAME, change, reason=reason, profile=profile
+        )
+        logger.info(f"Requested {requested}/{change} {profile} launches")
+        metrics.add_metric(name="ScaleUpTasks", unit=MetricUnit.Count, value=requested)
+    elif change < 0:
+        result = retire.retire_warm_tasks(
+            table,
+            ecs,
+            CLUSTER_NAME,
+            -change,
+            reason=f"Pool sized down by {reason}",
+            profile=profile,
+            min_idle_seconds=config.min_idle_seconds,
+        )
+        logger.info(
+            f"Retired {len(result.retired)}/{-change} idle {profile} tasks, "
+            f"{result.idle_task_minutes:.0f} idle task-minutes, {result.stop_failures} not stopped"
+        )
+        metrics.add_metric(name="ScaleDownTasks", unit=MetricUnit.Count, value=len(result.retired))
+        # A retired task would likely have stayed idle for as long again
+        metrics.add_metric(
+            name="IdleTaskMinutesSaved", unit=MetricUnit.Count, value=result.idle_task_minutes
+        )
+
+
+def size_profiles(state, pool, pool_profiles, now):
+    """Keep every profile but the default one at its TargetSize. Returns their warm tasks."""
+    sized = {}
+    cooldowns = state.setdefault("Profiles", {})
+    for name, profile in pool_profiles.items():
+        if name == keys.DEFAULT_PROFILE:
+            continue
+        warm = sum(pool.get(counters.profile_field(status, name), 0) for status in WARM_STATUSES)
+        profile_state = cooldowns.setdefault(name, {"LastScaleUp": 0.0, "LastScaleDown": 0.0})
+        change = forecast.step(profile_state, profile.target_size, warm, now, config)
+        logger.info(f"Profile {name}: target {profile.target_size}, warm {warm}, change {change}")
+        scale(change, "profile target", name)
+        sized[name] = warm
+
+    # Forget the cool-downs of deleted profiles
+    for name in set(cooldowns) - set(sized):
+        del cooldowns[name]
+    return sized
+
+
+@logger.inject_lambda_context
+@metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
+def lambda_handler(event: dict, context: LambdaContext):
+    now = time.time()
+    state = load_state()
+    observe_history(state, now)
+
+    pool = counters.read_counts(table)
+    pool_profiles = profiles.load_profiles(table)
+    # The forecast sizes the default profile; the other profiles have fixed sizes
+    other_warm = size_profiles(state, pool, pool_profiles, now)
+    # Refills waiting behind the launch token bucket are already on their way. The queue
+    # doesn't tell profiles apart, so another profile's refills only delay a scale-up a run.
+    queued = launches.queued_launches(sqs, LAUNCH_QUEUE_URL)
+    warm = (
+        sum(pool.get(status, 0) for status in WARM_STATUSES) - sum(other_warm.values()) + queued
+    )
+    # The size an operator set is a floor: the forecast only grows the pool above it
+    floor = pool_profiles[keys.DEFAULT_PROFILE].target_size
+    sizing = replace(config, min_size=max(config.min_size, floor))
+    target = forecast.target_size(state, now, sizing)
+    change = forecast.decide(state, warm, now, sizing)
+
+    logger.info(
+        f"Forecast {forecast.forecast_rate(state, now, config):.3f} grabs/s, "
+        f"startup {state['Startup']:.1f}s, target {target} (floor {floor}), "
+        f"warm {warm} ({queued} queued), change {change}"
+    )
+    metrics.add_metric(
+        name="ForecastGrabRate",
+        unit=MetricUnit.CountPerSecond,
+        value=forecast.forecast_rate(state, now, config),
+    )
+    metrics.add_metric(name="TargetPoolSize", unit=MetricUnit.Count, value=target)
+    metrics.add_metric(name="WarmPoolSize", unit=MetricUnit.Count, value=warm)
+    metrics.add_metric(name="QueuedLaunches", unit=MetricUnit.Count, value=queued)
+
+    scale(change, "forecast")
+
+    save_state(state)
+
+    return {
+        "statusCode": 200,
+    }
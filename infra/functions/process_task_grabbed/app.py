@@ -1,69 +1,206 @@
 from aws_lambda_powertools import Logger, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
-import boto3
+from collections import Counter
+from fargate_pool import capacity, clients, counters, history, keys, recycle
 import json
 import os
+import time
 
 logger = Logger()
 metrics = Metrics()
-events_client = boto3.client("events")
+events_client = clients.client("events")
+table = clients.table(os.environ["TABLE_NAME"], operation=capacity.STREAM)
 event_bus_name = os.environ["EVENT_BUS_NAME"]
 
+# EventBridge accepts at most 10 entries per PutEvents call
+PUT_EVENTS_MAX_ENTRIES = 10
+PUBLISH_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.1
+
+
+def is_grab(record):
+    """A RUNNING -> ASSIGNED transition"""
+    if record["eventName"] != "MODIFY":
+        return False
+    new_image = record["dynamodb"]["NewImage"]
+    old_image = record["dynamodb"]["OldImage"]
+    return (
+        new_image.get("Status", {}).get("S") == "ASSIGNED"
+        and old_image.get("Status", {}).get("S") == "RUNNING"
+    )
+
+
+def record_profile(record):
+    return record["dynamodb"]["NewImage"].get("Profile", {}).get("S", keys.DEFAULT_PROFILE)
+
+
+def grab_entry(record):
+    new_image = record["dynamodb"]["NewImage"]
+    return {
+        "Source": "com.fargate-pool",
+        "DetailType": "TaskGrabbed",
+        "Detail": json.dumps(
+            {
+                "taskId": new_image.get("TaskId", {}).get("S"),
+                "status": new_image.get("Status", {}).get("S"),
+                "profile": record_profile(record),
+                "timestamp": new_image.get("UpdatedAt", {}).get("S"),
+            }
+        ),
+        "EventBusName": event_bus_name,
+    }
+
+
+def publish(entries):
+    """Publish entries in order, in chunks of 10, retrying only the entries that failed.
+
+    Returns the index of the first entry that could not be published, or
+    None. Publishing stops there: the stream redelivers everything from that
+    record on, so later entries would be published twice.
+    """
+    calls = 0
+    first_failed = None
+
+    for start in range(0, len(entries), PUT_EVENTS_MAX_ENTRIES):
+        pending = list(range(start, min(start + PUT_EVENTS_MAX_ENTRIES, len(entries))))
+
+        for attempt in range(PUBLISH_ATTEMPTS):
+            if attempt:
+                time.sleep(RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            calls += 1
+            try:
+                response = events_client.put_events(Entries=[entries[i] for i in pending])
+            except Exception as e:
+                logger.error(f"Failed to publish {len(pending)} events: {str(e)}")
+                continue
+
+            # Result entries line up with the request, failed ones carry an ErrorCode
+            failed = [
+                index
+                for index, result in zip(pending, response["Entries"])
+                if "ErrorCode" in result
+            ]
+            if failed:
+                logger.warning(f"{len(failed)}/{len(pending)} events failed to publish")
+            pending = failed
+            if not pending:
+                break
+
+        if pending:
+            first_failed = pending[0]
+            break
+
+    metrics.add_metric(name="PutEventsCalls", unit=MetricUnit.Count, value=calls)
+    return first_failed
+
+
+def plan_refills(records, credits):
+    """Split grabs into refills to publish and grabs covered by recycled tasks.
+
+    Records are walked in order: a recycle adds a credit to its profile, a
+    grab spends one of its profile if there is any. `credits` is updated in
+    place. Returns (grab indexes to publish, covered grab indexes).
+    """
+    refills, covered = [], []
+    for index, record in enumerate(records):
+        if recycle.is_recycle(record):
+            credits[record_profile(record)] += 1
+        elif is_grab(record):
+            profile = record_profile(record)
+            if credits[profile] > 0:
+                credits[profile] -= 1
+                covered.append(index)
+            else:
+                refills.append(index)
+    return refills, covered
+
 
 @logger.inject_lambda_context
 @metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
 def lambda_handler(event: dict, context: LambdaContext):
-    for record in event.get("Records", []):
-        if record["eventName"] == "MODIFY":
-            new_image = record["dynamodb"]["NewImage"]
-            old_image = record["dynamodb"]["OldImage"]
-
-            if (
-                new_image.get("Status", {}).get("S") == "ASSIGNED"
-                and old_image.get("Status", {}).get("S") == "RUNNING"
-            ):
-                logger.info("Task assigned, publishing event")
-                metrics.add_metric(
-                    name="TaskAllocatedToUse", unit=MetricUnit.Count, value=1
-                )
-                try:
-                    response = events_client.put_events(
-                        Entries=[
-                            {
-                                "Source": "com.fargate-pool",
-                                "DetailType": "TaskGrabbed",
-                                "Detail": json.dumps(
-                                    {
-                                        "taskId": new_image.get("PK", {}).get("S"),
-                                        "status": new_image.get("Status", {}).get("S"),
-                                        "timestamp": new_image.get("UpdatedAt", {}).get(
-                                            "S"
-                                        ),
-                                    }
-                                ),
-                                "EventBusName": event_bus_name,
-                            }
-                        ]
-                    )
-
-                    if response["FailedEntryCount"] > 0:
-                        logger.error(f"Failed to publish event: {response}")
-                        metrics.add_metric(
-                            name="FailedEventPublish", unit=MetricUnit.Count, value=1
-                        )
-                    else:
-                        logger.info("Successfully published event")
-                        metrics.add_metric(
-                            name="SuccessfulEventPublish",
-                            unit=MetricUnit.Count,
-                            value=1,
-                        )
-
-                except Exception as e:
-                    logger.error(f"Failed to publish event: {str(e)}")
-                    metrics.add_metric(
-                        name="FailedEventPublish", unit=MetricUnit.Count, value=1
-                    )
-
-    return {"statusCode": 200, "body": json.dumps("Event publishing completed")}
+    records = event.get("Records", [])
+    grabs = [index for index, record in enumerate(records) if is_grab(record)]
+    recycles = [index for index, record in enumerate(records) if recycle.is_recycle(record)]
+
+    # Tasks returned to the pool replace grabs of their profile without a launch. The
+    # credits are taken before planning so concurrent batches can't spend the same ones.
+    grabbed_profiles = Counter(record_profile(records[index]) for index in grabs)
+    reserved = Counter(
+        {
+            profile: recycle.spend_credits(table, count, profile)
+            for profile, count in grabbed_profiles.items()
+        }
+    )
+    refills, covered = plan_refills(records, Counter(reserved))
+
+    failed_entry = publish([grab_entry(records[index]) for index in refills])
+
+    # Lambda redelivers the batch from the first failed record on, so only the
+    # records before it are accounted for here; the rest are on their next delivery
+    if failed_entry is None:
+        first_failed = len(records)
+        published = len(refills)
+    else:
+        first_failed = refills[failed_entry]
+        published = failed_entry
+
+    accounted_grabs = sum(index < first_failed for index in grabs)
+    avoided = sum(index < first_failed for index in covered)
+    recycled = sum(index < first_failed for index in recycles)
+
+    # Credits given back per profile: those taken but not spent on an accounted
+    # grab, and those earned by the accounted recycles
+    credit_deltas = Counter(reserved)
+    for index in recycles:
+        if index < first_failed:
+            credit_deltas[record_profile(records[index])] += 1
+    for index in covered:
+        if index < first_failed:
+            credit_deltas[record_profile(records[index])] -= 1
+
+    logger.info(
+        f"Published {published}/{len(refills)} TaskGrabbed events for {len(records)} records, "
+        f"{avoided} grabs covered by {recycled} recycled tasks"
+    )
+    metrics.add_metric(name="TaskAllocatedToUse", unit=MetricUnit.Count, value=accounted_grabs)
+    metrics.add_metric(name="SuccessfulEventPublish", unit=MetricUnit.Count, value=published)
+    metrics.add_metric(
+        name="FailedEventPublish", unit=MetricUnit.Count, value=len(refills) - published
+    )
+    metrics.add_metric(name="TasksRecycled", unit=MetricUnit.Count, value=recycled)
+    metrics.add_metric(name="LaunchesAvoided", unit=MetricUnit.Count, value=avoided)
+
+    accounted = records[:first_failed]
+
+    try:
+        for profile, delta in credit_deltas.items():
+            recycle.add_credits(table, delta, profile)
+
+        deltas = Counter()
+        grabs_per_minute = Counter()
+        for record in accounted:
+            deltas.update(counters.record_deltas(record))
+            if is_grab(record):
+                minute = history.minute_of(record["dynamodb"]["ApproximateCreationDateTime"])
+                grabs_per_minute[minute] += 1
+        counters.apply_deltas(table, deltas)
+
+        # Grab history feeds the demand forecast of the pool sizer
+        for minute, count in grabs_per_minute.items():
+            history.record(table, minute, Grabs=count)
+    except Exception:
+        # Failing the batch now would publish its refills twice. The drift
+        # check corrects the counters instead.
+        logger.exception("Failed to update pool counters")
+        metrics.add_metric(name="CounterUpdateErrors", unit=MetricUnit.Count, value=1)
+
+    if first_failed == len(records):
+        return {"batchItemFailures": []}
+
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": records[first_failed]["dynamodb"]["SequenceNumber"]}
+        ]
+    }
@@ -1,17 +1,16 @@
-import boto3
 import random
 import os
 import uuid
-from datetime import datetime, timezone
-from boto3.dynamodb.conditions import Key
 from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from fargate_pool import capacity, claim, clients
 
 logger = Logger()
 metrics = Metrics()
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["TABLE_NAME"])
+table = clients.table(os.environ["TABLE_NAME"], operation=capacity.GRAB)
+CLAIM_STRATEGY = os.environ.get("CLAIM_STRATEGY", "random")
 
 
 def generate_user_id():
@@ -22,41 +21,34 @@ def generate_user_id():
 def grab_single_task(user_id):
     """Attempt to grab a single task"""
     try:
-        response = table.query(
-            IndexName="StatusIndex",
-            KeyConditionExpression=Key("Status").eq("RUNNING"),
-            Limit=1,
-        )
-
-        if not response["Items"]:
-            logger.info("No available tasks found")
-            return False
+        result = claim.claim_task(table, user_id, strategy=CLAIM_STRATEGY)
+    except Exception as e:
+        logger.error(f"Error grabbing task: {str(e)}", exc_info=True)
+        metrics.add_metric(name="GrabErrors", unit=MetricUnit.Count, value=1)
+        return False
 
-        task = response["Items"][0]
-        logger.info(f"Found available task: {task['TaskId']}")
+    metrics.add_metric(name="ClaimAttempts", unit=MetricUnit.Count, value=result.attempts)
+    metrics.add_metric(name="ClaimConflicts", unit=MetricUnit.Count, value=result.conflicts)
+    metrics.add_metric(
+        name="ClaimLatency", unit=MetricUnit.Milliseconds, value=result.elapsed * 1000
+    )
 
-        table.update_item(
-            Key={"PK": task["PK"], "SK": task["SK"]},
-            UpdateExpression="SET #status = :new_status, AssignedTo = :user, UpdatedAt = :now",
-            ConditionExpression="#status = :old_status",
-            ExpressionAttributeNames={"#status": "Status"},
-            ExpressionAttributeValues={
-                ":new_status": "ASSIGNED",
-                ":old_status": "RUNNING",
-                ":user": user_id,
-                ":now": datetime.now(timezone.utc).isoformat(),
-            },
+    if result.task is None:
+        logger.info(
+            f"No task claimed after {result.attempts} attempts (timed out: {result.timed_out})"
         )
-        logger.info(f"Task {task['TaskId']} assigned to user {user_id}")
-        return True
-
-    except Exception as e:
-        logger.error(f"Error grabbing task: {str(e)}", exc_info=True)
+        metrics.add_metric(name="GrabMisses", unit=MetricUnit.Count, value=1)
         return False
 
+    logger.info(
+        f"Task {result.task['TaskId']} assigned to user {user_id} after {result.attempts} attempts"
+    )
+    return True
+
 
 @logger.inject_lambda_context
 @metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
 def lambda_handler(event: dict, context: LambdaContext):
     # Generate random number of tasks to grab (5-15)
     num_tasks = random.randint(5, 15)
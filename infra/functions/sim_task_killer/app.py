@@ -1,78 +1,106 @@
-import boto3
 import random
 import os
-from boto3.dynamodb.conditions import Key
 from aws_lambda_powertools import Logger, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fargate_pool import capacity, clients, keys, profiles, recycle, teardown
 
 logger = Logger()
 metrics = Metrics()
 
-dynamodb = boto3.resource("dynamodb")
-ecs = boto3.client("ecs")
-table = dynamodb.Table(os.environ["TABLE_NAME"])
+ecs = clients.client("ecs")
+table = clients.table(os.environ["TABLE_NAME"], operation=capacity.KILL)
 CLUSTER_NAME = os.environ["CLUSTER_NAME"]
+# Share of finished sessions released back to the pool instead of killed
+RECYCLE_PERCENTAGE = float(os.environ.get("RECYCLE_PERCENTAGE", "0"))
+MAX_REUSE = int(os.environ.get("MAX_REUSE", str(recycle.MAX_REUSE)))
+MAX_AGE_SECONDS = int(os.environ.get("MAX_AGE_SECONDS", str(recycle.MAX_AGE_SECONDS)))
+RELEASE_WORKERS = 8
 
 
-def delete_single_task():
-    """Attempt to delete a single assigned task"""
-    try:
-        # Query for an assigned task
+def find_assigned_tasks(count):
+    """Up to `count` assigned tasks of any profile, visiting the shards in random order"""
+    tasks = []
+    names = list(profiles.load_profiles(table))
+    pools = [(profile, shard) for shard in keys.scattered_shards() for profile in names]
+    for profile, shard in pools:
+        if len(tasks) >= count:
+            break
         response = table.query(
-            IndexName="StatusIndex",
-            KeyConditionExpression=Key("Status").eq("ASSIGNED"),
-            Limit=1,
+            IndexName=keys.STATUS_INDEX,
+            KeyConditionExpression="StatusShard = :status_shard",
+            ExpressionAttributeValues={
+                ":status_shard": keys.status_key("ASSIGNED", shard, profile)
+            },
+            Limit=count - len(tasks),
         )
+        tasks.extend(response["Items"])
+    return tasks
 
-        if not response["Items"]:
-            logger.info("No assigned tasks found to delete")
-            return False
 
-        task = response["Items"][0]
-        task_id = task["TaskId"]
-        ecs_task_arn = task.get("EcsTaskArn")
+def release_tasks(tasks):
+    """Release `tasks` in parallel. Returns a Counter of outcomes."""
 
-        logger.info(f"Found assigned task to delete: {task_id}")
+    def release(task):
+        try:
+            return recycle.release_task(
+                table,
+                ecs,
+                CLUSTER_NAME,
+                task["TaskId"],
+                task.get("AssignedTo"),
+                max_reuse=MAX_REUSE,
+                max_age_seconds=MAX_AGE_SECONDS,
+            ).outcome
+        except recycle.ReleaseError:
+            return recycle.NOT_ASSIGNED
 
-        # Stop the ECS task
-        if ecs_task_arn:
-            try:
-                ecs.stop_task(
-                    cluster=CLUSTER_NAME,
-                    task=ecs_task_arn.split("/")[-1],  # Extract task ID from ARN
-                    reason="Task deletion by cleanup function",
-                )
-                logger.info(f"Stopped ECS task: {ecs_task_arn}")
-            except Exception as e:
-                logger.error(f"Error stopping ECS task {ecs_task_arn}: {str(e)}")
-                # Continue with DynamoDB deletion even if ECS task stop fails
-
-        # Delete the task from DynamoDB
-        table.delete_item(
-            Key={"PK": task["PK"], "SK": task["SK"]},
-            ConditionExpression="attribute_exists(PK)",
-        )
-
-        metrics.add_metric(name="TaskKilled", unit=MetricUnit.Count, value=1)
-        logger.info(f"Deleted task {task_id} from DynamoDB")
-        return True
-
-    except Exception as e:
-        logger.error(f"Error deleting task: {str(e)}", exc_info=True)
-        return False
+    with ThreadPoolExecutor(max_workers=RELEASE_WORKERS) as executor:
+        return Counter(executor.map(release, tasks))
 
 
 @logger.inject_lambda_context
 @metrics.log_metrics(capture_cold_start_metric=True)
+@capacity.log_capacity(metrics)
 def lambda_handler(event: dict, context: LambdaContext):
     # Generate random number of tasks to delete (5-15)
     num_tasks = random.randint(5, 14)
     logger.info(f"Attempting to delete {num_tasks} assigned tasks")
 
-    # Try to delete the specified number of tasks
-    for _ in range(num_tasks):
-        delete_single_task()
+    tasks = find_assigned_tasks(num_tasks)
+    if not tasks:
+        logger.info("No assigned tasks found to delete")
+        return {"statusCode": 200}
+
+    # Some sessions end with a release: the task is reset and reused
+    released = [task for task in tasks if random.uniform(0, 100) < RECYCLE_PERCENTAGE]
+    if released:
+        outcomes = release_tasks(released)
+        logger.info(f"Released {len(released)} tasks: {dict(outcomes)}")
+        metrics.add_metric(
+            name="TaskReleased", unit=MetricUnit.Count, value=outcomes[recycle.RECYCLED]
+        )
+        metrics.add_metric(
+            name="TaskRetiredOnRelease", unit=MetricUnit.Count, value=outcomes[recycle.RETIRED]
+        )
+        tasks = [task for task in tasks if task not in released]
+        if not tasks:
+            return {"statusCode": 200}
+
+    # Rows are batch-deleted and the tasks stopped in parallel
+    result = teardown.teardown(
+        table, ecs, CLUSTER_NAME, tasks, reason="Task deletion by cleanup function"
+    )
+    logger.info(result.summary())
+    metrics.add_metric(name="TaskKilled", unit=MetricUnit.Count, value=result.rows_deleted)
+    if result.delete_failures or result.stop_failures:
+        metrics.add_metric(
+            name="TaskKillErrors",
+            unit=MetricUnit.Count,
+            value=result.delete_failures + result.stop_failures,
+        )
 
     return {
         "statusCode": 200,
@@ -0,0 +1,5 @@
+"""Code shared by the pool functions, the local API and the scripts.
+
+Deployed as a Lambda layer; the API image and the scripts import it
+straight from this directory.
+"""
@@ -0,0 +1,183 @@
+"""Consumed DynamoDB capacity, per logical operation and index.
+
+Every call made through clients.Table asks for ReturnConsumedCapacity=INDEXES
+and adds what DynamoDB reports to a process-wide ledger. Entries are keyed by
+the operation the table was opened for (clients.table(name, operation=GRAB))
+and by what was read or written: the table itself, or one of its indexes.
+A write is billed on the table and on every index it changes.
+
+Lambda handlers wrapped in `log_capacity` emit what their invocation
+consumed as metrics, the API serves the ledger on /capacity, and the bench
+reports it per scenario.
+
+DynamoDB does not report the capacity of a write that fails its condition,
+so the ledger leaves out the writes lost to conflicts.
+"""
+import functools
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+RETURN_CONSUMED_CAPACITY = "INDEXES"
+TABLE = "table"
+
+# Logical operations
+GRAB = "grab"
+LAUNCH = "launch"
+MONITOR = "monitor"
+DRAIN = "drain"
+KILL = "kill"
+RELEASE = "release"
+HEARTBEAT = "heartbeat"
+STREAM = "stream"
+SIZE = "size"
+RECONCILE = "reconcile"
+RECLAIM = "reclaim"
+DRIFT = "drift"
+ADMIN = "admin"
+OTHER = "other"
+
+
+@dataclass
+class Consumed:
+    read: float = 0.0
+    write: float = 0.0
+
+    def __add__(self, other):
+        return Consumed(self.read + other.read, self.write + other.write)
+
+    def __sub__(self, other):
+        return Consumed(self.read - other.read, self.write - other.write)
+
+
+def _units(capacity, is_write):
+    read = capacity.get("ReadCapacityUnits")
+    write = capacity.get("WriteCapacityUnits")
+    if read is None and write is None:
+        # Only the total is reported; the kind of call tells what it was spent on
+        units = float(capacity.get("CapacityUnits", 0))
+        return Consumed(write=units) if is_write else Consumed(read=units)
+    return Consumed(float(read or 0), float(write or 0))
+
+
+class Ledger:
+    """Capacity consumed by this process, by (operation, table or index)"""
+
+    def __init__(self):
+        self.consumed = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, operation, consumed_capacity, is_write=False):
+        """Add the ConsumedCapacity of a response: one entry, or a list for batch calls"""
+        operation = operation or OTHER
+        if consumed_capacity is None:
+            return
+        if isinstance(consumed_capacity, dict):
+            consumed_capacity = [consumed_capacity]
+
+        spent = []
+        for capacity in consumed_capacity:
+            if "Table" in capacity or "GlobalSecondaryIndexes" in capacity:
+                spent.append((TABLE, _units(capacity.get("Table", {}), is_write)))
+                spent.extend(
+                    (index, _units(units, is_write))
+                    for index, units in capacity.get("GlobalSecondaryIndexes", {}).items()
+                )
+            else:
+                spent.append((TABLE, _units(capacity, is_write)))
+
+        with self._lock:
+            self.calls[operation] += 1
+            for target, units in spent:
+                key = (operation, target)
+                self.consumed[key] = self.consumed.get(key, Consumed()) + units
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.consumed), Counter(self.calls)
+
+    def since(self, snapshot):
+        """What was consumed after `snapshot` was taken"""
+        consumed, calls = self.snapshot()
+        before, calls_before = snapshot
+        return (
+            {key: units - before.get(key, Consumed()) for key, units in consumed.items()},
+            calls - calls_before,
+        )
+
+    def reset(self):
+        with self._lock:
+            self.consumed.clear()
+            self.calls.clear()
+
+
+LEDGER = Ledger()
+
+
+def report(snapshot=None):
+    """Consumed capacity per operation, with its split over the table and indexes.
+
+    {operation: {"calls", "read", "write", "targets": {target: {"read", "write"}}}},
+    costliest operation first.
+    """
+    consumed, calls = snapshot or LEDGER.snapshot()
+    operations = {}
+    for (operation, target), units in sorted(consumed.items()):
+        entry = operations.setdefault(
+            operation, {"calls": calls.get(operation, 0), "read": 0.0, "write": 0.0, "targets": {}}
+        )
+        entry["read"] += units.read
+        entry["write"] += units.write
+        entry["targets"][target] = {"read": units.read, "write": units.write}
+    return dict(
+        sorted(operations.items(), key=lambda item: item[1]["read"] + item[1]["write"], reverse=True)
+    )
+
+
+def format_report(operations=None):
+    """A `report` as a table: calls, RCU and WCU per operation and per table or index"""
+    lines = [f"{'operation':<12}{'target':<20}{'calls':>8}{'RCU':>12}{'WCU':>12}"]
+    for operation, entry in (operations or report()).items():
+        lines.append(
+            f"{operation:<12}{'':<20}{entry['calls']:>8}{entry['read']:>12.1f}{entry['write']:>12.1f}"
+        )
+        for target, units in entry["targets"].items():
+            lines.append(f"{'':<12}{target:<20}{'':>8}{units['read']:>12.1f}{units['write']:>12.1f}")
+    return "\n".join(lines)
+
+
+def add_metrics(metrics, snapshot):
+    """ConsumedReadCapacity_<operation>[_<index>] and ConsumedWriteCapacity_... metrics"""
+    for operation, entry in report(snapshot).items():
+        for kind, total in (("Read", entry["read"]), ("Write", entry["write"])):
+            if total:
+                metrics.add_metric(name=f"Consumed{kind}Capacity_{operation}", unit="Count", value=total)
+        for target, units in entry["targets"].items():
+            if target == TABLE:
+                continue
+            for kind, value in (("Read", units["read"]), ("Write", units["write"])):
+                if value:
+                    metrics.add_metric(
+                        name=f"Consumed{kind}Capacity_{operation}_{target}", unit="Count", value=value
+                    )
+
+
+def log_capacity(metrics):
+    """Handler decorator: add the capacity each invocation consumed to `metrics`.
+
+    Goes below @metrics.log_metrics, which flushes them.
+    """
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            before = LEDGER.snapshot()
+            try:
+                return handler(event, context)
+            finally:
+                add_metrics(metrics, LEDGER.since(before))
+
+        return wrapper
+
+    return decorator
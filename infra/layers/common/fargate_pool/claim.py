@@ -0,0 +1,266 @@
+"""Claiming warm tasks for users.
+
+Every caller used to read the first RUNNING row and race everyone else for
+it. Instead a claim reads a page of candidates and walks it in a caller
+specific order, so concurrent claims mostly try different rows. A lost race
+just moves on to the next candidate until the latency budget runs out.
+
+Claims take tasks of one pool profile, optionally falling back to other
+profiles (larger shapes, see profiles.larger_profiles) in the order given
+when the requested one has no task left.
+
+Candidates are read from the sparse available index (see keys.py), whose
+entries hold just the keys, PublicIp and CapacityProvider. The assignment
+removes a row's AvailableShard, so a claimed row drops out of the index.
+
+An assignment comes with a lease of `lease_seconds` (see leases.py).
+"""
+import hashlib
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from fargate_pool import keys, leases
+
+CANDIDATE_PAGE_SIZE = 25
+CLAIM_BUDGET_SECONDS = 1.0
+
+# One lost race cancels a whole transaction, so bulk claims use small ones
+TRANSACTION_SIZE = 25
+BULK_CLAIM_BUDGET_SECONDS = 5.0
+
+STRATEGIES = ("random", "hash")
+
+SPOT = "FARGATE_SPOT"
+
+
+@dataclass
+class ClaimResult:
+    task: Optional[dict]
+    attempts: int
+    conflicts: int
+    elapsed: float
+    timed_out: bool
+
+
+@dataclass
+class BulkClaimResult:
+    assigned: dict
+    short: list
+    transactions: int
+    conflicts: int
+    elapsed: float
+
+
+def _user_hash(user_id):
+    return int.from_bytes(hashlib.md5(user_id.encode()).digest()[:4], "big")
+
+
+def _shard_order(user_id, strategy):
+    if strategy == "hash":
+        start = _user_hash(user_id) % keys.POOL_SHARDS
+        return [(start + i) % keys.POOL_SHARDS for i in range(keys.POOL_SHARDS)]
+    return keys.scattered_shards()
+
+
+def _prefer(candidates, prefer_spot):
+    """Stable sort putting spot tasks first (or last), keeping the order otherwise"""
+    if prefer_spot is None:
+        return candidates
+    return sorted(candidates, key=lambda task: (task.get("CapacityProvider") == SPOT) != prefer_spot)
+
+
+def _candidate_order(candidates, user_id, strategy, prefer_spot=None):
+    if strategy == "hash" and candidates:
+        offset = _user_hash(user_id) % len(candidates)
+        return _prefer(candidates[offset:] + candidates[:offset], prefer_spot)
+    candidates = list(candidates)
+    random.shuffle(candidates)
+    return _prefer(candidates, prefer_spot)
+
+
+def _pool_order(profiles, shards):
+    """(profile, shard) pairs: every shard of a profile before the next profile"""
+    return [(profile, shard) for profile in dict.fromkeys(profiles) for shard in shards]
+
+
+def _available_query(shard, profile, limit):
+    return {
+        "IndexName": keys.AVAILABLE_INDEX,
+        "KeyConditionExpression": f"{keys.available_index_key()} = :available_shard",
+        "ExpressionAttributeValues": {":available_shard": keys.available_key(shard, profile)},
+        "Limit": limit,
+    }
+
+
+def _assign_update(task, user_id, lease_expires_at, profile):
+    """Conditional RUNNING -> ASSIGNED update of one task row; it leaves the available index"""
+    shard = keys.shard_for(keys.task_id_of(task))
+    return {
+        "Key": {"PK": task["PK"], "SK": task["SK"]},
+        "UpdateExpression": "SET #status = :new_status, StatusShard = :status_shard, AssignedTo = :user, LeaseExpiresAt = :lease, UpdatedAt = :now REMOVE AvailableShard",
+        "ConditionExpression": "#status = :old_status",
+        "ExpressionAttributeNames": {"#status": "Status"},
+        "ExpressionAttributeValues": {
+            ":new_status": "ASSIGNED",
+            ":status_shard": keys.status_key("ASSIGNED", shard, profile),
+            ":old_status": "RUNNING",
+            ":user": user_id,
+            ":lease": lease_expires_at,
+            ":now": datetime.utcnow().isoformat(),
+        },
+    }
+
+
+def _assign(table, task, user_id, lease_seconds, profile):
+    response = table.update_item(
+        **_assign_update(task, user_id, leases.expires_at(lease_seconds), profile),
+        ReturnValues="ALL_NEW",
+    )
+    return response["Attributes"]
+
+
+def claim_task(
+    table,
+    user_id,
+    strategy="random",
+    page_size=CANDIDATE_PAGE_SIZE,
+    budget=CLAIM_BUDGET_SECONDS,
+    prefer_spot=None,
+    profile=keys.DEFAULT_PROFILE,
+    fallbacks=(),
+    lease_seconds=leases.LEASE_SECONDS,
+):
+    """Assign a RUNNING task of `profile` to `user_id`.
+
+    Candidates are ordered at random, or by a hash of the user id when
+    `strategy` is "hash". With `prefer_spot` True (short sessions) spot tasks
+    are tried first, with False (long sessions) on-demand tasks; within a
+    page only. The `fallbacks` profiles are tried in order once `profile`
+    has no task left. Returns a ClaimResult whose `task` is the assigned
+    row, or None when no task could be claimed.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown claim strategy: {strategy}")
+
+    started = time.monotonic()
+    deadline = started + budget
+    attempts = conflicts = 0
+
+    def result(task, timed_out=False):
+        return ClaimResult(task, attempts, conflicts, time.monotonic() - started, timed_out)
+
+    for pool, shard in _pool_order([profile, *fallbacks], _shard_order(user_id, strategy)):
+        if time.monotonic() >= deadline:
+            return result(None, timed_out=True)
+
+        response = table.query(**_available_query(shard, pool, page_size))
+
+        for task in _candidate_order(response["Items"], user_id, strategy, prefer_spot):
+            if time.monotonic() >= deadline:
+                return result(None, timed_out=True)
+
+            attempts += 1
+            try:
+                return result(_assign(table, task, user_id, lease_seconds, pool))
+            except table.exceptions.ConditionalCheckFailedException:
+                # Someone else claimed it first, try the next candidate
+                conflicts += 1
+
+    return result(None)
+
+
+def _transact_assign(table, pairs, lease_expires_at, profile):
+    """Assign (user id, task) pairs of `profile` in one transaction.
+
+    Returns the tasks that made the transaction fail; an empty list means
+    every pair was assigned.
+    """
+    try:
+        table.transact_write_items(
+            [
+                {"Update": _assign_update(task, user_id, lease_expires_at, profile)}
+                for user_id, task in pairs
+            ]
+        )
+        return []
+    except table.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get("CancellationReasons", [])
+        lost = [
+            task
+            for (_, task), reason in zip(pairs, reasons)
+            if reason.get("Code") not in (None, "None")
+        ]
+        # Without reasons we can't tell which row was taken, so drop them all
+        return lost or [task for _, task in pairs]
+
+
+def claim_tasks(
+    table,
+    user_ids,
+    budget=BULK_CLAIM_BUDGET_SECONDS,
+    prefer_spot=None,
+    profile=keys.DEFAULT_PROFILE,
+    fallbacks=(),
+    lease_seconds=leases.LEASE_SECONDS,
+):
+    """Assign one RUNNING task of `profile` to each of `user_ids`.
+
+    Candidates are read a page per shard of the available index and claimed
+    in TransactWriteItems chunks of TRANSACTION_SIZE, each update
+    conditioned on Status = RUNNING.
+    Users of a cancelled chunk are retried with the remaining candidates.
+    Every assignment is a separate item update, so the stream still refills
+    the pool once per assigned task. Partial fulfilment is allowed: users
+    left without a task are reported in `short`. `prefer_spot` and
+    `fallbacks` work like in `claim_task`.
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    remaining = list(dict.fromkeys(user_ids))
+    assigned = {}
+    transactions = conflicts = 0
+
+    for pool, shard in _pool_order([profile, *fallbacks], keys.scattered_shards()):
+        if not remaining or time.monotonic() >= deadline:
+            break
+
+        response = table.query(
+            **_available_query(shard, pool, min(len(remaining) + TRANSACTION_SIZE, 1000))
+        )
+        candidates = response["Items"]
+        random.shuffle(candidates)
+        candidates = _prefer(candidates, prefer_spot)
+
+        while remaining and candidates and time.monotonic() < deadline:
+            size = min(TRANSACTION_SIZE, len(remaining), len(candidates))
+            pairs = list(zip(remaining[:size], candidates[:size]))
+            candidates = candidates[size:]
+            transactions += 1
+
+            lease_expires_at = leases.expires_at(lease_seconds)
+            lost = _transact_assign(table, pairs, lease_expires_at, pool)
+            if lost:
+                # Put the untouched candidates of the chunk back and retry its users
+                conflicts += len(lost)
+                lost_keys = {task["SK"] for task in lost}
+                candidates = [task for _, task in pairs if task["SK"] not in lost_keys] + candidates
+                continue
+
+            for user_id, task in pairs:
+                # The index entry, completed with what the assignment wrote
+                assigned[user_id] = {
+                    **{name: value for name, value in task.items() if name != "AvailableShard"},
+                    "TaskId": keys.task_id_of(task),
+                    "Profile": pool,
+                    "Status": "ASSIGNED",
+                    "AssignedTo": user_id,
+                    "LeaseExpiresAt": lease_expires_at,
+                }
+            remaining = remaining[size:]
+
+    return BulkClaimResult(
+        assigned, remaining, transactions, conflicts, time.monotonic() - started
+    )
@@ -0,0 +1,349 @@
+"""Shared AWS clients.
+
+Clients are created on first use, once per process, with a tuned botocore
+config: adaptive retries, a connection pool sized for the worker threads of
+teardown and the parallel shard reads, short timeouts and TCP keep-alive.
+Functions therefore only pay for the clients a path actually uses.
+
+DynamoDB goes through the low-level client. `Table` mirrors the parts of
+the boto3 Table resource the pool uses (native Python values in and out,
+numbers as Decimal) without loading the resource model, and marshals
+attribute values with plain type dispatch instead of TypeSerializer.
+Conditions are expression strings rather than boto3.dynamodb.conditions.
+Every call returns its consumed capacity, which is added to the ledger of
+fargate_pool/capacity.py under the operation the table was opened for.
+"""
+import os
+import random
+import threading
+import time
+from decimal import Decimal
+
+import boto3
+from botocore.config import Config
+
+from fargate_pool import capacity
+
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+
+CONFIG = Config(
+    retries={"mode": "adaptive", "max_attempts": 5},
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    connect_timeout=2,
+    read_timeout=10,
+    tcp_keepalive=True,
+)
+
+# DynamoDB accepts at most 25 writes per BatchWriteItem call
+BATCH_WRITE_MAX = 25
+# Calls per batch of writes, the first one included, before unprocessed ones are given up
+BATCH_WRITE_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_MAX_SECONDS = 5.0
+
+# Error codes of calls that exceeded a rate or throughput limit, in any service the
+# pool calls; the adaptive retries above gave up on them
+THROTTLING_ERRORS = frozenset(
+    {
+        "ThrottlingException",
+        "TooManyRequestsException",
+        "RequestLimitExceeded",
+        "ProvisionedThroughputExceededException",
+    }
+)
+
+_clients = {}
+_lock = threading.Lock()
+
+
+class UnprocessedItemsError(Exception):
+    """Writes DynamoDB left unprocessed through every attempt"""
+
+    def __init__(self, requests):
+        super().__init__(f"{len(requests)} writes left unprocessed")
+        self.requests = requests
+
+
+def backoff(attempt):
+    """Full jitter exponential backoff"""
+    time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)))
+
+
+def _create(service_name):
+    client = _clients.get(service_name)
+    if client is None:
+        # Client creation isn't thread-safe; parallel shard reads may race for it
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = boto3.client(
+                    service_name, region_name=os.environ.get("AWS_REGION"), config=CONFIG
+                )
+                _clients[service_name] = client
+    return client
+
+
+class _LazyClient:
+    """Stands in for a boto3 client until its first use"""
+
+    def __init__(self, service_name):
+        self._service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(_create(self._service_name), name)
+
+
+def client(service_name):
+    """Shared low-level client for `service_name`, created on first use"""
+    return _LazyClient(service_name)
+
+
+def error_code(error):
+    """Error code of a botocore ClientError, None for other exceptions"""
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+
+def is_throttling(error):
+    return error_code(error) in THROTTLING_ERRORS
+
+
+def reset():
+    """Forget the shared clients, e.g. after switching credentials or region"""
+    with _lock:
+        _clients.clear()
+
+
+# Marshalling
+
+
+def _serialize_set(value):
+    members = list(value)
+    if all(isinstance(member, str) for member in members):
+        return {"SS": members}
+    if all(isinstance(member, (bytes, bytearray)) for member in members):
+        return {"BS": [bytes(member) for member in members]}
+    return {"NS": [_number(member) for member in members]}
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, Decimal)):
+        raise TypeError(f"Unsupported number {value!r}; DynamoDB numbers must be int or Decimal")
+    return str(value)
+
+
+_SERIALIZERS = {
+    str: lambda value: {"S": value},
+    bool: lambda value: {"BOOL": value},
+    int: lambda value: {"N": str(value)},
+    Decimal: lambda value: {"N": str(value)},
+    type(None): lambda value: {"NULL": True},
+    dict: lambda value: {"M": serialize_item(value)},
+    list: lambda value: {"L": [serialize(member) for member in value]},
+    tuple: lambda value: {"L": [serialize(member) for member in value]},
+    bytes: lambda value: {"B": value},
+    bytearray: lambda value: {"B": bytes(value)},
+    set: _serialize_set,
+    frozenset: _serialize_set,
+}
+
+_DESERIALIZERS = {
+    "S": lambda value: value,
+    "N": Decimal,
+    "BOOL": lambda value: value,
+    "NULL": lambda value: None,
+    "M": lambda value: deserialize_item(value),
+    "L": lambda value: [deserialize(member) for member in value],
+    "B": bytes,
+    "SS": set,
+    "NS": lambda value: {Decimal(member) for member in value},
+    "BS": lambda value: {bytes(member) for member in value},
+}
+
+
+def serialize(value):
+    """Python value -> DynamoDB attribute value"""
+    serializer = _SERIALIZERS.get(type(value))
+    if serializer is None:
+        # Subclasses (str enums and the like) take the slow path
+        serializer = next(
+            (_SERIALIZERS[kind] for kind in _SERIALIZERS if isinstance(value, kind)), None
+        )
+        if isinstance(value, float):
+            raise TypeError("Float types are not supported. Use Decimal types instead.")
+        if serializer is None:
+            raise TypeError(f"Unsupported type {type(value).__name__} for DynamoDB value {value!r}")
+    return serializer(value)
+
+
+def deserialize(attribute):
+    """DynamoDB attribute value -> Python value"""
+    ((tag, value),) = attribute.items()
+    return _DESERIALIZERS[tag](value)
+
+
+def serialize_item(item):
+    return {name: serialize(value) for name, value in item.items()}
+
+
+def deserialize_item(item):
+    return {name: deserialize(value) for name, value in item.items()}
+
+
+_WRITES = ("put_item", "update_item", "delete_item")
+_MARSHALLED_PARAMS = ("Key", "Item", "ExclusiveStartKey", "ExpressionAttributeValues")
+_UNMARSHALLED_RESPONSES = ("Item", "Attributes", "LastEvaluatedKey")
+
+
+def _marshal(params):
+    return {
+        name: serialize_item(value) if name in _MARSHALLED_PARAMS else value
+        for name, value in params.items()
+    }
+
+
+def _unmarshal_params(params):
+    """Parameters echoed back by DynamoDB, e.g. an unprocessed write request"""
+    return {
+        name: deserialize_item(value) if name in _MARSHALLED_PARAMS else value
+        for name, value in params.items()
+    }
+
+
+def _unmarshal(response):
+    for name in _UNMARSHALLED_RESPONSES:
+        if name in response:
+            response[name] = deserialize_item(response[name])
+    if "Items" in response:
+        response["Items"] = [deserialize_item(item) for item in response["Items"]]
+    return response
+
+
+class Table:
+    """One DynamoDB table on the shared low-level client.
+
+    Takes and returns native Python values, like the boto3 Table resource.
+    The capacity its calls consume is recorded under `operation`.
+    """
+
+    def __init__(self, name, operation=None):
+        self.name = name
+        self.operation = operation
+
+    def for_operation(self, operation):
+        """The same table, with its calls recorded under `operation`"""
+        return Table(self.name, operation)
+
+    @property
+    def client(self):
+        return _create("dynamodb")
+
+    @property
+    def exceptions(self):
+        return self.client.exceptions
+
+    def _record(self, response, is_write):
+        capacity.LEDGER.record(self.operation, response.get("ConsumedCapacity"), is_write)
+        return response
+
+    def _call(self, operation, params):
+        response = getattr(self.client, operation)(
+            TableName=self.name,
+            ReturnConsumedCapacity=capacity.RETURN_CONSUMED_CAPACITY,
+            **_marshal(params),
+        )
+        return _unmarshal(self._record(response, operation in _WRITES))
+
+    def get_item(self, **params):
+        return self._call("get_item", params)
+
+    def put_item(self, **params):
+        return self._call("put_item", params)
+
+    def update_item(self, **params):
+        return self._call("update_item", params)
+
+    def delete_item(self, **params):
+        return self._call("delete_item", params)
+
+    def query(self, **params):
+        return self._call("query", params)
+
+    def scan(self, **params):
+        return self._call("scan", params)
+
+    def batch_write_item(self, requests):
+        """Up to 25 PutRequest/DeleteRequest entries. Returns the unprocessed ones."""
+        response = self.client.batch_write_item(
+            RequestItems={
+                self.name: [
+                    {kind: _marshal(request) for kind, request in entry.items()}
+                    for entry in requests
+                ]
+            },
+            ReturnConsumedCapacity=capacity.RETURN_CONSUMED_CAPACITY,
+        )
+        self._record(response, is_write=True)
+        # Native values again, so they can be passed straight back in
+        return [
+            {kind: _unmarshal_params(request) for kind, request in entry.items()}
+            for entry in response.get("UnprocessedItems", {}).get(self.name, [])
+        ]
+
+    def transact_write_items(self, items):
+        """Put/Update/Delete/ConditionCheck entries on this table, all or nothing"""
+        response = self.client.transact_write_items(
+            TransactItems=[
+                {kind: {"TableName": self.name, **_marshal(action)} for kind, action in item.items()}
+                for item in items
+            ],
+            ReturnConsumedCapacity=capacity.RETURN_CONSUMED_CAPACITY,
+        )
+        return self._record(response, is_write=True)
+
+    def batch_writer(self):
+        return BatchWriter(self)
+
+
+class BatchWriter:
+    """Buffers puts and deletes into BatchWriteItem calls, resending unprocessed items.
+
+    Unprocessed items are resent after a backoff, up to BATCH_WRITE_ATTEMPTS
+    calls per batch; what is still left then raises UnprocessedItemsError.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._requests = []
+
+    def put_item(self, Item):
+        self._add({"PutRequest": {"Item": Item}})
+
+    def delete_item(self, Key):
+        self._add({"DeleteRequest": {"Key": Key}})
+
+    def _add(self, request):
+        self._requests.append(request)
+        if len(self._requests) >= BATCH_WRITE_MAX:
+            self._flush()
+
+    def _flush(self):
+        batch, self._requests = self._requests[:BATCH_WRITE_MAX], self._requests[BATCH_WRITE_MAX:]
+        for attempt in range(BATCH_WRITE_ATTEMPTS):
+            if attempt:
+                backoff(attempt)
+            batch = self.table.batch_write_item(batch)
+            if not batch:
+                return
+        raise UnprocessedItemsError(batch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        while self._requests:
+            self._flush()
+
+
+def table(name, operation=None):
+    """`name` on the shared client, its consumed capacity recorded under `operation`"""
+    return Table(name, operation)
@@ -0,0 +1,136 @@
+"""Aggregate pool counters.
+
+A single item holds the number of task rows per status, overall, per
+shard, per capacity provider and per pool profile (attributes `RUNNING`,
+`RUNNING#3`, `RUNNING#FARGATE_SPOT`, `RUNNING#PROFILE#large`, ...). It is
+kept up to date from the table stream, so reading the pool size is one GetItem no matter how big the pool is.
+`count_statuses` recounts from the status index and is used by the periodic
+drift check, which keeps the drift it saw last in a second item.
+"""
+from collections import Counter
+
+from fargate_pool import keys
+
+COUNTER_KEY = {"PK": "POOL#COUNTERS", "SK": "COUNTERS"}
+DRIFT_KEY = {"PK": "POOL#COUNTERS", "SK": "DRIFT"}
+
+STATUSES = ("LAUNCHING", "RUNNING", "ASSIGNED", "DRAINING", "ERROR")
+
+# Rows launched before capacity providers were recorded ran on on-demand Fargate
+DEFAULT_CAPACITY_PROVIDER = "FARGATE"
+
+
+def provider_field(status, capacity_provider):
+    return f"{status}#{capacity_provider}"
+
+
+def profile_field(status, profile):
+    return f"{status}#PROFILE#{profile}"
+
+
+def _fields(status, shard, capacity_provider=None, profile=None):
+    fields = [status]
+    if shard is not None:
+        fields.append(f"{status}#{shard}")
+    if capacity_provider is not None:
+        fields.append(provider_field(status, capacity_provider))
+    if profile is not None:
+        fields.append(profile_field(status, profile))
+    return fields
+
+
+def _image_fields(image):
+    """Counter attributes a stream image counts towards"""
+    if not image or not image.get("PK", {}).get("S", "").startswith(keys.LEGACY_PK):
+        return []
+    status = image.get("Status", {}).get("S")
+    if status is None:
+        return []
+    shard = image.get("Shard", {}).get("N")
+    capacity_provider = image.get("CapacityProvider", {}).get("S", DEFAULT_CAPACITY_PROVIDER)
+    profile = image.get("Profile", {}).get("S", keys.DEFAULT_PROFILE)
+    return _fields(status, shard, capacity_provider, profile)
+
+
+def record_deltas(record):
+    """Counter changes caused by one DynamoDB stream record"""
+    deltas = Counter()
+    for field in _image_fields(record["dynamodb"].get("OldImage")):
+        deltas[field] -= 1
+    for field in _image_fields(record["dynamodb"].get("NewImage")):
+        deltas[field] += 1
+    return deltas
+
+
+def apply_deltas(table, deltas):
+    """Atomically add `deltas` to the counter item with a single write"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    names, values, actions = {}, {}, []
+    for i, (field, delta) in enumerate(sorted(deltas.items())):
+        names[f"#f{i}"] = field
+        values[f":v{i}"] = delta
+        actions.append(f"#f{i} :v{i}")
+
+    table.update_item(
+        Key=COUNTER_KEY,
+        UpdateExpression="ADD " + ", ".join(actions),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+def read_counts(table):
+    """Current counters as {attribute: count}"""
+    item = table.get_item(Key=COUNTER_KEY).get("Item", {})
+    return {
+        field: int(value) for field, value in item.items() if field not in COUNTER_KEY
+    }
+
+
+def read_drift(table):
+    """Drift the previous check saw and did not correct, as {attribute: delta}"""
+    item = table.get_item(Key=DRIFT_KEY).get("Item", {})
+    return {field: int(delta) for field, delta in item.get("Drift", {}).items()}
+
+
+def write_drift(table, drift):
+    table.put_item(Item={**DRIFT_KEY, "Drift": dict(drift)})
+
+
+def count_statuses(table, statuses=STATUSES, profiles=(keys.DEFAULT_PROFILE,)):
+    """Recount every status, shard, capacity provider and profile from the status index"""
+    counts = Counter()
+    for status in statuses:
+        counts[status] += 0
+        for profile in profiles:
+            counts[profile_field(status, profile)] += 0
+            for shard in range(keys.POOL_SHARDS):
+                query_params = {
+                    "IndexName": keys.STATUS_INDEX,
+                    "KeyConditionExpression": "StatusShard = :status_shard",
+                    "ExpressionAttributeValues": {
+                        ":status_shard": keys.status_key(status, shard, profile)
+                    },
+                    # Reads the same items as a COUNT, but tells the capacity providers apart
+                    "ProjectionExpression": "CapacityProvider",
+                }
+                while True:
+                    response = table.query(**query_params)
+                    for item in response["Items"]:
+                        capacity_provider = item.get(
+                            "CapacityProvider", DEFAULT_CAPACITY_PROVIDER
+                        )
+                        for field in _fields(status, shard, capacity_provider, profile):
+                            counts[field] += 1
+                    if "LastEvaluatedKey" not in response:
+                        break
+                    query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return counts
+
+
+def profile_counts(pool, profile):
+    """{status: count} of one profile from the counters"""
+    return {status: pool.get(profile_field(status, profile), 0) for status in STATUSES}
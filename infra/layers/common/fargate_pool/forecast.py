@@ -0,0 +1,126 @@
+"""Demand forecast and warm pool sizing.
+
+The sizer keeps an EWMA of the grab arrival rate plus an hour-of-day profile
+of it, blends the two for the moment a task launched now would become ready,
+and sizes the warm pool to cover the grabs expected during one startup, plus
+a safety stock for Poisson-like burstiness:
+
+    demand = forecast rate * startup latency * headroom
+    target = ceil(demand + safety * sqrt(demand)), within [min, max]
+
+Everything here is pure and works on a plain dict state, so the same code
+drives the scheduled sizer and the offline replay in scripts/replay_forecast.py.
+"""
+import math
+import os
+from dataclasses import dataclass
+
+SLOTS_PER_DAY = 24
+
+
+@dataclass
+class SizerConfig:
+    min_size: int = 0
+    max_size: int = 500
+    alpha: float = 0.3  # weight of the latest minute in the rate EWMA
+    profile_alpha: float = 0.1  # weight of the latest minute in its hour-of-day slot
+    profile_weight: float = 0.5  # share of the hour-of-day profile in the forecast
+    headroom: float = 1.2
+    safety: float = 2.0  # standard deviations of safety stock
+    default_startup: float = 60.0  # seconds, until launches have been observed
+    scale_up_cooldown: float = 60.0
+    scale_down_cooldown: float = 600.0
+    max_step_down: int = 10
+    min_idle_seconds: float = 600.0  # only tasks idle this long are retired
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            min_size=int(os.environ.get("POOL_MIN_SIZE", cls.min_size)),
+            max_size=int(os.environ.get("POOL_MAX_SIZE", cls.max_size)),
+            headroom=float(os.environ.get("POOL_HEADROOM", cls.headroom)),
+            safety=float(os.environ.get("POOL_SAFETY", cls.safety)),
+            scale_up_cooldown=float(os.environ.get("SCALE_UP_COOLDOWN", cls.scale_up_cooldown)),
+            scale_down_cooldown=float(
+                os.environ.get("SCALE_DOWN_COOLDOWN", cls.scale_down_cooldown)
+            ),
+            max_step_down=int(os.environ.get("MAX_STEP_DOWN", cls.max_step_down)),
+            min_idle_seconds=float(os.environ.get("MIN_IDLE_SECONDS", cls.min_idle_seconds)),
+        )
+
+
+def new_state(config):
+    return {
+        "Rate": 0.0,
+        "Profile": [None] * SLOTS_PER_DAY,
+        "Startup": config.default_startup,
+        "LastMinute": None,
+        "LastScaleUp": 0.0,
+        "LastScaleDown": 0.0,
+    }
+
+
+def ewma(previous, observation, alpha):
+    if previous is None:
+        return observation
+    return alpha * observation + (1 - alpha) * previous
+
+
+def slot_of(epoch):
+    return int(epoch // 3600) % SLOTS_PER_DAY
+
+
+def observe(state, minute_epoch, grabs, startups, config):
+    """Fold one completed minute into the state.
+
+    `grabs` is the number of grabs in that minute and `startups` the
+    startup latencies (seconds) of the tasks that became ready in it.
+    """
+    rate = grabs / 60.0
+    state["Rate"] = ewma(state["Rate"], rate, config.alpha)
+
+    slot = slot_of(minute_epoch)
+    state["Profile"][slot] = ewma(state["Profile"][slot], rate, config.profile_alpha)
+
+    if startups:
+        state["Startup"] = ewma(state["Startup"], sum(startups) / len(startups), config.alpha)
+
+    state["LastMinute"] = minute_epoch
+    return state
+
+
+def forecast_rate(state, now, config):
+    """Grabs per second expected once a task launched now is ready"""
+    expected = state["Profile"][slot_of(now + state["Startup"])]
+    if expected is None:
+        return state["Rate"]
+    return (1 - config.profile_weight) * state["Rate"] + config.profile_weight * expected
+
+
+def target_size(state, now, config):
+    demand = forecast_rate(state, now, config) * state["Startup"] * config.headroom
+    target = math.ceil(demand + config.safety * math.sqrt(demand))
+    return max(config.min_size, min(config.max_size, target))
+
+
+def decide(state, warm, now, config):
+    """Number of tasks to launch (> 0) or retire (< 0) given `warm` LAUNCHING+RUNNING tasks"""
+    return step(state, target_size(state, now, config), warm, now, config)
+
+
+def step(state, target, warm, now, config):
+    """Move `warm` towards `target`, within the cool-downs recorded in `state`"""
+    if target > warm and now - state["LastScaleUp"] >= config.scale_up_cooldown:
+        state["LastScaleUp"] = now
+        return target - warm
+
+    # Not within a cool-down of scaling up either, so retiring doesn't undo launches in flight
+    if (
+        target < warm
+        and now - state["LastScaleDown"] >= config.scale_down_cooldown
+        and now - state["LastScaleUp"] >= config.scale_down_cooldown
+    ):
+        state["LastScaleDown"] = now
+        return -min(warm - target, config.max_step_down)
+
+    return 0
@@ -0,0 +1,60 @@
+"""Per-minute pool history.
+
+One item per minute (PK = POOL#HISTORY, SK = <UTC minute>) accumulates the
+number of grabs and the observed task startup latencies. Items expire after
+HISTORY_TTL_DAYS through the table TTL on ExpiresAt.
+"""
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+HISTORY_PK = "POOL#HISTORY"
+HISTORY_TTL_DAYS = 8
+
+
+def minute_of(epoch):
+    return int(epoch // 60) * 60
+
+
+def minute_sk(epoch):
+    return datetime.fromtimestamp(minute_of(epoch), timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+
+def record(table, epoch, **amounts):
+    """Add `amounts` (e.g. Grabs=3) to the history item of the minute containing `epoch`"""
+    names, values, actions = {}, {}, []
+    for i, (field, amount) in enumerate(sorted(amounts.items())):
+        names[f"#f{i}"] = field
+        values[f":v{i}"] = Decimal(str(round(amount, 3)))
+        actions.append(f"#f{i} :v{i}")
+    values[":expires"] = int(time.time()) + HISTORY_TTL_DAYS * 86400
+
+    table.update_item(
+        Key={"PK": HISTORY_PK, "SK": minute_sk(epoch)},
+        UpdateExpression="ADD " + ", ".join(actions) + " SET ExpiresAt = :expires",
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+def read_minutes(table, start_epoch, end_epoch):
+    """History items of the minutes in [start_epoch, end_epoch), keyed by minute epoch"""
+    minutes = {}
+    query_params = {
+        "KeyConditionExpression": "PK = :pk AND SK BETWEEN :start AND :end",
+        "ExpressionAttributeValues": {
+            ":pk": HISTORY_PK,
+            ":start": minute_sk(start_epoch),
+            ":end": minute_sk(end_epoch),
+        },
+    }
+    while True:
+        response = table.query(**query_params)
+        for item in response["Items"]:
+            epoch = datetime.strptime(item["SK"], "%Y-%m-%dT%H:%M").replace(tzinfo=timezone.utc)
+            epoch = int(epoch.timestamp())
+            if start_epoch <= epoch < end_epoch:
+                minutes[epoch] = item
+        if "LastEvaluatedKey" not in response:
+            return minutes
+        query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
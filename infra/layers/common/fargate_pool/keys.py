@@ -0,0 +1,118 @@
+"""Key layout of the tasks table.
+
+Pool rows are spread over POOL_SHARDS partitions so that neither the base
+table nor the status index funnels all traffic through one partition:
+
+    PK          = TASK#POOL#<shard>
+    SK          = TASK#<task id>
+    StatusShard = <status>#<shard>   (hash key of the status index)
+    AvailableShard = RUNNING#<shard> (hash key of the available index, claimable rows only)
+
+Rows of a pool profile other than the default one (see profiles.py) carry
+their Profile and are indexed under StatusShard = <status>#<profile>#<shard>,
+so every profile is claimed from partitions of its own.
+
+The available index is sparse: a row carries AvailableShard only while it
+is RUNNING, and the claim that takes it removes the attribute. Claims read
+it instead of the status index, and it projects just what a claim needs
+(PublicIp and CapacityProvider besides the keys). The status index projects
+the few attributes its readers use, so status changes write small entries.
+
+Existing tables get these indexes over several deploys (the IndexRollout
+parameter of the template), which set the index names below. Until the
+available index exists, claims read RUNNING rows from the all-attribute
+StatusShardIndex instead: their StatusShard equals the AvailableShard.
+
+The shard is picked when a task is launched, by hashing its task id. It is
+therefore stable and can be recomputed from the ECS task ARN alone. Changing
+POOL_SHARDS moves that mapping, so run scripts/migrate_shards.py afterwards.
+"""
+import hashlib
+import os
+import random
+
+POOL_SHARDS = int(os.environ.get("POOL_SHARDS", "8"))
+
+STATUS_INDEX = os.environ.get("STATUS_INDEX") or "StatusShardLeanIndex"
+AVAILABLE_INDEX = os.environ.get("AVAILABLE_INDEX") or "AvailableIndex"
+
+# Projects all attributes; dropped by the last IndexRollout stage
+LEGACY_STATUS_INDEX = "StatusShardIndex"
+
+DEFAULT_PROFILE = "default"
+
+# Layout used before sharding; rows are moved off it by scripts/migrate_shards.py
+LEGACY_PK = "TASK#POOL"
+
+
+def shard_for(task_id):
+    """Stable shard of a task id"""
+    digest = hashlib.md5(task_id.encode()).digest()
+    return int.from_bytes(digest[:4], "big") % POOL_SHARDS
+
+
+def task_id_from_arn(ecs_task_arn):
+    return ecs_task_arn.split("/")[-1]
+
+
+def pool_pk(shard):
+    return f"TASK#POOL#{shard}"
+
+
+def task_sk(task_id):
+    return f"TASK#{task_id}"
+
+
+def status_key(status, shard, profile=DEFAULT_PROFILE):
+    if profile == DEFAULT_PROFILE:
+        return f"{status}#{shard}"
+    return f"{status}#{profile}#{shard}"
+
+
+def available_key(shard, profile=DEFAULT_PROFILE):
+    """AvailableShard of a claimable row"""
+    return status_key("RUNNING", shard, profile)
+
+
+def available_index_key():
+    """Hash key attribute of the index claims read"""
+    return "StatusShard" if AVAILABLE_INDEX == LEGACY_STATUS_INDEX else "AvailableShard"
+
+
+def task_id_of(item):
+    """Task id of a row, also of an index entry that only has the keys"""
+    return item.get("TaskId") or item["SK"][len("TASK#") :]
+
+
+def profile_of(item):
+    """Pool profile of a task row; rows from before profiles belong to the default one"""
+    return item.get("Profile", DEFAULT_PROFILE)
+
+
+def task_key(task_id):
+    """Primary key of a task row"""
+    return {"PK": pool_pk(shard_for(task_id)), "SK": task_sk(task_id)}
+
+
+def task_item(task_id, status, **attributes):
+    """Full task row, with the shard written into both the base and index keys"""
+    shard = shard_for(task_id)
+    item = {
+        "PK": pool_pk(shard),
+        "SK": task_sk(task_id),
+        "TaskId": task_id,
+        "Shard": shard,
+        "Status": status,
+        "StatusShard": status_key(status, shard, profile_of(attributes)),
+        **attributes,
+    }
+    if status == "RUNNING":
+        item["AvailableShard"] = available_key(shard, profile_of(attributes))
+    return item
+
+
+def scattered_shards():
+    """All shards in random order, so concurrent readers spread their load"""
+    shards = list(range(POOL_SHARDS))
+    random.shuffle(shards)
+    return shards
@@ -0,0 +1,122 @@
+"""Launch latency broken down by phase.
+
+Time to warm is split into the phases below, in seconds. The launcher times
+its own spans, the ECS task timestamps give the Fargate side, and the state
+change handler times the ENI lookup, the readiness gate and the RUNNING
+write:
+
+    Queue           grab/launch request published -> launcher invoked
+    RunTaskApi      the RunTask call
+    LaunchWrite     writing the LAUNCHING rows
+    Provisioning    createdAt -> pullStartedAt (capacity, ENI attachment)
+    ImagePull       pullStartedAt -> pullStoppedAt
+    ContainerStart  pullStoppedAt -> startedAt
+    StateEvent      startedAt -> state change handler invoked
+    EniLookup       DescribeNetworkInterfaces for the public IP
+    Readiness       ECS RUNNING -> health check or readiness probe passed
+    ReadyWrite      the LAUNCHING -> RUNNING update
+
+LaunchWrite covers a whole batch of rows and is only emitted as a metric by
+the launcher; all other phases are emitted per task by the state change
+handler, with AvailabilityZone and TaskDefinitionRevision dimensions (subnets
+map 1:1 to availability zones), and stored on the row as StartupPhases.
+ENI attachment has no ECS timestamp of its own and counts as Provisioning.
+
+Every completed launch is also kept as an item under PK = POOL#LAUNCHES
+(expiring after LAUNCH_HISTORY_TTL_DAYS), newest last, for
+scripts/launch_report.py.
+"""
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+LAUNCHES_PK = "POOL#LAUNCHES"
+LAUNCH_HISTORY_TTL_DAYS = 8
+
+PHASES = (
+    "Queue",
+    "RunTaskApi",
+    "LaunchWrite",
+    "Provisioning",
+    "ImagePull",
+    "ContainerStart",
+    "StateEvent",
+    "EniLookup",
+    "Readiness",
+    "ReadyWrite",
+)
+
+
+def parse_time(value):
+    """ECS timestamps are datetimes from the API and ISO strings in events"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _span(task, start, end):
+    if start not in task or end not in task:
+        return None
+    return (parse_time(task[end]) - parse_time(task[start])).total_seconds()
+
+
+def ecs_phases(task, now=None):
+    """Fargate side phases of a RUNNING task, from its ECS timestamps"""
+    now = now or datetime.now(timezone.utc)
+    phases = {
+        "Provisioning": _span(task, "createdAt", "pullStartedAt"),
+        "ImagePull": _span(task, "pullStartedAt", "pullStoppedAt"),
+        "ContainerStart": _span(task, "pullStoppedAt", "startedAt"),
+    }
+    if phases["Provisioning"] is None:
+        # No pull timestamps: everything before the start counts as provisioning
+        phases["Provisioning"] = _span(task, "createdAt", "startedAt")
+    if "startedAt" in task:
+        phases["StateEvent"] = (now - parse_time(task["startedAt"])).total_seconds()
+    return {phase: seconds for phase, seconds in phases.items() if seconds is not None}
+
+
+def task_definition_revision(task):
+    return task.get("taskDefinitionArn", ":unknown").rsplit(":", 1)[-1]
+
+
+def to_item(phases):
+    """Phase seconds as DynamoDB numbers"""
+    return {phase: Decimal(str(round(seconds, 3))) for phase, seconds in phases.items()}
+
+
+def record_launch(table, task_id, phases, total, availability_zone, revision):
+    """Keep one completed launch in the launch history"""
+    now = time.time()
+    timestamp = datetime.fromtimestamp(now, timezone.utc).isoformat()
+    table.put_item(
+        Item={
+            "PK": LAUNCHES_PK,
+            "SK": f"{timestamp}#{task_id}",
+            "TaskId": task_id,
+            "Phases": to_item(phases),
+            "Total": Decimal(str(round(total, 3))),
+            "AvailabilityZone": availability_zone,
+            "TaskDefinitionRevision": revision,
+            "ExpiresAt": int(now) + LAUNCH_HISTORY_TTL_DAYS * 86400,
+        }
+    )
+
+
+def recent_launches(table, count):
+    """The `count` most recent launches, newest first"""
+    launches = []
+    query_params = {
+        "KeyConditionExpression": "PK = :pk",
+        "ExpressionAttributeValues": {":pk": LAUNCHES_PK},
+        "ScanIndexForward": False,
+    }
+    while len(launches) < count:
+        response = table.query(Limit=count - len(launches), **query_params)
+        launches.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            break
+        query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return launches
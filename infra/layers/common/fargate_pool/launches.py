@@ -0,0 +1,64 @@
+"""Requesting pool launches.
+
+Launches are requested by publishing events to the pool event bus; the
+launch queue buffers them and the launcher starts tasks in batches. Requests
+still in the queue are not rows yet, so whoever sizes the pool counts them
+as warm with `queued_launches`.
+"""
+import json
+from datetime import datetime
+
+from fargate_pool.keys import DEFAULT_PROFILE
+
+# EventBridge accepts at most 10 entries per PutEvents call
+PUT_EVENTS_MAX_ENTRIES = 10
+
+
+def request_launches(
+    events_client,
+    event_bus_name,
+    count,
+    reason,
+    profile=DEFAULT_PROFILE,
+    attempt=None,
+    generation=None,
+):
+    """Publish `count` LaunchRequested events for `profile`. Returns how many were accepted.
+
+    `attempt` numbers a launch that replaces a failed one (the first launch is 1).
+    `generation` numbers the reconciler's restarts of a launch that failed all
+    its attempts (the first round is 1).
+    """
+    detail = {"timestamp": datetime.utcnow().isoformat(), "reason": reason, "profile": profile}
+    if attempt is not None:
+        detail["attempt"] = attempt
+    if generation is not None:
+        detail["generation"] = generation
+    detail = json.dumps(detail)
+    entries = [
+        {
+            "Source": "com.fargate-pool",
+            "DetailType": "LaunchRequested",
+            "Detail": detail,
+            "EventBusName": event_bus_name,
+        }
+        for _ in range(count)
+    ]
+
+    accepted = 0
+    for i in range(0, len(entries), PUT_EVENTS_MAX_ENTRIES):
+        batch = entries[i : i + PUT_EVENTS_MAX_ENTRIES]
+        response = events_client.put_events(Entries=batch)
+        accepted += len(batch) - response["FailedEntryCount"]
+    return accepted
+
+
+def queued_launches(sqs_client, queue_url):
+    """Launch requests in the launch queue, waiting or being launched, of every profile"""
+    if queue_url is None:
+        return 0
+    attributes = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+    )["Attributes"]
+    return sum(int(value) for value in attributes.values())
@@ -0,0 +1,122 @@
+"""Assignment leases.
+
+A claim gives the task a lease: LeaseExpiresAt, in epoch seconds, set
+LEASE_SECONDS ahead. The user's heartbeats extend it while the task is
+still ASSIGNED to them, and a release removes it. Sessions that stop
+heartbeating are reclaimed by the lease sweeper: the task is recycled back
+into the pool or retired (see recycle.release_task).
+
+LeaseIndex is keyed by StatusShard and LeaseExpiresAt. Only rows with a
+lease, that is ASSIGNED rows, are in it, so the expired leases of a shard
+are one range query instead of a scan. Rows claimed before leases existed
+have none and are never reclaimed.
+"""
+import os
+import time
+
+from fargate_pool import keys, recycle
+
+LEASE_INDEX = "LeaseIndex"
+LEASE_SECONDS = int(os.environ.get("LEASE_SECONDS", "3600"))
+
+# What the sweeper does with a task whose lease expired
+RECYCLE, STOP = "recycle", "stop"
+ACTIONS = (RECYCLE, STOP)
+
+
+class LeaseError(Exception):
+    """The task is not assigned to the heartbeating user"""
+
+
+def expires_at(lease_seconds=LEASE_SECONDS, now=None):
+    return int((now or time.time()) + lease_seconds)
+
+
+def heartbeat(table, task_id, user_id, lease_seconds=LEASE_SECONDS):
+    """Extend the lease of `user_id` on `task_id`. Returns the new expiry."""
+    expiry = expires_at(lease_seconds)
+    try:
+        table.update_item(
+            Key=keys.task_key(task_id),
+            UpdateExpression="SET LeaseExpiresAt = :expiry",
+            ConditionExpression="#status = :assigned AND AssignedTo = :user",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={
+                ":expiry": expiry,
+                ":assigned": "ASSIGNED",
+                ":user": user_id,
+            },
+        )
+    except table.exceptions.ConditionalCheckFailedException:
+        raise LeaseError(f"Task {task_id} is not assigned to {user_id}") from None
+    return expiry
+
+
+def _expired_query(shard, profile, now):
+    return {
+        "IndexName": LEASE_INDEX,
+        "KeyConditionExpression": "StatusShard = :status_shard AND LeaseExpiresAt < :now",
+        "ExpressionAttributeValues": {
+            ":status_shard": keys.status_key("ASSIGNED", shard, profile),
+            ":now": int(now),
+        },
+    }
+
+
+def expired_leases(table, profiles, now=None, limit=None):
+    """ASSIGNED rows whose lease expired before `now`, up to `limit`"""
+    now = now or time.time()
+    expired = []
+    for profile in profiles:
+        for shard in range(keys.POOL_SHARDS):
+            query_params = _expired_query(shard, profile, now)
+            while limit is None or len(expired) < limit:
+                if limit is not None:
+                    query_params["Limit"] = limit - len(expired)
+                response = table.query(**query_params)
+                expired.extend(response["Items"])
+                if "LastEvaluatedKey" not in response:
+                    break
+                query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return expired[:limit]
+
+
+def count_expired(table, profiles, now=None):
+    """Number of ASSIGNED rows whose lease has expired"""
+    now = now or time.time()
+    count = 0
+    for profile in profiles:
+        for shard in range(keys.POOL_SHARDS):
+            query_params = {**_expired_query(shard, profile, now), "Select": "COUNT"}
+            while True:
+                response = table.query(**query_params)
+                count += response["Count"]
+                if "LastEvaluatedKey" not in response:
+                    break
+                query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return count
+
+
+def reclaim(table, ecs, cluster_name, task, action=RECYCLE, now=None, **release_options):
+    """Take back a task whose lease expired; a heartbeat in the meantime keeps it with its user.
+
+    Returns a recycle.ReleaseResult.
+    """
+    now = now or time.time()
+    user_id = task.get("AssignedTo")
+    try:
+        if action == STOP:
+            return recycle.retire_task(
+                table, ecs, cluster_name, task, user_id, "Lease expired", expired_before=now
+            )
+        return recycle.release_task(
+            table,
+            ecs,
+            cluster_name,
+            task["TaskId"],
+            user_id,
+            expired_before=now,
+            **release_options,
+        )
+    except recycle.ReleaseError as e:
+        return recycle.ReleaseResult(recycle.NOT_ASSIGNED, task, str(e))
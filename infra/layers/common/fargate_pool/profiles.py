@@ -0,0 +1,261 @@
+"""Pool profiles.
+
+A profile is one warm pool: the task definition it runs, the CPU and memory
+of its tasks, the subnets they start in and how many warm tasks to keep.
+Profiles are items under PK = POOL#PROFILES (SK = <name>), managed with
+scripts/pool_profiles.py.
+
+The "default" profile always exists. It runs the stack's task definition
+and subnets, and rows without a Profile attribute belong to it; an item
+named "default" only overrides its settings. The forecast sizer sizes the
+default profile, but never below its TargetSize, which set_pool_size.py and
+add_tasks.py set. Every other profile is kept at its TargetSize.
+
+Launched tasks are put in the ECS task group pool:<profile>, so state change
+events tell which profile a task belongs to without reading its row.
+
+The launcher may only pass the stack's TaskExecutionRole and roles named
+with the stack's ProfileRolePrefix, so put_profile refuses a task definition
+whose task or execution role is neither.
+
+A profile may set its own readiness gate (see readiness.py), else the
+stack's applies. put_profile records whether its task definition has a
+container health check: without one its tasks never become HEALTHY, so the
+"health" gate lets them join the pool on ECS RUNNING instead.
+"""
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fargate_pool import readiness
+from fargate_pool.keys import DEFAULT_PROFILE
+
+PROFILES_PK = "POOL#PROFILES"
+GROUP_PREFIX = "pool:"
+CACHE_SECONDS = 60
+# Size of the stack's TaskDefinition, unset outside the stack
+TASK_DEFINITION_CPU = os.environ.get("TASK_DEFINITION_CPU") or None
+TASK_DEFINITION_MEMORY = os.environ.get("TASK_DEFINITION_MEMORY") or None
+
+# Profile names end up in index keys and metric dimensions
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,40}$")
+
+
+@dataclass
+class Profile:
+    name: str
+    task_definition: str
+    cpu: Optional[str] = None
+    memory: Optional[str] = None
+    subnets: list = field(default_factory=list)
+    target_size: int = 0
+    readiness_gate: Optional[str] = None
+    # Whether the task definition has a container health check, None if unknown
+    health_check: Optional[bool] = None
+
+    def _task_definition_shape(self):
+        """The size the task definition already has, known only for the stack's own"""
+        if self.name != DEFAULT_PROFILE:
+            return {}
+        return {"cpu": TASK_DEFINITION_CPU, "memory": TASK_DEFINITION_MEMORY}
+
+    @property
+    def size(self):
+        """Sort key for falling back to larger shapes"""
+        base = self._task_definition_shape()
+        cpu, memory = self.cpu or base.get("cpu"), self.memory or base.get("memory")
+        return (int(cpu or 0), int(memory or 0))
+
+    @property
+    def group(self):
+        return GROUP_PREFIX + self.name
+
+    def gate(self, stack_gate):
+        """Readiness gate of this profile's tasks under the stack's `stack_gate`"""
+        gate = self.readiness_gate or stack_gate
+        if gate == "health" and self.health_check is False:
+            return "none"
+        return gate
+
+    def overrides(self):
+        """RunTask task overrides giving the task this profile's shape, where it differs
+        from its task definition's"""
+        base = self._task_definition_shape()
+        shape = {"cpu": self.cpu, "memory": self.memory}
+        return {
+            name: value for name, value in shape.items() if value and value != base.get(name)
+        }
+
+    def to_item(self):
+        item = {"PK": PROFILES_PK, "SK": self.name, "TaskDefinition": self.task_definition}
+        if self.cpu:
+            item["Cpu"] = self.cpu
+        if self.memory:
+            item["Memory"] = self.memory
+        if self.subnets:
+            item["Subnets"] = list(self.subnets)
+        item["TargetSize"] = self.target_size
+        if self.readiness_gate:
+            item["ReadinessGate"] = self.readiness_gate
+        if self.health_check is not None:
+            item["HealthCheck"] = self.health_check
+        return item
+
+    @classmethod
+    def from_item(cls, item, default=None):
+        """Profile of a registry item, taking unset settings from `default`"""
+        base = default or cls(item["SK"], "")
+        return cls(
+            name=item["SK"],
+            task_definition=item.get("TaskDefinition") or base.task_definition,
+            cpu=item.get("Cpu", base.cpu),
+            memory=item.get("Memory", base.memory),
+            subnets=list(item.get("Subnets", base.subnets)),
+            target_size=int(item.get("TargetSize", base.target_size)),
+            readiness_gate=item.get("ReadinessGate", base.readiness_gate),
+            health_check=item.get("HealthCheck", base.health_check),
+        )
+
+
+def default_profile():
+    """The default profile, from the stack's settings"""
+    subnets = [os.environ[name] for name in ("SUBNET_ID1", "SUBNET_ID2") if os.environ.get(name)]
+    return Profile(
+        name=DEFAULT_PROFILE,
+        task_definition=os.environ.get("TASK_DEFINITION", ""),
+        # Overrides of the task definition's size
+        cpu=os.environ.get("TASK_CPU") or None,
+        memory=os.environ.get("TASK_MEMORY") or None,
+        subnets=subnets,
+    )
+
+
+def load_profiles(table):
+    """Every profile by name, the default one included"""
+    default = default_profile()
+    items = []
+    query_params = {
+        "KeyConditionExpression": "PK = :pk",
+        "ExpressionAttributeValues": {":pk": PROFILES_PK},
+    }
+    while True:
+        response = table.query(**query_params)
+        items.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            break
+        query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    profiles = {DEFAULT_PROFILE: default}
+    for item in items:
+        profiles[item["SK"]] = Profile.from_item(
+            item, default if item["SK"] == DEFAULT_PROFILE else None
+        )
+    return profiles
+
+
+def check_task_definition(profile, ecs, role_prefix=None, stack_roles=()):
+    """Check that the launcher may pass the roles of the profile's task definition,
+    and record whether it has a container health check"""
+    definition = ecs.describe_task_definition(taskDefinition=profile.task_definition)[
+        "taskDefinition"
+    ]
+    for role_arn in (definition.get("taskRoleArn"), definition.get("executionRoleArn")):
+        if role_arn is None or role_arn in stack_roles:
+            continue
+        # The role name, with its path
+        role_name = role_arn.split(":role/", 1)[-1]
+        if not role_prefix or not role_name.startswith(role_prefix):
+            raise ValueError(
+                f"Task definition {profile.task_definition} uses role {role_arn}, which the "
+                f"launcher may not pass: use the stack's roles or one named {role_prefix or ''}*"
+            )
+    profile.health_check = any(
+        "healthCheck" in container for container in definition["containerDefinitions"]
+    )
+    if profile.readiness_gate == "health" and not profile.health_check:
+        raise ValueError(
+            f"Task definition {profile.task_definition} has no container health check, "
+            "so its tasks would never pass the health readiness gate"
+        )
+
+
+def put_profile(table, profile, ecs=None, role_prefix=None, stack_roles=()):
+    """Save `profile`, checking its task definition with `ecs` if given.
+
+    Its roles must be in `stack_roles` or named with `role_prefix`.
+    """
+    if not NAME_PATTERN.match(profile.name):
+        raise ValueError(f"Invalid profile name: {profile.name}")
+    if not profile.task_definition and profile.name != DEFAULT_PROFILE:
+        raise ValueError("A task definition is required")
+    if profile.readiness_gate is not None and profile.readiness_gate not in readiness.GATES:
+        raise ValueError(f"Invalid readiness gate: {profile.readiness_gate}")
+    if ecs is not None and profile.task_definition:
+        check_task_definition(profile, ecs, role_prefix, stack_roles)
+    table.put_item(Item=profile.to_item())
+
+
+def set_target_size(table, name, size):
+    """Set the TargetSize of `name`, keeping its other settings"""
+    table.update_item(
+        Key={"PK": PROFILES_PK, "SK": name},
+        UpdateExpression="SET TargetSize = :size",
+        ExpressionAttributeValues={":size": size},
+    )
+
+
+def add_target_size(table, name, count):
+    """Raise the TargetSize of `name` by `count`. Returns the new size."""
+    response = table.update_item(
+        Key={"PK": PROFILES_PK, "SK": name},
+        UpdateExpression="ADD TargetSize :count",
+        ExpressionAttributeValues={":count": count},
+        ReturnValues="UPDATED_NEW",
+    )
+    return int(response["Attributes"]["TargetSize"])
+
+
+def delete_profile(table, name):
+    table.delete_item(Key={"PK": PROFILES_PK, "SK": name})
+
+
+def larger_profiles(profiles, name):
+    """Profiles with more CPU and memory than `name`, smallest first"""
+    requested = profiles[name].size
+    return [
+        profile.name
+        for profile in sorted(profiles.values(), key=lambda profile: profile.size)
+        if profile.size != requested
+        and profile.size[0] >= requested[0]
+        and profile.size[1] >= requested[1]
+    ]
+
+
+def profile_of_task(ecs_task):
+    """Profile of an ECS task (or state change detail), from its task group"""
+    group = ecs_task.get("group", "")
+    if group.startswith(GROUP_PREFIX):
+        return group[len(GROUP_PREFIX) :]
+    return DEFAULT_PROFILE
+
+
+class Registry:
+    """Profiles read at most every CACHE_SECONDS"""
+
+    def __init__(self, table, ttl=CACHE_SECONDS):
+        self.table = table
+        self.ttl = ttl
+        self._profiles = None
+        self._loaded_at = 0.0
+
+    def all(self):
+        if self._profiles is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self._profiles = load_profiles(self.table)
+            self._loaded_at = time.monotonic()
+        return self._profiles
+
+    def get(self, name):
+        """The profile called `name`, or None"""
+        return self.all().get(name)
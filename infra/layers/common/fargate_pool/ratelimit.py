@@ -0,0 +1,139 @@
+"""Client-side rate limiting of ECS calls.
+
+Launchers run concurrently, so a burst of grabs used to hit ECS with every
+RunTask at once and turn throttling into failed launches. Instead every
+caller takes tokens from a shared token bucket, kept in one DynamoDB item
+(PK = POOL#RATELIMIT, SK = <bucket>), that refills at the sustained API
+rate up to the burst size. `TokenBucket` is the in-process stand-in with
+the same interface.
+
+A bucket is updated optimistically: read, refill, take, and write back
+conditioned on the refill time read. A caller that is throttled anyway
+drains the bucket so every caller backs off.
+"""
+import random
+import threading
+import time
+from decimal import Decimal
+
+RATELIMIT_PK = "POOL#RATELIMIT"
+CONFLICT_RETRIES = 5
+
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# RunTask failure reasons that clear up by themselves
+CAPACITY_FAILURES = ("Capacity is unavailable", "RESOURCE:", "Rate exceeded")
+
+
+def is_capacity_failure(reason):
+    return any(marker in reason for marker in CAPACITY_FAILURES)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    """Full jitter exponential backoff for the `attempt`th retry (1-based)"""
+    return random.uniform(0, min(cap, base * 2 ** max(attempt - 1, 0)))
+
+
+def _refill(tokens, refilled_at, now, rate, burst):
+    return min(burst, tokens + max(now - refilled_at, 0.0) * rate)
+
+
+class TokenBucket:
+    """In-process token bucket"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._refilled_at = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, count):
+        """Take up to `count` tokens without waiting. Returns how many were taken."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = _refill(self._tokens, self._refilled_at, now, self.rate, self.burst)
+            self._refilled_at = now
+            granted = min(count, int(self._tokens))
+            self._tokens -= granted
+            return granted
+
+    def drain(self):
+        with self._lock:
+            self._tokens = 0.0
+            self._refilled_at = self.clock()
+
+
+class SharedTokenBucket:
+    """Token bucket in one DynamoDB item, shared by every caller"""
+
+    def __init__(self, table, name, rate, burst, clock=time.time):
+        self.table = table
+        self.key = {"PK": RATELIMIT_PK, "SK": name}
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+
+    def try_acquire(self, count):
+        """Take up to `count` tokens without waiting. Returns how many were taken."""
+        for _ in range(CONFLICT_RETRIES):
+            now = self.clock()
+            item = self.table.get_item(Key=self.key, ConsistentRead=True).get("Item")
+            if item is None:
+                tokens = float(self.burst)
+                condition, values = "attribute_not_exists(PK)", {}
+            else:
+                tokens = _refill(
+                    float(item["Tokens"]), float(item["RefilledAt"]), now, self.rate, self.burst
+                )
+                condition, values = "RefilledAt = :seen", {":seen": item["RefilledAt"]}
+
+            granted = min(count, int(tokens))
+            if granted == 0:
+                return 0
+
+            try:
+                self.table.update_item(
+                    Key=self.key,
+                    UpdateExpression="SET Tokens = :tokens, RefilledAt = :now",
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues={
+                        ":tokens": Decimal(str(round(tokens - granted, 6))),
+                        ":now": Decimal(str(round(now, 6))),
+                        **values,
+                    },
+                )
+                return granted
+            except self.table.exceptions.ConditionalCheckFailedException:
+                # Another caller took tokens in between; re-read and retry
+                continue
+        return 0
+
+    def drain(self):
+        self.table.put_item(
+            Item={
+                **self.key,
+                "Tokens": Decimal(0),
+                "RefilledAt": Decimal(str(round(self.clock(), 6))),
+            }
+        )
+
+
+def acquire(bucket, count, max_wait, sleep=time.sleep):
+    """Take up to `count` tokens, waiting at most `max_wait` seconds for refills.
+
+    Returns (tokens taken, seconds waited).
+    """
+    started = time.monotonic()
+    granted = bucket.try_acquire(count)
+    while granted < count:
+        waited = time.monotonic() - started
+        if waited >= max_wait:
+            break
+        # Sleep until roughly the missing tokens have refilled, with jitter
+        shortfall = (count - granted) / bucket.rate
+        sleep(min(max_wait - waited, random.uniform(0.5, 1.0) * shortfall))
+        granted += bucket.try_acquire(count - granted)
+    return granted, time.monotonic() - started
@@ -0,0 +1,118 @@
+"""Readiness gate between a task starting and joining the pool.
+
+ECS reports RUNNING once the container process has started, which can be
+well before the app in it answers. A started task therefore stays
+LAUNCHING, with its public IP and RunningAt recorded, until it is ready:
+
+    health  the container health check (GET /ready) reports HEALTHY
+    probe   the launcher gets a 200 from READINESS_PATH on the public IP
+    none    right away, as before
+
+Only then is it moved to RUNNING with ReadyAt, which also puts it in the
+available index that claims read. The reconciler promotes rows whose
+HEALTHY state change was missed.
+"""
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from fargate_pool import keys, launch_phases
+
+GATES = ("health", "probe", "none")
+PROBE_INTERVAL_SECONDS = 1.0
+
+
+def is_healthy(task):
+    return task.get("healthStatus") == "HEALTHY"
+
+
+def is_unhealthy(task):
+    return task.get("healthStatus") == "UNHEALTHY"
+
+
+def probe(public_ip, path, port, timeout, sleep=time.sleep):
+    """GET `path` on the task until it answers 200 or `timeout` seconds pass"""
+    url = f"http://{public_ip}:{port}{path}"
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            with urllib.request.urlopen(url, timeout=max(min(remaining, 2.0), 0.1)) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        if time.monotonic() + PROBE_INTERVAL_SECONDS >= deadline:
+            return False
+        sleep(PROBE_INTERVAL_SECONDS)
+
+
+def mark_started(table, task_id, public_ip, phases):
+    """Record that a LAUNCHING task runs but is not ready yet. False if it left LAUNCHING."""
+    try:
+        table.update_item(
+            Key=keys.task_key(task_id),
+            UpdateExpression="SET PublicIp = :ip, StartupPhases = :phases, RunningAt = if_not_exists(RunningAt, :now), UpdatedAt = :now",
+            ConditionExpression="#status = :launching",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={
+                ":launching": "LAUNCHING",
+                ":ip": public_ip,
+                ":phases": launch_phases.to_item(phases),
+                ":now": datetime.utcnow().isoformat(),
+            },
+        )
+        return True
+    except table.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def mark_ready(table, task_id, public_ip, phases=None, profile=keys.DEFAULT_PROFILE):
+    """Publish a LAUNCHING task as RUNNING. Returns the old row, or None if it left LAUNCHING."""
+    now = datetime.utcnow().isoformat()
+    update = "SET #status = :status, StatusShard = :status_shard, AvailableShard = :available_shard, PublicIp = :ip, RunningAt = if_not_exists(RunningAt, :now), ReadyAt = :now, UpdatedAt = :now"
+    shard = keys.shard_for(task_id)
+    values = {
+        ":status": "RUNNING",
+        ":status_shard": keys.status_key("RUNNING", shard, profile),
+        ":available_shard": keys.available_key(shard, profile),
+        ":launching": "LAUNCHING",
+        ":ip": public_ip,
+        ":now": now,
+    }
+    if phases is not None:
+        update += ", StartupPhases = :phases"
+        values[":phases"] = launch_phases.to_item(phases)
+    try:
+        response = table.update_item(
+            Key=keys.task_key(task_id),
+            UpdateExpression=update,
+            ConditionExpression="#status = :launching",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues=values,
+            ReturnValues="ALL_OLD",
+        )
+    except table.exceptions.ConditionalCheckFailedException:
+        return None
+    return response["Attributes"]
+
+
+def make_available(table, task):
+    """Add a RUNNING row missing from the available index, e.g. one written before the index existed"""
+    try:
+        table.update_item(
+            Key={"PK": task["PK"], "SK": task["SK"]},
+            UpdateExpression="SET AvailableShard = :available_shard",
+            ConditionExpression="#status = :running AND attribute_not_exists(AvailableShard)",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={
+                ":available_shard": keys.available_key(
+                    keys.shard_for(task["TaskId"]), keys.profile_of(task)
+                ),
+                ":running": "RUNNING",
+            },
+        )
+        return True
+    except table.exceptions.ConditionalCheckFailedException:
+        return False
@@ -0,0 +1,218 @@
+"""Returning finished sessions to the warm pool.
+
+Releasing an ASSIGNED task calls the reset hook of its container (POST
+/reset on the public IP) and moves the row back to RUNNING with ReuseCount
+incremented, conditioned on it still being ASSIGNED to the releasing user.
+A task that has been reused MAX_REUSE times, is older than MAX_AGE_SECONDS,
+or fails its reset is retired instead: the row is deleted and the task
+stopped.
+
+The grab that assigned the task already launched a replacement, so each
+recycle is a credit (PK = POOL#RECYCLE, SK = CREDITS or CREDITS#<profile>)
+that lets the stream function skip the replacement launch of a later grab
+of the same pool profile. Batches of the stream are processed concurrently,
+so credits are taken with a decrement conditioned on the balance covering
+it, and the ones a batch did not use are added back.
+"""
+import logging
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from fargate_pool import keys
+
+logger = logging.getLogger(__name__)
+
+CREDITS_PK = "POOL#RECYCLE"
+MAX_REUSE = 20
+MAX_AGE_SECONDS = 8 * 3600
+RESET_PATH = "/reset"
+RESET_PORT = 80
+RESET_TIMEOUT_SECONDS = 10
+
+# Release outcomes
+RECYCLED, RETIRED, NOT_ASSIGNED = "recycled", "retired", "not_assigned"
+
+
+class ReleaseError(Exception):
+    """The task is not assigned to the releasing user"""
+
+
+@dataclass
+class ReleaseResult:
+    outcome: str
+    task: dict = field(default_factory=dict)
+    reason: str = ""
+
+
+def reset_task(public_ip, path=RESET_PATH, port=RESET_PORT, timeout=RESET_TIMEOUT_SECONDS):
+    """Ask the container to drop the previous user's state. True on a 200."""
+    request = urllib.request.Request(f"http://{public_ip}:{port}{path}", method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError) as e:
+        logger.warning(f"Reset of {public_ip} failed: {str(e)}")
+        return False
+
+
+def retire_reason(task, now, max_reuse=MAX_REUSE, max_age_seconds=MAX_AGE_SECONDS):
+    """Why `task` should not be reused, or None"""
+    if int(task.get("ReuseCount", 0)) >= max_reuse:
+        return f"Reused {task.get('ReuseCount')} times"
+    age = (now - datetime.fromisoformat(task["CreatedAt"])).total_seconds()
+    if age >= max_age_seconds:
+        return f"Older than {max_age_seconds} seconds"
+    return None
+
+
+def _assigned_condition(user_id, expired_before=None):
+    condition = "#status = :assigned"
+    values = {":assigned": "ASSIGNED"}
+    if user_id is not None:
+        condition += " AND AssignedTo = :user"
+        values[":user"] = user_id
+    if expired_before is not None:
+        # A heartbeat renewed the lease since it was found expired
+        condition += " AND LeaseExpiresAt < :expired_before"
+        values[":expired_before"] = int(expired_before)
+    return condition, values
+
+
+def retire_task(table, ecs, cluster_name, task, user_id, reason, expired_before=None):
+    """Delete an ASSIGNED row and stop its task instead of reusing it"""
+    condition, values = _assigned_condition(user_id, expired_before)
+    try:
+        table.delete_item(
+            Key=keys.task_key(task["TaskId"]),
+            ConditionExpression=condition,
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues=values,
+        )
+    except table.exceptions.ConditionalCheckFailedException:
+        return ReleaseResult(NOT_ASSIGNED, task, "Released or reassigned concurrently")
+
+    if "EcsTaskArn" in task:
+        try:
+            ecs.stop_task(
+                cluster=cluster_name,
+                task=keys.task_id_from_arn(task["EcsTaskArn"]),
+                reason=f"Retired on release: {reason}",
+            )
+        except Exception as e:
+            # The row is already gone; the reconciler stops the orphaned task
+            logger.error(f"Error stopping ECS task {task['EcsTaskArn']}: {str(e)}")
+    return ReleaseResult(RETIRED, task, reason)
+
+
+def release_task(
+    table,
+    ecs,
+    cluster_name,
+    task_id,
+    user_id=None,
+    reset=reset_task,
+    max_reuse=MAX_REUSE,
+    max_age_seconds=MAX_AGE_SECONDS,
+    expired_before=None,
+):
+    """Return an ASSIGNED task to the warm pool, or retire it.
+
+    With `user_id`, only a task assigned to that user is released; otherwise
+    ReleaseError is raised. With `expired_before` (epoch seconds), only a
+    task whose lease expired before then is.
+    """
+    task = table.get_item(Key=keys.task_key(task_id), ConsistentRead=True).get("Item")
+    if task is None or task["Status"] != "ASSIGNED":
+        raise ReleaseError(f"Task {task_id} is not assigned")
+    if user_id is not None and task.get("AssignedTo") != user_id:
+        raise ReleaseError(f"Task {task_id} is not assigned to {user_id}")
+    if expired_before is not None and task.get("LeaseExpiresAt", expired_before) >= expired_before:
+        raise ReleaseError(f"The lease on task {task_id} has not expired")
+
+    now = datetime.utcnow()
+    reason = retire_reason(task, now, max_reuse, max_age_seconds)
+    if reason is None and not reset(task["PublicIp"]):
+        reason = "Reset failed"
+    if reason is not None:
+        return retire_task(table, ecs, cluster_name, task, user_id, reason, expired_before)
+
+    condition, values = _assigned_condition(user_id, expired_before)
+    try:
+        response = table.update_item(
+            Key=keys.task_key(task_id),
+            UpdateExpression="SET #status = :running, StatusShard = :status_shard, AvailableShard = :available_shard, RecycledAt = :now, UpdatedAt = :now ADD ReuseCount :one REMOVE AssignedTo, LeaseExpiresAt",
+            ConditionExpression=condition,
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={
+                ":running": "RUNNING",
+                ":status_shard": keys.status_key(
+                    "RUNNING", keys.shard_for(task_id), keys.profile_of(task)
+                ),
+                ":available_shard": keys.available_key(
+                    keys.shard_for(task_id), keys.profile_of(task)
+                ),
+                ":now": now.isoformat(),
+                ":one": 1,
+                **values,
+            },
+            ReturnValues="ALL_NEW",
+        )
+    except table.exceptions.ConditionalCheckFailedException:
+        return ReleaseResult(NOT_ASSIGNED, task, "Released or reassigned concurrently")
+    return ReleaseResult(RECYCLED, response["Attributes"])
+
+
+def is_recycle(record):
+    """An ASSIGNED -> RUNNING transition in the table stream"""
+    if record["eventName"] != "MODIFY":
+        return False
+    new_image = record["dynamodb"]["NewImage"]
+    old_image = record["dynamodb"]["OldImage"]
+    return (
+        new_image.get("Status", {}).get("S") == "RUNNING"
+        and old_image.get("Status", {}).get("S") == "ASSIGNED"
+    )
+
+
+def credits_key(profile=keys.DEFAULT_PROFILE):
+    if profile == keys.DEFAULT_PROFILE:
+        return {"PK": CREDITS_PK, "SK": "CREDITS"}
+    return {"PK": CREDITS_PK, "SK": f"CREDITS#{profile}"}
+
+
+def read_credits(table, profile=keys.DEFAULT_PROFILE):
+    item = table.get_item(Key=credits_key(profile), ConsistentRead=True).get("Item", {})
+    return int(item.get("Credits", 0))
+
+
+def spend_credits(table, count, profile=keys.DEFAULT_PROFILE, attempts=3):
+    """Take up to `count` recycle credits, never more than the balance. Returns how many."""
+    for _ in range(attempts):
+        count = min(count, read_credits(table, profile))
+        if count <= 0:
+            return 0
+        try:
+            table.update_item(
+                Key=credits_key(profile),
+                UpdateExpression="SET Credits = Credits - :count",
+                ConditionExpression="Credits >= :count",
+                ExpressionAttributeValues={":count": count},
+            )
+            return count
+        except table.exceptions.ConditionalCheckFailedException:
+            # Spent by a concurrent batch; take what is left
+            continue
+    # Launching instead of reusing is the safe side
+    return 0
+
+
+def add_credits(table, delta, profile=keys.DEFAULT_PROFILE):
+    """Atomically add `delta` recycle credits"""
+    if delta:
+        table.update_item(
+            Key=credits_key(profile),
+            UpdateExpression="ADD Credits :delta",
+            ExpressionAttributeValues={":delta": delta},
+        )
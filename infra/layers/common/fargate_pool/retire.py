@@ -0,0 +1,118 @@
+"""Retiring surplus warm tasks.
+
+Tasks are retired longest idle first. A RUNNING row has been idle since its
+UpdatedAt: it is written when the task becomes ready or is recycled, and
+not again until it is grabbed. Tasks idle for less than `min_idle_seconds`
+are kept, since the pool may need them again right away.
+
+A retired row moves from RUNNING to DRAINING, leaving the available index,
+with an update conditioned on Status = RUNNING, so a concurrent grab either
+wins the row or never sees it. The ECS tasks are then stopped in bulk; the
+state change handler deletes a DRAINING row when its task has stopped, and
+the reconciler stops DRAINING tasks whose StopTask call was lost.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from fargate_pool import capacity, keys, teardown
+
+DRAINING = "DRAINING"
+
+
+@dataclass
+class RetireResult:
+    retired: list = field(default_factory=list)
+    # Seconds each retired task had been idle
+    idle_seconds: list = field(default_factory=list)
+    stop_failures: int = 0
+
+    @property
+    def idle_task_minutes(self):
+        return sum(self.idle_seconds) / 60
+
+
+def idle_seconds(task, now):
+    return (now - datetime.fromisoformat(task["UpdatedAt"])).total_seconds()
+
+
+def idle_tasks(table, profile=keys.DEFAULT_PROFILE, min_idle_seconds=0, now=None):
+    """RUNNING rows of `profile` idle for at least `min_idle_seconds`, longest idle first"""
+    now = now or datetime.utcnow()
+    candidates = []
+    for shard in range(keys.POOL_SHARDS):
+        query_params = {
+            "IndexName": keys.STATUS_INDEX,
+            "KeyConditionExpression": "StatusShard = :status_shard",
+            "ExpressionAttributeValues": {
+                ":status_shard": keys.status_key("RUNNING", shard, profile)
+            },
+            "ProjectionExpression": "PK, SK, TaskId, EcsTaskArn, UpdatedAt",
+        }
+        while True:
+            response = table.query(**query_params)
+            candidates.extend(
+                task for task in response["Items"] if idle_seconds(task, now) >= min_idle_seconds
+            )
+            if "LastEvaluatedKey" not in response:
+                break
+            query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return sorted(candidates, key=lambda task: task["UpdatedAt"])
+
+
+def drain(table, task, profile, reason, now):
+    """Move a RUNNING row to DRAINING. False if it was grabbed in the meantime."""
+    try:
+        table.update_item(
+            Key={"PK": task["PK"], "SK": task["SK"]},
+            UpdateExpression="SET #status = :draining, StatusShard = :status_shard, DrainReason = :reason, DrainingAt = :now, UpdatedAt = :now REMOVE AvailableShard",
+            ConditionExpression="#status = :running",
+            ExpressionAttributeNames={"#status": "Status"},
+            ExpressionAttributeValues={
+                ":draining": DRAINING,
+                ":running": "RUNNING",
+                ":status_shard": keys.status_key(
+                    DRAINING, keys.shard_for(task["TaskId"]), profile
+                ),
+                ":reason": reason,
+                ":now": now.isoformat(),
+            },
+        )
+        return True
+    except table.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def retire_warm_tasks(
+    table,
+    ecs,
+    cluster_name,
+    count,
+    reason="Retired surplus warm task",
+    profile=keys.DEFAULT_PROFILE,
+    min_idle_seconds=0,
+):
+    """Drain up to `count` of the longest idle RUNNING tasks of `profile` and stop them"""
+    table = table.for_operation(capacity.DRAIN)
+    now = datetime.utcnow()
+    result = RetireResult()
+
+    for task in idle_tasks(table, profile, min_idle_seconds, now):
+        if len(result.retired) >= count:
+            break
+        if not drain(table, task, profile, reason, now):
+            # Grabbed in the meantime, leave it to its user
+            continue
+        result.retired.append(task)
+        result.idle_seconds.append(idle_seconds(task, now))
+
+    stopped = teardown.TeardownResult()
+    teardown.stop_tasks(
+        ecs,
+        cluster_name,
+        [task["EcsTaskArn"] for task in result.retired if "EcsTaskArn" in task],
+        reason,
+        stopped,
+    )
+    # Rows of tasks that did not stop stay DRAINING until the reconciler stops them
+    result.stop_failures = stopped.stop_failures
+    return result
@@ -0,0 +1,33 @@
+"""Reading every task row of the pool.
+
+Each shard is its own partition, so the pool is read with one paginated
+query per shard, run in parallel, instead of a table scan.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from fargate_pool import keys
+
+
+def query_partition(table, pk):
+    items = []
+    query_params = {
+        "KeyConditionExpression": "PK = :pk",
+        "ExpressionAttributeValues": {":pk": pk},
+    }
+    while True:
+        response = table.query(**query_params)
+        items.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return items
+        query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def all_task_rows(table, include_legacy=True):
+    """Every task row, including rows not yet migrated to the sharded layout"""
+    partitions = [keys.pool_pk(shard) for shard in range(keys.POOL_SHARDS)]
+    if include_legacy:
+        partitions.append(keys.LEGACY_PK)
+
+    with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+        results = executor.map(lambda pk: query_partition(table, pk), partitions)
+        return [item for items in results for item in items]
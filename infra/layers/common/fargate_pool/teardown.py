@@ -0,0 +1,169 @@
+"""Bulk teardown of pool tasks.
+
+Rows are deleted first, with BatchWriteItem requests of 25 keys run in
+parallel and unprocessed items retried, so no grab can claim a task that is
+about to stop. The ECS tasks are then stopped from a bounded worker pool
+that backs off when ECS throttles. Pool tasks without a row (orphans) are
+found by sweeping `list_tasks` and stopped the same way.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from fargate_pool import clients, keys
+
+logger = logging.getLogger(__name__)
+
+WORKERS = 16
+ATTEMPTS = clients.BATCH_WRITE_ATTEMPTS
+# Must match STARTED_BY in launch_task
+STARTED_BY = "fargate-pool"
+
+
+@dataclass
+class TeardownResult:
+    rows_deleted: int = 0
+    delete_failures: int = 0
+    tasks_stopped: int = 0
+    stop_failures: int = 0
+    orphans: int = 0
+    throttled: int = 0
+    elapsed: float = 0.0
+
+    def summary(self):
+        rate = self.tasks_stopped / self.elapsed if self.elapsed else 0.0
+        return (
+            f"Deleted {self.rows_deleted} rows and stopped {self.tasks_stopped} tasks "
+            f"({self.orphans} orphaned) in {self.elapsed:.1f} s, {rate:.0f} tasks/s. "
+            f"Failures: {self.delete_failures} rows, {self.stop_failures} tasks; "
+            f"{self.throttled} throttled calls retried"
+        )
+
+
+def _backoff(attempt):
+    clients.backoff(attempt)
+
+
+class _Progress:
+    """Thread-safe counter that reports every `every` completions"""
+
+    def __init__(self, phase, total, callback, every=100):
+        self.phase = phase
+        self.total = total
+        self.callback = callback
+        self.every = every
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        if self.callback is None:
+            return
+        with self._lock:
+            before, self.done = self.done, self.done + count
+            if self.done == self.total or self.done // self.every != before // self.every:
+                self.callback(self.phase, self.done, self.total)
+
+
+def delete_rows(table, rows, result, workers=WORKERS, progress=None):
+    """Delete `rows` with parallel BatchWriteItem calls, retrying unprocessed items"""
+    size = clients.BATCH_WRITE_MAX
+    chunks = [rows[i : i + size] for i in range(0, len(rows), size)]
+    tracker = _Progress("delete", len(rows), progress)
+
+    def delete(chunk):
+        """Returns (rows left undeleted, throttled calls)"""
+        requests = [{"DeleteRequest": {"Key": {"PK": row["PK"], "SK": row["SK"]}}} for row in chunk]
+        throttled = 0
+        for attempt in range(ATTEMPTS):
+            if attempt:
+                _backoff(attempt)
+            try:
+                unprocessed = table.batch_write_item(requests)
+            except Exception as e:
+                if clients.is_throttling(e):
+                    throttled += 1
+                    continue
+                logger.error(f"Error deleting {len(requests)} rows: {str(e)}")
+                break
+            tracker.add(len(requests) - len(unprocessed))
+            requests = unprocessed
+            if not requests:
+                break
+        return len(requests), throttled
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk, (failed, throttled) in zip(chunks, executor.map(delete, chunks)):
+            result.rows_deleted += len(chunk) - failed
+            result.delete_failures += failed
+            result.throttled += throttled
+
+
+def stop_tasks(ecs, cluster_name, task_arns, reason, result, workers=WORKERS, progress=None):
+    """Stop `task_arns` from a bounded worker pool, backing off on throttling"""
+    tracker = _Progress("stop", len(task_arns), progress)
+
+    def stop(task_arn):
+        """Returns (stopped, throttled calls)"""
+        for attempt in range(ATTEMPTS):
+            if attempt:
+                _backoff(attempt)
+            try:
+                ecs.stop_task(
+                    cluster=cluster_name, task=keys.task_id_from_arn(task_arn), reason=reason
+                )
+                tracker.add(1)
+                return True, attempt
+            except Exception as e:
+                if not clients.is_throttling(e):
+                    logger.error(f"Error stopping ECS task {task_arn}: {str(e)}")
+                    return False, attempt
+        logger.error(f"Gave up stopping ECS task {task_arn} after {ATTEMPTS} throttled attempts")
+        return False, ATTEMPTS
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for stopped, throttled in executor.map(stop, task_arns):
+            result.tasks_stopped += stopped
+            result.stop_failures += not stopped
+            result.throttled += throttled
+
+
+def list_pool_task_arns(ecs, cluster_name):
+    """ARNs of every pool task ECS still wants running"""
+    arns = []
+    paginator = ecs.get_paginator("list_tasks")
+    for page in paginator.paginate(cluster=cluster_name, startedBy=STARTED_BY):
+        arns.extend(page["taskArns"])
+    return arns
+
+
+def teardown(
+    table,
+    ecs,
+    cluster_name,
+    rows,
+    reason,
+    sweep_orphans=False,
+    workers=WORKERS,
+    progress=None,
+):
+    """Delete `rows` and stop their tasks; with `sweep_orphans`, also stop
+    every pool task that has no row. `progress(phase, done, total)` is
+    called as work completes. Returns a TeardownResult.
+    """
+    started = time.monotonic()
+    result = TeardownResult()
+
+    task_arns = list(dict.fromkeys(row["EcsTaskArn"] for row in rows if "EcsTaskArn" in row))
+    if sweep_orphans:
+        known = set(task_arns)
+        orphans = [arn for arn in list_pool_task_arns(ecs, cluster_name) if arn not in known]
+        result.orphans = len(orphans)
+        task_arns.extend(orphans)
+
+    delete_rows(table, rows, result, workers, progress)
+    stop_tasks(ecs, cluster_name, task_arns, reason, result, workers, progress)
+
+    result.elapsed = time.monotonic() - started
+    return result
@@ -1,9 +1,10 @@
 # scripts/add_tasks.py
-import boto3
 import sys
 import json
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "infra", "layers", "common"))
+from fargate_pool import capacity, clients, keys, launches, profiles  # noqa: E402
 
 # Load stack outputs
 with open(".stack-outputs.json", "r") as f:
@@ -13,36 +14,11 @@ with open(".stack-outputs.json", "r") as f:
 event_bus_name = next(
     item["Value"] for item in outputs if item["Key"] == "TaskEventBusName"
 )
+table_name = next(item["Value"] for item in outputs if item["Key"] == "TasksTableName")
 
-# Initialize AWS client
-events = boto3.client("events")
-
-
-def publish_task_event():
-    try:
-        response = events.put_events(
-            Entries=[
-                {
-                    "Source": "com.fargate-pool",
-                    "DetailType": "TaskGrabbed",
-                    "Detail": json.dumps({"timestamp": datetime.utcnow().isoformat()}),
-                    "EventBusName": event_bus_name,
-                }
-            ]
-        )
-
-        if response["FailedEntryCount"] > 0:
-            return f"Failed to publish event: {response['Entries'][0]['ErrorMessage']}"
-        return "Successfully published task event"
-    except Exception as e:
-        return f"Failed to publish event: {str(e)}"
-
-
-def publish_events_parallel(num_events):
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(publish_task_event) for _ in range(num_events)]
-        for future in as_completed(futures):
-            print(future.result())
+# Initialize AWS clients
+events = clients.client("events")
+table = clients.table(table_name, operation=capacity.SIZE)
 
 
 if __name__ == "__main__":
@@ -51,6 +27,12 @@ if __name__ == "__main__":
         sys.exit(1)
 
     num_tasks = int(sys.argv[1])
-    print(f"Publishing {num_tasks} task events to EventBus: {event_bus_name}")
-    publish_events_parallel(num_tasks)
-    print(f"Attempted to publish {num_tasks} task events.")
+    # The pool sizer keeps at least this many warm tasks from now on
+    floor = profiles.add_target_size(table, keys.DEFAULT_PROFILE, num_tasks)
+    print(f"Pool sizer floor raised to {floor} warm tasks")
+    print(f"Publishing {num_tasks} launch requests to EventBus: {event_bus_name}")
+    # 10 events per PutEvents call; use set_pool_size.py to target an absolute size
+    accepted = launches.request_launches(events, event_bus_name, num_tasks, reason="add-tasks")
+    print(f"Published {accepted}/{num_tasks} launch requests.")
+    if accepted < num_tasks:
+        sys.exit(1)
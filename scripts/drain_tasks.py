@@ -1,5 +1,10 @@
-import boto3
 import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "infra", "layers", "common"))
+from fargate_pool import capacity, clients, rows, teardown  # noqa: E402
 
 # Load stack outputs
 with open(".stack-outputs.json", "r") as f:
@@ -10,41 +15,41 @@ table_name = next(item["Value"] for item in outputs if item["Key"] == "TasksTabl
 cluster_name = next(item["Value"] for item in outputs if item["Key"] == "ClusterName")
 
 # Initialize AWS clients
-ecs = boto3.client("ecs")
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(table_name)
+ecs = clients.client("ecs")
+table = clients.table(table_name, operation=capacity.DRAIN)
+
+started = time.monotonic()
+
+
+def report_progress(phase, done, total):
+    elapsed = time.monotonic() - started
+    verb = "Deleted" if phase == "delete" else "Stopped"
+    print(f"{verb} {done}/{total} {'rows' if phase == 'delete' else 'tasks'} ({elapsed:.1f} s)")
 
 
 def drain_tasks():
-    # Get all tasks from DynamoDB
-    response = table.scan()
-    tasks = response["Items"]
-
-    # Stop all ECS tasks
-    for task in tasks:
-        if "EcsTaskArn" in task:  # Only try to stop if we have the ECS task ARN
-            task_arn = task["EcsTaskArn"]
-            try:
-                # Extract just the task ID from the ARN if needed
-                # task_arn format: arn:aws:ecs:region:account:task/cluster-name/task-id
-                task_id = task_arn.split("/")[-1]
-                ecs.stop_task(cluster=cluster_name, task=task_id)
-                print(f"Stopped ECS task: {task_id}")
-            except Exception as e:
-                print(f"Error stopping ECS task {task_id}: {str(e)}")
-        else:
-            print(
-                f"No ECS task ARN found for task with SK: {task.get('SK', 'unknown')}"
-            )
-
-    # Delete all items from DynamoDB
-    with table.batch_writer() as batch:
-        for task in tasks:
-            batch.delete_item(Key={"PK": task["PK"], "SK": task["SK"]})
-
-    print(f"Deleted {len(tasks)} items from DynamoDB")
+    # Get all tasks from DynamoDB, including rows not yet migrated to the sharded layout
+    tasks = rows.all_task_rows(table)
+    print(f"Found {len(tasks)} task rows in {time.monotonic() - started:.1f} s")
+
+    # Rows go first so nothing is grabbed while stopping; pool tasks without a row are stopped too
+    result = teardown.teardown(
+        table,
+        ecs,
+        cluster_name,
+        tasks,
+        reason="Task pool drained",
+        sweep_orphans=True,
+        progress=report_progress,
+    )
+    print(result.summary())
+    print(capacity.format_report())
+    return result
 
 
 if __name__ == "__main__":
-    drain_tasks()
+    result = drain_tasks()
+    if result.delete_failures or result.stop_failures:
+        print("Task pool drained with failures, run again to retry.")
+        sys.exit(1)
     print("Task pool drained successfully.")
@@ -0,0 +1,77 @@
+"""Prints where launch time goes, per phase, over the last N launches.
+
+    python scripts/launch_report.py 500 [--by az|revision]
+
+For each phase (see fargate_pool/launch_phases.py) it prints p50/p90/p99/max
+in seconds and the phase's share of the summed launch time.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "infra", "layers", "common"))
+from fargate_pool import capacity, clients, launch_phases  # noqa: E402
+
+# Load stack outputs
+with open(".stack-outputs.json", "r") as f:
+    outputs = {item["Key"]: item["Value"] for item in json.load(f)}
+
+table = clients.table(outputs["TasksTableName"], operation=capacity.MONITOR)
+
+GROUP_ATTRIBUTES = {"az": "AvailabilityZone", "revision": "TaskDefinitionRevision"}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def print_breakdown(launches):
+    samples = defaultdict(list)
+    for launch in launches:
+        samples["Total"].append(float(launch["Total"]))
+        for phase, seconds in launch["Phases"].items():
+            samples[phase].append(float(seconds))
+
+    summed_total = sum(samples["Total"]) or 1.0
+    print(f"{'phase':<16}{'n':>6}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'share':>8}")
+    for phase in launch_phases.PHASES + ("Total",):
+        values = samples.get(phase)
+        if not values:
+            continue
+        share = "" if phase == "Total" else f"{sum(values) / summed_total:7.0%}"
+        print(
+            f"{phase:<16}{len(values):>6}"
+            f"{percentile(values, 50):>9.2f}{percentile(values, 90):>9.2f}"
+            f"{percentile(values, 99):>9.2f}{max(values):>9.2f}{share:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("count", type=int, nargs="?", default=200, help="Number of launches")
+    parser.add_argument("--by", choices=sorted(GROUP_ATTRIBUTES), help="Break down per group")
+    args = parser.parse_args()
+
+    launches = launch_phases.recent_launches(table, args.count)
+    if not launches:
+        print("No launches recorded yet")
+        return
+    print(f"Last {len(launches)} launches, {launches[-1]['SK'][:19]} to {launches[0]['SK'][:19]}")
+
+    if args.by is None:
+        print_breakdown(launches)
+        return
+
+    groups = defaultdict(list)
+    for launch in launches:
+        groups[launch.get(GROUP_ATTRIBUTES[args.by], "unknown")].append(launch)
+    for group, members in sorted(groups.items()):
+        print(f"\n{GROUP_ATTRIBUTES[args.by]} {group}")
+        print_breakdown(members)
+
+
+if __name__ == "__main__":
+    main()
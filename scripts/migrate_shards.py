@@ -0,0 +1,84 @@
+"""Moves task rows onto the sharded key layout.
+
+Rows written before sharding (PK = TASK#POOL), and rows left on the wrong
+shard after POOL_SHARDS was changed, are rewritten under the key computed by
+fargate_pool.keys. Each row is moved in a transaction, so a row is never lost
+or duplicated and the script can safely be re-run.
+"""
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "infra", "layers", "common"))
+from fargate_pool import capacity, clients, keys  # noqa: E402
+
+# Load stack outputs
+with open(".stack-outputs.json", "r") as f:
+    outputs = json.load(f)
+
+table_name = next(item["Value"] for item in outputs if item["Key"] == "TasksTableName")
+
+table = clients.table(table_name, operation=capacity.ADMIN)
+
+
+def scan_task_rows():
+    scan_params = {}
+    while True:
+        response = table.scan(**scan_params)
+        for item in response["Items"]:
+            if item["PK"].startswith(keys.LEGACY_PK) and item["SK"].startswith("TASK#"):
+                yield item
+        if "LastEvaluatedKey" not in response:
+            return
+        scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def migrate_row(item):
+    task_id = item["TaskId"]
+    attributes = {
+        name: value
+        for name, value in item.items()
+        if name not in ("PK", "SK", "TaskId", "Shard", "Status", "StatusShard", "AvailableShard")
+    }
+    new_item = keys.task_item(task_id, item["Status"], **attributes)
+
+    table.transact_write_items(
+        [
+            {
+                "Put": {
+                    "Item": new_item,
+                    "ConditionExpression": "attribute_not_exists(PK)",
+                }
+            },
+            {
+                "Delete": {
+                    "Key": {"PK": item["PK"], "SK": item["SK"]},
+                    "ConditionExpression": "#status = :status",
+                    "ExpressionAttributeNames": {"#status": "Status"},
+                    "ExpressionAttributeValues": {":status": item["Status"]},
+                }
+            },
+        ]
+    )
+
+
+def migrate():
+    moved = skipped = failed = 0
+    for item in scan_task_rows():
+        if item["PK"] == keys.task_key(item["TaskId"])["PK"]:
+            skipped += 1
+            continue
+        try:
+            migrate_row(item)
+            moved += 1
+        except Exception as e:
+            # Usually a concurrent status change; re-run the script to pick the row up
+            print(f"Failed to migrate task {item['TaskId']}: {str(e)}")
+            failed += 1
+
+    print(f"Moved {moved} rows, {skipped} already on their shard, {failed} failed")
+    print(capacity.format_report())
+
+
+if __name__ == "__main__":
+    migrate()
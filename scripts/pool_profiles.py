@@ -0,0 +1,129 @@
+"""Lists, adds and removes pool profiles.
+
+A profile is a warm pool of its own, with its own task definition, size and
+subnets. The pool sizer keeps it at --target-size warm tasks; clients grab
+from it by passing "profile" to /grab-task and /grab-tasks.
+
+    python scripts/pool_profiles.py list
+    python scripts/pool_profiles.py put large --task-definition pool-large:3 \\
+        --cpu 4096 --memory 8192 --target-size 20 [--readiness-gate probe]
+    python scripts/pool_profiles.py delete large [--force]
+
+The task and execution roles of the task definition must be the stack's
+TaskExecutionRole or be named with the stack's ProfileRolePrefix (default
+fargate-pool-profile-), the roles the launcher may pass. Without --readiness-gate the profile uses
+the stack's ReadinessGate; a task definition without a container health
+check then joins the pool on ECS RUNNING instead of waiting to be HEALTHY.
+A profile is deleted only once it has no tasks left (put it to
+--target-size 0 first) unless --force is given; its remaining tasks are
+then neither grabbed nor replaced.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "infra", "layers", "common"))
+from fargate_pool import capacity, clients, counters, keys, profiles, readiness  # noqa: E402
+
+# Load stack outputs
+with open(".stack-outputs.json", "r") as f:
+    outputs = {item["Key"]: item["Value"] for item in json.load(f)}
+
+table = clients.table(outputs["TasksTableName"], operation=capacity.ADMIN)
+ecs = clients.client("ecs")
+
+
+def list_profiles():
+    pool = counters.read_counts(table)
+    for profile in profiles.load_profiles(table).values():
+        counts = counters.profile_counts(pool, profile.name)
+        shape = f"{profile.cpu or '-'} CPU / {profile.memory or '-'} MiB"
+        target = profile.target_size
+        if profile.name == keys.DEFAULT_PROFILE:
+            target = f"forecast, at least {target}"
+        gate = profile.readiness_gate or "stack"
+        if profile.health_check is False:
+            gate += ", no health check"
+        print(
+            f"{profile.name:<16} {profile.task_definition:<32} {shape:<22} readiness {gate}, "
+            f"target {target}, "
+            f"{counts['RUNNING']} running, {counts['LAUNCHING']} launching, "
+            f"{counts['ASSIGNED']} assigned"
+        )
+
+
+def put(args):
+    profile = profiles.Profile(
+        name=args.name,
+        task_definition=args.task_definition,
+        cpu=args.cpu,
+        memory=args.memory,
+        subnets=args.subnets or [],
+        target_size=args.target_size,
+        readiness_gate=args.readiness_gate,
+    )
+    try:
+        profiles.put_profile(
+            table,
+            profile,
+            ecs,
+            role_prefix=outputs.get("ProfileRolePrefix"),
+            stack_roles=[arn for arn in [outputs.get("TaskExecutionRoleArn")] if arn],
+        )
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"Saved profile {args.name}")
+    if profile.health_check is False:
+        print(
+            f"{profile.task_definition} has no container health check: "
+            "under the health gate its tasks join the pool on RUNNING"
+        )
+
+
+def delete(args):
+    if args.name == keys.DEFAULT_PROFILE:
+        sys.exit("The default profile can't be deleted")
+
+    counts = counters.profile_counts(counters.read_counts(table), args.name)
+    tasks = sum(counts.values())
+    if tasks and not args.force:
+        sys.exit(f"Profile {args.name} still has {tasks} tasks: {counts}")
+    profiles.delete_profile(table, args.name)
+    print(f"Deleted profile {args.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="Show every profile and its tasks")
+
+    put_parser = commands.add_parser("put", help="Add or update a profile")
+    put_parser.add_argument("name")
+    put_parser.add_argument("--task-definition", required=True, help="Family[:revision] or ARN")
+    put_parser.add_argument("--cpu", help="Task CPU units, overrides the task definition")
+    put_parser.add_argument("--memory", help="Task memory in MiB, overrides the task definition")
+    put_parser.add_argument("--subnets", nargs="+", help="Defaults to the stack's subnets")
+    put_parser.add_argument("--target-size", type=int, default=0, help="Warm tasks to keep")
+    put_parser.add_argument(
+        "--readiness-gate", choices=readiness.GATES, help="Defaults to the stack's ReadinessGate"
+    )
+
+    delete_parser = commands.add_parser("delete", help="Remove a profile")
+    delete_parser.add_argument("name")
+    delete_parser.add_argument("--force", action="store_true", help="Delete even with tasks left")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        list_profiles()
+    elif args.command == "put":
+        if args.target_size < 0:
+            parser.error("--target-size must not be negative")
+        put(args)
+    else:
+        delete(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Replays a recorded grab trace against the pool sizer, offline.
+
+The trace is a file with one grab per line, as epoch seconds or an ISO 8601
+timestamp. The replay runs the same forecast code as the pool sizer
+function once a minute, refills every grab 1:1 like the stream does, and
+reports how often the pool ran dry and how many task-minutes sat idle.
+
+    python scripts/replay_forecast.py grabs.txt --startup 60 --baseline 20
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "infra", "layers", "common"))
+from fargate_pool import forecast  # noqa: E402
+
+
+def load_trace(path):
+    grabs = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                grabs.append(float(line))
+            except ValueError:
+                grabs.append(datetime.fromisoformat(line.replace("Z", "+00:00")).timestamp())
+    return sorted(grabs)
+
+
+class Pool:
+    """Warm tasks plus launches in flight, with idle time accounting"""
+
+    def __init__(self, startup, jitter, rng, initial=0):
+        self.startup = startup
+        self.jitter = jitter
+        self.rng = rng
+        self.ready = initial
+        self.launching = []  # heap of ready times
+        self.clock = None
+        self.idle_seconds = 0.0
+        self.launches = 0
+        self.retired = 0
+        self.peak = initial
+        self.startups = []
+
+    def advance(self, now):
+        """Move time forward, completing launches that are due"""
+        if self.clock is None:
+            self.clock = now
+        while self.launching and self.launching[0] <= now:
+            ready_at = heapq.heappop(self.launching)
+            self._tick(ready_at)
+            self.ready += 1
+        self._tick(now)
+        self.peak = max(self.peak, self.ready + len(self.launching))
+
+    def _tick(self, now):
+        self.idle_seconds += self.ready * (now - self.clock)
+        self.clock = now
+
+    def launch(self, count):
+        for _ in range(count):
+            latency = max(1.0, self.rng.gauss(self.startup, self.jitter))
+            self.startups.append(latency)
+            heapq.heappush(self.launching, self.clock + latency)
+        self.launches += count
+
+    def retire(self, count):
+        count = min(count, self.ready)
+        self.ready -= count
+        self.retired += count
+
+    @property
+    def warm(self):
+        return self.ready + len(self.launching)
+
+
+def replay(grabs, args, use_sizer):
+    rng = random.Random(args.seed)
+    config = forecast.SizerConfig(
+        min_size=args.min_size,
+        max_size=args.max_size,
+        headroom=args.headroom,
+        safety=args.safety,
+        default_startup=args.startup,
+        scale_up_cooldown=args.scale_up_cooldown,
+        scale_down_cooldown=args.scale_down_cooldown,
+    )
+    state = forecast.new_state(config)
+    pool = Pool(args.startup, args.startup_jitter, rng, initial=0 if use_sizer else args.baseline)
+
+    served = dry = 0
+    start = grabs[0] // 60 * 60
+    end = grabs[-1] + 60
+    minute_grabs = 0
+    next_grab = 0
+    pool.advance(start)
+
+    minute = start
+    while minute < end:
+        # Grabs arriving during this minute
+        while next_grab < len(grabs) and grabs[next_grab] < minute + 60:
+            pool.advance(grabs[next_grab])
+            if pool.ready:
+                pool.ready -= 1
+                served += 1
+                pool.launch(1)  # 1:1 refill from the stream
+            else:
+                dry += 1
+            minute_grabs += 1
+            next_grab += 1
+
+        pool.advance(minute + 60)
+        minute += 60
+
+        if use_sizer:
+            startups, pool.startups = pool.startups, []
+            forecast.observe(state, minute - 60, minute_grabs, startups, config)
+            change = forecast.decide(state, pool.warm, minute, config)
+            if change > 0:
+                pool.launch(change)
+            elif change < 0:
+                pool.retire(-change)
+        minute_grabs = 0
+
+    return {
+        "mode": "forecast" if use_sizer else f"static:{args.baseline}",
+        "grabs": len(grabs),
+        "served": served,
+        "dry_grabs": dry,
+        "dry_rate": round(dry / len(grabs), 4),
+        "idle_task_minutes": round(pool.idle_seconds / 60, 1),
+        "launches": pool.launches,
+        "retired": pool.retired,
+        "peak_pool_size": pool.peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="File with one grab timestamp per line")
+    parser.add_argument("--startup", type=float, default=60.0, help="Mean startup seconds")
+    parser.add_argument("--startup-jitter", type=float, default=15.0)
+    parser.add_argument("--min-size", type=int, default=0)
+    parser.add_argument("--max-size", type=int, default=500)
+    parser.add_argument("--headroom", type=float, default=1.2)
+    parser.add_argument("--safety", type=float, default=2.0)
+    parser.add_argument("--scale-up-cooldown", type=float, default=60.0)
+    parser.add_argument("--scale-down-cooldown", type=float, default=600.0)
+    parser.add_argument(
+        "--baseline", type=int, help="Also replay a static pool of this size with 1:1 refill"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    grabs = load_trace(args.trace)
+    if not grabs:
+        print("Trace is empty")
+        sys.exit(1)
+
+    reports = [replay(grabs, args, use_sizer=True)]
+    if args.baseline is not None:
+        reports.append(replay(grabs, args, use_sizer=False))
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Sets the number of warm (LAUNCHING + RUNNING) tasks in the pool.
+
+Only the difference to the current pool is acted on: missing tasks are
+requested as LaunchRequested events, 10 per PutEvents call, and surplus
+RUNNING tasks are retired. Launch requests still waiting in the launch
+queue count as warm, so running the command twice does not launch twice.
+
+    python scripts/set_pool_size.py 500 [--wait] [--timeout 900]
+
+The size is also stored as the TargetSize of the default profile, the
+floor of the pool sizer: the sizer never retires below it, but launches
+above it when the demand forecast needs more tasks, up to PoolMaxSize.
+Setting a size of 0 hands the pool back to the forecast.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "infra", "layers", "common"))
+from fargate_pool import capacity, clients, counters, keys, launches, profiles, retire  # noqa: E402
+
+# Load stack outputs
+with open(".stack-outputs.json", "r") as f:
+    outputs = {item["Key"]: item["Value"] for item in json.load(f)}
+
+table_name = outputs["TasksTableName"]
+cluster_name = outputs["ClusterName"]
+event_bus_name = outputs["TaskEventBusName"]
+# Stacks deployed before the output existed can't see queued launches
+launch_queue_url = outputs.get("LaunchQueueUrl")
+
+ecs = clients.client("ecs")
+events = clients.client("events")
+sqs = clients.client("sqs")
+table = clients.table(table_name, operation=capacity.SIZE)
+
+
+def pool_state():
+    counts = counters.read_counts(table)
+    return {
+        "launching": counts.get("LAUNCHING", 0),
+        "running": counts.get("RUNNING", 0),
+        # Launch requests not yet turned into LAUNCHING rows
+        "queued": launches.queued_launches(sqs, launch_queue_url),
+    }
+
+
+def warm(state):
+    return state["launching"] + state["running"] + state["queued"]
+
+
+def converge(size, state):
+    """Launch or retire towards `size`. Returns the number of tasks acted on."""
+    delta = size - warm(state)
+
+    if delta > 0:
+        accepted = launches.request_launches(events, event_bus_name, delta, reason="set-pool-size")
+        print(
+            f"Requested {accepted}/{delta} launches in "
+            f"{math.ceil(delta / launches.PUT_EVENTS_MAX_ENTRIES)} PutEvents calls"
+        )
+        return accepted
+
+    # Only RUNNING tasks can be retired; surplus still launching is retired once it's up
+    surplus = min(-delta, state["running"])
+    if surplus > 0:
+        retired = retire.retire_warm_tasks(
+            table, ecs, cluster_name, surplus, reason=f"Pool size set to {size}"
+        )
+        print(f"Retired {len(retired.retired)}/{-delta} surplus warm tasks")
+        return len(retired.retired)
+
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("size", type=int, help="Number of warm tasks")
+    parser.add_argument("--wait", action="store_true", help="Wait until the pool has converged")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds to wait at most")
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between checks")
+    args = parser.parse_args()
+
+    if args.size < 0:
+        parser.error("size must not be negative")
+
+    # Before acting, so the sizer doesn't retire what is launched here
+    profiles.set_target_size(table, keys.DEFAULT_PROFILE, args.size)
+
+    state = pool_state()
+    print(
+        f"Pool: {state['running']} running, {state['launching']} launching, "
+        f"{state['queued']} queued; target {args.size}"
+    )
+    converge(args.size, state)
+
+    if not args.wait:
+        return
+
+    started = time.monotonic()
+    while True:
+        time.sleep(args.interval)
+        state = pool_state()
+        elapsed = time.monotonic() - started
+        print(
+            f"[{elapsed:5.0f} s] {state['running']}/{args.size} running, "
+            f"{state['launching']} launching, {state['queued']} queued"
+        )
+
+        if state["running"] == args.size and not state["launching"] and not state["queued"]:
+            print(f"Pool converged to {args.size} warm tasks in {elapsed:.0f} s")
+            return
+
+        if elapsed >= args.timeout:
+            print(f"Pool did not converge within {args.timeout:.0f} s")
+            sys.exit(1)
+
+        # Launches that failed for good or grabs in the meantime leave the pool off target
+        if not state["launching"] and not state["queued"]:
+            converge(args.size, state)
+
+
+if __name__ == "__main__":
+    main()
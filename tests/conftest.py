@@ -0,0 +1,49 @@
+"""Unit tests of the shared layer against the bench's in-memory AWS stand-ins.
+
+    pip install -r bench/requirements.txt && python -m pytest tests
+"""
+import importlib.util
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [os.path.join(ROOT, "bench"), os.path.join(ROOT, "infra", "layers", "common")]
+
+import fakes  # noqa: E402
+import harness  # noqa: E402
+from fargate_pool import capacity, clients  # noqa: E402
+
+
+@pytest.fixture
+def world():
+    """Fresh stand-ins, with boto3 pointing at them"""
+    world = fakes.World(random.Random(0), {"dynamodb": {"unprocessed_rate": 0.0}})
+    world.create_table(harness.TABLE_NAME, "PK", "SK", harness.TABLE_INDEXES)
+    with harness.stand_ins(world):
+        yield world
+    capacity.LEDGER.reset()
+
+
+@pytest.fixture
+def table(world):
+    return clients.table(harness.TABLE_NAME)
+
+
+@pytest.fixture
+def load_handler(table, monkeypatch):
+    """Imports the app.py of a function in infra/functions against the stand-ins"""
+    monkeypatch.setenv("TABLE_NAME", harness.TABLE_NAME)
+    monkeypatch.setenv("EVENT_BUS_NAME", harness.EVENT_BUS_NAME)
+    monkeypatch.setenv("POWERTOOLS_METRICS_NAMESPACE", "FargatePoolTest")
+
+    def load(function):
+        path = os.path.join(ROOT, "infra", "functions", function, "app.py")
+        spec = importlib.util.spec_from_file_location(f"test_{function}_app", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    return load
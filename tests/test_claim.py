@@ -0,0 +1,175 @@
+from datetime import datetime
+
+import pytest
+
+import harness
+from fargate_pool import claim, clients, keys
+
+
+def add_running(table, task_id, **attributes):
+    table.put_item(Item=keys.task_item(task_id, "RUNNING", PublicIp="10.0.0.1", **attributes))
+
+
+def row(table, task_id):
+    return table.get_item(Key=keys.task_key(task_id))["Item"]
+
+
+def same_shard_ids(count, prefix="task"):
+    """`count` task ids that land in one shard, so they share a candidate page"""
+    ids, i = [], 0
+    while len(ids) < count:
+        task_id = f"{prefix}-{i}"
+        if keys.shard_for(task_id) == 0:
+            ids.append(task_id)
+        i += 1
+    return ids
+
+
+class StaleReads:
+    """The table, but `claim_before_write` is claimed by someone else right after each query"""
+
+    def __init__(self, table, claim_before_write):
+        self.table = table
+        self.claim_before_write = list(claim_before_write)
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def query(self, **params):
+        response = self.table.query(**params)
+        while self.claim_before_write:
+            task_id = self.claim_before_write.pop()
+            self.table.update_item(
+                Key=keys.task_key(task_id),
+                UpdateExpression="SET #status = :assigned REMOVE AvailableShard",
+                ExpressionAttributeNames={"#status": "Status"},
+                ExpressionAttributeValues={":assigned": "ASSIGNED"},
+            )
+        return response
+
+
+@pytest.mark.parametrize("strategy", claim.STRATEGIES)
+def test_claim_assigns_a_running_task(table, strategy):
+    add_running(table, "a")
+    result = claim.claim_task(table, "user-1", strategy=strategy)
+
+    assert result.task["TaskId"] == "a"
+    assert (result.attempts, result.conflicts, result.timed_out) == (1, 0, False)
+    stored = row(table, "a")
+    assert stored["Status"] == "ASSIGNED"
+    assert stored["AssignedTo"] == "user-1"
+    assert stored["StatusShard"] == keys.status_key("ASSIGNED", keys.shard_for("a"))
+    assert "AvailableShard" not in stored
+    # Naive UTC, like every other writer of UpdatedAt
+    assert datetime.fromisoformat(stored["UpdatedAt"]).tzinfo is None
+
+
+def test_claim_misses_on_an_empty_pool(table):
+    result = claim.claim_task(table, "user-1")
+    assert result.task is None
+    assert not result.timed_out
+
+
+def test_claimed_task_is_not_claimed_again(table):
+    add_running(table, "a")
+    assert claim.claim_task(table, "user-1").task is not None
+    assert claim.claim_task(table, "user-2").task is None
+
+
+def test_claim_moves_on_after_a_lost_race(table):
+    lost, free = same_shard_ids(2)
+    add_running(table, lost)
+    add_running(table, free)
+    result = claim.claim_task(StaleReads(table, [lost]), "user-1")
+
+    assert result.task["TaskId"] == free
+    assert result.conflicts in (0, 1)
+    assert row(table, lost)["Status"] == "ASSIGNED"
+    assert "AssignedTo" not in row(table, lost)
+
+
+@pytest.mark.parametrize("prefer_spot", [True, False])
+def test_claim_prefers_the_requested_capacity_provider(table, prefer_spot):
+    spot, on_demand = same_shard_ids(2)
+    add_running(table, spot, CapacityProvider=claim.SPOT)
+    add_running(table, on_demand, CapacityProvider="FARGATE")
+    result = claim.claim_task(table, "user-1", prefer_spot=prefer_spot)
+    assert result.task["TaskId"] == (spot if prefer_spot else on_demand)
+
+
+def test_claim_falls_back_to_the_next_profile(table):
+    add_running(table, "large-1", Profile="large")
+    assert claim.claim_task(table, "user-1").task is None
+
+    result = claim.claim_task(table, "user-1", fallbacks=["large"])
+    assert result.task["TaskId"] == "large-1"
+    assert row(table, "large-1")["StatusShard"] == keys.status_key(
+        "ASSIGNED", keys.shard_for("large-1"), "large"
+    )
+
+
+def test_claim_with_no_budget_times_out(table):
+    add_running(table, "a")
+    result = claim.claim_task(table, "user-1", budget=0)
+    assert result.task is None
+    assert result.timed_out
+
+
+def test_bulk_claim_assigns_distinct_tasks(table):
+    for i in range(5):
+        add_running(table, f"task-{i}")
+    result = claim.claim_tasks(table, ["u1", "u2", "u3", "u2"])
+
+    assert set(result.assigned) == {"u1", "u2", "u3"}
+    assert len({task["TaskId"] for task in result.assigned.values()}) == 3
+    assert result.short == []
+    for user_id, task in result.assigned.items():
+        assert row(table, task["TaskId"])["AssignedTo"] == user_id
+
+
+def test_bulk_claim_reports_users_left_short(table):
+    add_running(table, "a")
+    result = claim.claim_tasks(table, ["u1", "u2"])
+    assert len(result.assigned) == 1
+    assert len(result.short) == 1
+
+
+def test_bulk_claim_retries_a_cancelled_transaction(table, monkeypatch):
+    # Candidates in index order, so the first chunk holds the stale one
+    monkeypatch.setattr(claim.random, "shuffle", lambda items: None)
+    ids = sorted(same_shard_ids(4), key=keys.task_sk)
+    for task_id in ids:
+        add_running(table, task_id)
+    # Taken between the read and the transaction: the first chunk is cancelled
+    result = claim.claim_tasks(StaleReads(table, [ids[0]]), ["u1", "u2", "u3"])
+
+    assert result.conflicts == 1
+    assert result.transactions == 2
+    assert sorted(task["TaskId"] for task in result.assigned.values()) == sorted(ids[1:])
+    assert "AssignedTo" not in row(table, ids[0])
+
+
+def test_transaction_cancellation_names_the_lost_rows(table):
+    taken, free = same_shard_ids(2)
+    add_running(table, free)
+    table.put_item(Item=keys.task_item(taken, "ASSIGNED"))
+    pairs = [("u1", row(table, free)), ("u2", row(table, taken))]
+
+    lost = claim._transact_assign(table, pairs, 0, keys.DEFAULT_PROFILE)
+    assert [task["TaskId"] for task in lost] == [taken]
+    # All or nothing
+    assert row(table, free)["Status"] == "RUNNING"
+
+
+def test_claim_reads_the_legacy_index_before_the_available_index_exists(world, monkeypatch):
+    # The layout of IndexRollout stages 1 and 2: StatusShardIndex projects all attributes
+    indexes = {keys.LEGACY_STATUS_INDEX: ("StatusShard", "SK"), **harness.TABLE_INDEXES}
+    del indexes["AvailableIndex"]
+    world.create_table("legacy-tasks", "PK", "SK", indexes)
+    monkeypatch.setattr(keys, "AVAILABLE_INDEX", keys.LEGACY_STATUS_INDEX)
+    table = clients.table("legacy-tasks")
+    add_running(table, "a", CapacityProvider=claim.SPOT)
+
+    result = claim.claim_task(table, "user-1", prefer_spot=True)
+    assert result.task["TaskId"] == "a"
+    assert claim.claim_task(table, "user-2").task is None
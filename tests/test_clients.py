@@ -0,0 +1,97 @@
+from decimal import Decimal
+
+import pytest
+
+import harness
+from fargate_pool import clients, teardown
+
+
+def test_items_round_trip(table):
+    item = {
+        "PK": "TASK#POOL",
+        "SK": "TASK#a",
+        "Count": 3,
+        "Ratio": Decimal("0.5"),
+        "Ready": True,
+        "Missing": None,
+        "Tags": {"x", "y"},
+        "Phases": {"Queue": Decimal("1.25"), "Steps": [1, "two"]},
+    }
+    table.put_item(Item=item)
+    stored = table.get_item(Key={"PK": "TASK#POOL", "SK": "TASK#a"})["Item"]
+    # Numbers come back as Decimal, like from the boto3 Table resource
+    assert stored == {
+        **item,
+        "Count": Decimal(3),
+        "Phases": {"Queue": Decimal("1.25"), "Steps": [Decimal(1), "two"]},
+    }
+
+
+def test_unprocessed_writes_come_back_native(world, table):
+    world.config["dynamodb"]["unprocessed_rate"] = 1.0
+    requests = [
+        {"PutRequest": {"Item": {"PK": "TASK#POOL", "SK": "TASK#a", "Count": 1}}},
+        {"DeleteRequest": {"Key": {"PK": "TASK#POOL", "SK": "TASK#b"}}},
+    ]
+    assert table.batch_write_item(requests) == [
+        {"PutRequest": {"Item": {"PK": "TASK#POOL", "SK": "TASK#a", "Count": Decimal(1)}}},
+        {"DeleteRequest": {"Key": {"PK": "TASK#POOL", "SK": "TASK#b"}}},
+    ]
+
+
+def test_batch_writer_resends_unprocessed_writes(world, table, monkeypatch):
+    monkeypatch.setattr(clients, "backoff", lambda attempt: None)
+    world.config["dynamodb"]["unprocessed_rate"] = 0.3
+    with table.batch_writer() as batch:
+        for i in range(60):
+            batch.put_item(Item={"PK": "TASK#POOL", "SK": f"TASK#{i}"})
+    assert len(world.tables[harness.TABLE_NAME].items) == 60
+
+    with table.batch_writer() as batch:
+        for i in range(60):
+            batch.delete_item(Key={"PK": "TASK#POOL", "SK": f"TASK#{i}"})
+    assert not world.tables[harness.TABLE_NAME].items
+
+
+def test_batch_writer_gives_up_on_writes_left_unprocessed(world, table, monkeypatch):
+    delays = []
+    monkeypatch.setattr(clients, "backoff", delays.append)
+    world.config["dynamodb"]["unprocessed_rate"] = 1.0
+
+    with pytest.raises(clients.UnprocessedItemsError) as raised:
+        with table.batch_writer() as batch:
+            for i in range(3):
+                batch.put_item(Item={"PK": "TASK#POOL", "SK": f"TASK#{i}"})
+
+    assert [request["PutRequest"]["Item"]["SK"] for request in raised.value.requests] == [
+        "TASK#0",
+        "TASK#1",
+        "TASK#2",
+    ]
+    # Backed off before every resend
+    assert delays == list(range(1, clients.BATCH_WRITE_ATTEMPTS))
+
+
+def test_marshal_leaves_expressions_alone():
+    params = clients._marshal(
+        {"Key": {"PK": "a"}, "ExpressionAttributeValues": {":n": 1}, "UpdateExpression": "SET N = :n"}
+    )
+    assert params == {
+        "Key": {"PK": {"S": "a"}},
+        "ExpressionAttributeValues": {":n": {"N": "1"}},
+        "UpdateExpression": "SET N = :n",
+    }
+
+
+def test_teardown_deletes_rows_left_unprocessed(world, table, monkeypatch):
+    monkeypatch.setattr(teardown, "_backoff", lambda attempt: None)
+    rows = [{"PK": "TASK#POOL", "SK": f"TASK#{i}"} for i in range(60)]
+    for row in rows:
+        table.put_item(Item=row)
+
+    world.config["dynamodb"]["unprocessed_rate"] = 0.3
+    result = teardown.TeardownResult()
+    teardown.delete_rows(table, rows, result, workers=1)
+
+    assert (result.rows_deleted, result.delete_failures) == (60, 0)
+    assert not world.tables[harness.TABLE_NAME].items
@@ -0,0 +1,41 @@
+import pytest
+
+import harness
+from fargate_pool import counters, keys
+
+
+@pytest.fixture
+def drift_check(load_handler):
+    module = load_handler("counter_drift")
+    return lambda: module.lambda_handler({}, harness.LambdaContext("counter_drift"))
+
+
+def test_drift_is_corrected_once_two_checks_agree(table, drift_check):
+    # A row the stream never counted
+    table.put_item(Item=keys.task_item("a", "RUNNING"))
+
+    drift_check()
+    assert counters.read_counts(table).get("RUNNING", 0) == 0
+    assert counters.read_drift(table)["RUNNING"] == 1
+
+    drift_check()
+    assert counters.read_counts(table)["RUNNING"] == 1
+    assert counters.read_counts(table)[f"RUNNING#{keys.shard_for('a')}"] == 1
+
+    drift_check()
+    assert counters.read_counts(table)["RUNNING"] == 1
+    assert counters.read_drift(table) == {}
+
+
+def test_drift_the_stream_catches_up_on_is_not_corrected(table, drift_check):
+    # Indexed, but the stream has not applied the transition yet
+    table.put_item(Item=keys.task_item("a", "RUNNING"))
+    drift_check()
+
+    counters.apply_deltas(table, counters.count_statuses(table))
+    # Counted once, by the stream
+    assert counters.read_counts(table)["RUNNING"] == 1
+    drift_check()
+
+    assert counters.read_counts(table)["RUNNING"] == 1
+    assert counters.read_drift(table) == {}
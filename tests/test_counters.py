@@ -0,0 +1,59 @@
+from boto3.dynamodb.types import TypeSerializer
+
+from fargate_pool import counters, keys
+
+
+def stream_record(old=None, new=None):
+    """A stream record of a task row changing from `old` to `new`, in wire format"""
+    serializer = TypeSerializer()
+    images = {}
+    for name, item in (("OldImage", old), ("NewImage", new)):
+        if item is not None:
+            images[name] = {k: serializer.serialize(v) for k, v in item.items()}
+    return {"eventName": "MODIFY", "dynamodb": images}
+
+
+def test_a_grab_moves_one_task_between_statuses():
+    running = keys.task_item("a", "RUNNING", CapacityProvider="FARGATE_SPOT")
+    assigned = {**running, "Status": "ASSIGNED"}
+    shard = keys.shard_for("a")
+
+    assert counters.record_deltas(stream_record(running, assigned)) == {
+        "RUNNING": -1,
+        f"RUNNING#{shard}": -1,
+        "RUNNING#FARGATE_SPOT": -1,
+        "RUNNING#PROFILE#default": -1,
+        "ASSIGNED": 1,
+        f"ASSIGNED#{shard}": 1,
+        "ASSIGNED#FARGATE_SPOT": 1,
+        "ASSIGNED#PROFILE#default": 1,
+    }
+
+
+def test_rows_other_than_tasks_are_not_counted():
+    item = {"PK": "POOL#RECYCLE", "SK": "CREDITS", "Status": "RUNNING"}
+    assert not counters.record_deltas(stream_record(None, item))
+
+
+def test_deltas_add_up_in_one_write(table):
+    counters.apply_deltas(table, {"RUNNING": 3, "ASSIGNED": 0})
+    counters.apply_deltas(table, {"RUNNING": -1, "ASSIGNED": 1})
+    counts = counters.read_counts(table)
+    assert (counts["RUNNING"], counts["ASSIGNED"]) == (2, 1)
+
+
+def test_recount_matches_the_stream_deltas(table):
+    items = [
+        keys.task_item("a", "RUNNING"),
+        keys.task_item("b", "RUNNING", CapacityProvider="FARGATE_SPOT"),
+        keys.task_item("c", "ASSIGNED"),
+        keys.task_item("d", "LAUNCHING", Profile="large"),
+    ]
+    deltas = {}
+    for item in items:
+        table.put_item(Item=item)
+        for field, delta in counters.record_deltas(stream_record(None, item)).items():
+            deltas[field] = deltas.get(field, 0) + delta
+
+    recount = counters.count_statuses(table, profiles=(keys.DEFAULT_PROFILE, "large"))
+    assert {field: count for field, count in recount.items() if count} == deltas
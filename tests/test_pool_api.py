@@ -0,0 +1,25 @@
+import pytest
+
+import harness
+from pool_api import PoolApi
+
+
+@pytest.fixture
+def api(table, monkeypatch):
+    monkeypatch.setenv("DYNAMODB_TABLE_NAME", harness.TABLE_NAME)
+    return PoolApi()
+
+
+@pytest.mark.parametrize(
+    "user_ids", [None, [], 5, "user-1", ["user-1", ""], ["user-1", 2], [None]]
+)
+def test_grab_tasks_rejects_malformed_user_ids(api, user_ids):
+    body, status = api.grab_tasks({"user_ids": user_ids})
+    assert status == 400
+    assert "error" in body
+
+
+def test_grab_tasks_without_tasks_is_a_miss(api):
+    body, status = api.grab_tasks({"user_ids": ["user-1", "user-2"]})
+    assert status == 404
+    assert body["assigned"] == 0
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import harness
+from fargate_pool import keys
+
+
+@pytest.fixture
+def reconciler(load_handler, world, monkeypatch):
+    """The pool_reconciler handler module, with the LaunchRequested events it publishes"""
+    monkeypatch.setenv("CLUSTER_NAME", harness.CLUSTER_NAME)
+    module = load_handler("pool_reconciler")
+    module.requested = []
+    world.events.add_rule(
+        harness.EVENT_BUS_NAME,
+        lambda event: event["detail-type"] == "LaunchRequested",
+        lambda event: module.requested.append(event["detail"]),
+    )
+    return module
+
+
+def add_failed_launch(table, task_id, generation):
+    """An ERROR row of a launch that used all its attempts, past the grace period"""
+    updated_at = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    table.put_item(
+        Item=keys.task_item(
+            task_id,
+            "ERROR",
+            LaunchAttempt=3,
+            LaunchGeneration=generation,
+            ErrorMessage="Task failed to start: CannotPullContainerError",
+            UpdatedAt=updated_at,
+        )
+    )
+
+
+def reconcile(reconciler, world):
+    result = reconciler.reconcile()
+    world.run_until(world.now + 5)
+    return result
+
+
+def test_a_failed_launch_is_relaunched_in_its_next_round(table, reconciler, world):
+    add_failed_launch(table, "a", generation=1)
+
+    result = reconcile(reconciler, world)
+
+    assert (result["Relaunches"], result["LaunchesAbandoned"]) == (1, 0)
+    assert [(detail.get("attempt"), detail["generation"]) for detail in reconciler.requested] == [
+        (None, 2)
+    ]
+    assert "Item" not in table.get_item(Key=keys.task_key("a"))
+
+
+def test_a_launch_failing_every_round_is_abandoned(table, reconciler, world):
+    add_failed_launch(table, "a", generation=reconciler.MAX_LAUNCH_GENERATIONS)
+
+    result = reconcile(reconciler, world)
+
+    assert (result["Relaunches"], result["LaunchesAbandoned"]) == (0, 1)
+    assert reconciler.requested == []
+    row = table.get_item(Key=keys.task_key("a"))["Item"]
+    assert row["Status"] == "ERROR"
+    assert "AbandonedAt" in row and "ExpiresAt" in row
+
+    # Left alone from then on
+    result = reconcile(reconciler, world)
+    assert (result["ErrorRows"], result["Relaunches"], result["LaunchesAbandoned"]) == (0, 0, 0)
@@ -0,0 +1,113 @@
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+
+import harness
+from fargate_pool import keys, recycle
+
+
+@pytest.fixture
+def grabbed(load_handler, world, monkeypatch):
+    """The process_task_grabbed handler module, with its events recorded"""
+    module = load_handler("process_task_grabbed")
+    monkeypatch.setattr(module.time, "sleep", lambda seconds: None)
+
+    module.published = []
+    world.events.add_rule(
+        harness.EVENT_BUS_NAME, lambda event: True, lambda event: module.published.append(event)
+    )
+    return module
+
+
+def transition(task_id, old_status, new_status, profile=keys.DEFAULT_PROFILE):
+    """A stream record of a task row moving from `old_status` to `new_status`"""
+    serializer = TypeSerializer()
+    old = keys.task_item(task_id, old_status, Profile=profile)
+    new = {**old, "Status": new_status}
+    return {
+        "eventName": "MODIFY",
+        "dynamodb": {
+            "SequenceNumber": f"seq-{task_id}",
+            "ApproximateCreationDateTime": 1_700_000_000,
+            "OldImage": {k: serializer.serialize(v) for k, v in old.items()},
+            "NewImage": {k: serializer.serialize(v) for k, v in new.items()},
+        },
+    }
+
+
+def grab(task_id, profile=keys.DEFAULT_PROFILE):
+    return transition(task_id, "RUNNING", "ASSIGNED", profile)
+
+
+def recycled(task_id, profile=keys.DEFAULT_PROFILE):
+    return transition(task_id, "ASSIGNED", "RUNNING", profile)
+
+
+def test_plan_refills_spends_credits_in_record_order(grabbed):
+    records = [grab("a"), recycled("b"), grab("c"), grab("d", "large")]
+    credits = grabbed.Counter()
+
+    refills, covered = grabbed.plan_refills(records, credits)
+
+    # The first grab comes before the recycle that could have covered it
+    assert refills == [0, 3]
+    assert covered == [2]
+    assert credits == {keys.DEFAULT_PROFILE: 0}
+
+
+def test_plan_refills_spends_reserved_credits_per_profile(grabbed):
+    records = [grab("a"), grab("b", "large"), grab("c")]
+    credits = grabbed.Counter({keys.DEFAULT_PROFILE: 1})
+
+    refills, covered = grabbed.plan_refills(records, credits)
+
+    assert refills == [1, 2]
+    assert covered == [0]
+
+
+def test_handler_spends_stored_credits_and_publishes_the_rest(grabbed, world):
+    recycle.add_credits(grabbed.table, 1)
+    event = {"Records": [grab("a"), grab("b")]}
+
+    assert grabbed.lambda_handler(event, harness.LambdaContext("grabbed")) == {
+        "batchItemFailures": []
+    }
+    world.run_until(world.now + 5)
+    assert [event["detail"]["taskId"] for event in grabbed.published] == ["b"]
+    assert recycle.read_credits(grabbed.table) == 0
+
+
+def test_handler_keeps_unspent_credits(grabbed, world):
+    recycle.add_credits(grabbed.table, 1)
+    event = {"Records": [recycled("a"), grab("b")]}
+
+    grabbed.lambda_handler(event, harness.LambdaContext("grabbed"))
+    world.run_until(world.now + 5)
+
+    # One reserved and spent on the grab, one earned by the recycle
+    assert grabbed.published == []
+    assert recycle.read_credits(grabbed.table) == 1
+
+
+def test_handler_gives_back_credits_of_a_redelivered_tail(grabbed, world):
+    world.events.config["failure_rate"] = 1.0
+    recycle.add_credits(grabbed.table, 1)
+    event = {"Records": [grab("a"), recycled("b"), grab("c"), grab("d")]}
+
+    response = grabbed.lambda_handler(event, harness.LambdaContext("grabbed"))
+
+    # Both earlier grabs were covered, the stored credit and the recycle's. The
+    # batch is redelivered from the failed refill, which has no credit left.
+    assert response == {"batchItemFailures": [{"itemIdentifier": "seq-d"}]}
+    assert recycle.read_credits(grabbed.table) == 0
+
+
+def test_handler_gives_back_credits_reserved_for_a_redelivered_grab(grabbed, world):
+    world.events.config["failure_rate"] = 1.0
+    recycle.add_credits(grabbed.table, 1)
+    event = {"Records": [grab("a", "large"), grab("b")]}
+
+    response = grabbed.lambda_handler(event, harness.LambdaContext("grabbed"))
+
+    # The credit reserved for "b" is returned for its next delivery to spend
+    assert response == {"batchItemFailures": [{"itemIdentifier": "seq-a"}]}
+    assert recycle.read_credits(grabbed.table) == 1
@@ -0,0 +1,98 @@
+import pytest
+
+from fargate_pool import keys, profiles
+
+
+def test_default_profile_sends_no_overrides(monkeypatch):
+    monkeypatch.setattr(profiles, "TASK_DEFINITION_CPU", "1024")
+    monkeypatch.setattr(profiles, "TASK_DEFINITION_MEMORY", "2048")
+    monkeypatch.delenv("TASK_CPU", raising=False)
+    monkeypatch.delenv("TASK_MEMORY", raising=False)
+    default = profiles.default_profile()
+    assert default.overrides() == {}
+    assert default.size == (1024, 2048)
+
+
+def test_default_profile_overrides_only_what_differs(monkeypatch):
+    monkeypatch.setattr(profiles, "TASK_DEFINITION_CPU", "1024")
+    monkeypatch.setattr(profiles, "TASK_DEFINITION_MEMORY", "2048")
+    monkeypatch.setenv("TASK_CPU", "1024")
+    monkeypatch.setenv("TASK_MEMORY", "4096")
+    assert profiles.default_profile().overrides() == {"memory": "4096"}
+
+
+def test_fallbacks_are_larger_profiles_smallest_first(monkeypatch):
+    monkeypatch.setattr(profiles, "TASK_DEFINITION_CPU", "1024")
+    monkeypatch.setattr(profiles, "TASK_DEFINITION_MEMORY", "2048")
+    known = {
+        keys.DEFAULT_PROFILE: profiles.Profile(keys.DEFAULT_PROFILE, "pool"),
+        "small": profiles.Profile("small", "pool-small", cpu="512", memory="1024"),
+        "xlarge": profiles.Profile("xlarge", "pool-xl", cpu="8192", memory="16384"),
+        "large": profiles.Profile("large", "pool-large", cpu="4096", memory="8192"),
+    }
+    assert profiles.larger_profiles(known, keys.DEFAULT_PROFILE) == ["large", "xlarge"]
+    assert profiles.larger_profiles(known, "small") == [keys.DEFAULT_PROFILE, "large", "xlarge"]
+    # Other profiles run task definitions of their own, so their shape is always sent
+    assert known["large"].overrides() == {"cpu": "4096", "memory": "8192"}
+
+
+def test_target_size_keeps_other_settings(table):
+    profiles.put_profile(table, profiles.Profile("large", "pool-large:3", cpu="4096"))
+    assert profiles.add_target_size(table, "large", 5) == 5
+    assert profiles.add_target_size(table, "large", 3) == 8
+    profiles.set_target_size(table, "large", 2)
+    large = profiles.load_profiles(table)["large"]
+    assert (large.task_definition, large.cpu, large.target_size) == ("pool-large:3", "4096", 2)
+
+
+def register(world, family, health_check):
+    container = {"name": "app", "image": "app:latest"}
+    if health_check:
+        container["healthCheck"] = {"command": ["CMD", "true"]}
+    world.ecs.register_task_definition(family=family, containerDefinitions=[container])
+
+
+def test_profile_without_a_health_check_joins_on_running_under_the_health_gate(world, table):
+    register(world, "pool-probe", health_check=False)
+    profiles.put_profile(table, profiles.Profile("probe", "pool-probe"), world.ecs)
+
+    probe = profiles.load_profiles(table)["probe"]
+    assert probe.health_check is False
+    assert probe.gate("health") == "none"
+    assert probe.gate("probe") == "probe"
+
+
+def test_profile_with_a_health_check_keeps_the_health_gate(world, table):
+    register(world, "pool-large", health_check=True)
+    profiles.put_profile(table, profiles.Profile("large", "pool-large:1"), world.ecs)
+    assert profiles.load_profiles(table)["large"].gate("health") == "health"
+
+
+def test_health_gate_needs_a_health_check(world, table):
+    register(world, "pool-probe", health_check=False)
+    profile = profiles.Profile("probe", "pool-probe", readiness_gate="health")
+    with pytest.raises(ValueError):
+        profiles.put_profile(table, profile, world.ecs)
+    assert "probe" not in profiles.load_profiles(table)
+
+
+def test_profile_roles_must_be_ones_the_launcher_may_pass(world, table):
+    stack_role = "arn:aws:iam::000000000000:role/fargate-pool-TaskExecutionRole-1"
+    allowed = {"role_prefix": "fargate-pool-profile-", "stack_roles": [stack_role]}
+    world.ecs.register_task_definition(
+        family="pool-gpu",
+        containerDefinitions=[{"name": "app", "image": "app:latest"}],
+        executionRoleArn=stack_role,
+        taskRoleArn="arn:aws:iam::000000000000:role/fargate-pool-profile-gpu",
+    )
+    profiles.put_profile(table, profiles.Profile("gpu", "pool-gpu"), world.ecs, **allowed)
+
+    world.ecs.register_task_definition(
+        family="pool-gpu",
+        containerDefinitions=[{"name": "app", "image": "app:latest"}],
+        executionRoleArn=stack_role,
+        taskRoleArn="arn:aws:iam::000000000000:role/admin",
+    )
+    with pytest.raises(ValueError):
+        profiles.put_profile(table, profiles.Profile("gpu", "pool-gpu:2"), world.ecs, **allowed)
+    assert profiles.load_profiles(table)["gpu"].task_definition == "pool-gpu"
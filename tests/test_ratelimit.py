@@ -0,0 +1,99 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from fargate_pool import clients, ratelimit
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture(params=["local", "shared"])
+def bucket(request, clock):
+    if request.param == "local":
+        return ratelimit.TokenBucket(rate=2, burst=10, clock=clock)
+    table = request.getfixturevalue("table")
+    return ratelimit.SharedTokenBucket(table, "RunTask", rate=2, burst=10, clock=clock)
+
+
+def test_bucket_starts_full_and_refills_at_its_rate(bucket, clock):
+    assert bucket.try_acquire(15) == 10
+    assert bucket.try_acquire(1) == 0
+    clock.now += 2.5
+    assert bucket.try_acquire(10) == 5
+    clock.now += 100
+    assert bucket.try_acquire(20) == 10
+
+
+def test_drained_bucket_refills_from_empty(bucket, clock):
+    bucket.drain()
+    assert bucket.try_acquire(1) == 0
+    clock.now += 1
+    assert bucket.try_acquire(5) == 2
+
+
+def test_shared_bucket_is_shared(table, clock):
+    first = ratelimit.SharedTokenBucket(table, "RunTask", rate=1, burst=4, clock=clock)
+    second = ratelimit.SharedTokenBucket(table, "RunTask", rate=1, burst=4, clock=clock)
+    other = ratelimit.SharedTokenBucket(table, "DescribeTasks", rate=1, burst=4, clock=clock)
+    assert first.try_acquire(3) == 3
+    assert second.try_acquire(3) == 1
+    assert other.try_acquire(3) == 3
+
+
+def test_shared_bucket_retries_after_a_concurrent_take(table, clock, monkeypatch):
+    bucket = ratelimit.SharedTokenBucket(table, "RunTask", rate=1, burst=4, clock=clock)
+    rival = ratelimit.SharedTokenBucket(table, "RunTask", rate=1, burst=4, clock=clock)
+    bucket.try_acquire(1)
+    get_item = table.get_item
+
+    def read_then_lose_the_race(**params):
+        # The rival takes 2 of the 3 tokens left between our read and our write
+        response = get_item(**params)
+        monkeypatch.setattr(table, "get_item", get_item)
+        clock.now += 0.5
+        rival.try_acquire(2)
+        return response
+
+    monkeypatch.setattr(table, "get_item", read_then_lose_the_race)
+    assert bucket.try_acquire(3) == 1
+
+
+def test_acquire_waits_for_refills(clock):
+    bucket = ratelimit.TokenBucket(rate=10, burst=5, clock=clock)
+
+    def sleep(seconds):
+        clock.now += seconds
+
+    granted, _ = ratelimit.acquire(bucket, 8, max_wait=10, sleep=sleep)
+    assert granted == 8
+    assert clock.now > 1000.0
+
+
+def test_acquire_gives_up_after_max_wait(clock):
+    bucket = ratelimit.TokenBucket(rate=1, burst=2, clock=clock)
+    granted, _ = ratelimit.acquire(bucket, 5, max_wait=0, sleep=lambda seconds: None)
+    assert granted == 2
+
+
+@pytest.mark.parametrize(
+    "code, throttled",
+    [
+        ("ThrottlingException", True),
+        ("ProvisionedThroughputExceededException", True),
+        ("ConditionalCheckFailedException", False),
+    ],
+)
+def test_is_throttling(code, throttled):
+    error = ClientError({"Error": {"Code": code, "Message": ""}}, "RunTask")
+    assert clients.is_throttling(error) is throttled
+    assert not clients.is_throttling(ValueError(code))
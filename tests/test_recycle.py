@@ -0,0 +1,35 @@
+from fargate_pool import keys, recycle
+
+
+def test_spend_credits_never_exceeds_the_balance(table):
+    recycle.add_credits(table, 3)
+    assert recycle.spend_credits(table, 2) == 2
+    assert recycle.spend_credits(table, 2) == 1
+    assert recycle.spend_credits(table, 2) == 0
+    assert recycle.read_credits(table) == 0
+
+
+def test_spend_credits_retries_after_a_concurrent_spend(table, monkeypatch):
+    recycle.add_credits(table, 3)
+    read_credits = recycle.read_credits
+
+    def stale_then_fresh(table, profile=keys.DEFAULT_PROFILE):
+        # Another batch spends 2 credits between our read and our write
+        balance = read_credits(table, profile)
+        if balance == 3:
+            table.update_item(
+                Key=recycle.credits_key(profile),
+                UpdateExpression="ADD Credits :delta",
+                ExpressionAttributeValues={":delta": -2},
+            )
+        return balance
+
+    monkeypatch.setattr(recycle, "read_credits", stale_then_fresh)
+    assert recycle.spend_credits(table, 3) == 1
+    assert read_credits(table) == 0
+
+
+def test_credits_are_kept_per_profile(table):
+    recycle.add_credits(table, 2, "large")
+    assert recycle.spend_credits(table, 1) == 0
+    assert recycle.spend_credits(table, 5, "large") == 2